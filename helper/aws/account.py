@@ -0,0 +1,168 @@
+"""This module provides cached AssumeRole sessions so one process can work across many accounts"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import boto3
+import botocore.session
+from botocore.credentials import RefreshableCredentials
+import aws.client
+
+class AccountSessions:
+    """Assume a role in each account once and share the session, refreshing credentials before they expire"""
+
+    def __init__(self, RoleName=None, SessionName='ta-tagging', Duration=3600, MaxRefreshes=4, Partition='aws', \
+                 ExternalId=None):
+        """Constructor, Duration is in seconds and MaxRefreshes caps concurrent assume_role() calls"""
+
+        self.RoleName = RoleName
+        self.SessionName = SessionName
+        self.Duration = Duration
+        self.Partition = Partition
+        self.ExternalId = ExternalId
+        self.Lock = threading.Lock()
+        self.Refreshes = threading.BoundedSemaphore(MaxRefreshes)
+        self.Sessions = {}
+        self.Pending = {}
+        self.AssumeCalls = 0
+
+    def Configure(self, RoleName=None, SessionName=None, Duration=None, MaxRefreshes=None, Partition=None, \
+                  ExternalId=None):
+        """Change role and session settings used for accounts assumed from now on"""
+
+        with self.Lock:
+            if RoleName != None:
+                self.RoleName = RoleName
+            if SessionName != None:
+                self.SessionName = SessionName
+            if Duration != None:
+                self.Duration = Duration
+            if MaxRefreshes != None:
+                self.Refreshes = threading.BoundedSemaphore(MaxRefreshes)
+            if Partition != None:
+                self.Partition = Partition
+            if ExternalId != None:
+                self.ExternalId = ExternalId
+
+    def GetRoleArn(self, Account, RoleName=None):
+        """Return arn of the role to assume in account"""
+
+        RoleName = RoleName if RoleName != None else self.RoleName
+        if RoleName == None:
+            raise ValueError('No role name configured to assume in account ' + str(Account))
+
+        return 'arn:' + self.Partition + ':iam::' + str(Account) + ':role/' + RoleName
+
+    def AssumeRole(self, RoleArn):
+        """Call sts assume_role() and return credentials in the form RefreshableCredentials expects"""
+
+        Params = {'RoleArn': RoleArn, 'RoleSessionName': self.SessionName, 'DurationSeconds': self.Duration}
+        if self.ExternalId != None:
+            Params['ExternalId'] = self.ExternalId
+
+        ### limit concurrent refreshes so many accounts expiring together do not throttle sts
+        with self.Refreshes:
+            response = aws.client.GetClient('sts').assume_role(**Params)
+
+        with self.Lock:
+            self.AssumeCalls += 1
+
+        Credentials = response['Credentials']
+        return {
+            'access_key': Credentials['AccessKeyId'],
+            'secret_key': Credentials['SecretAccessKey'],
+            'token': Credentials['SessionToken'],
+            'expiry_time': Credentials['Expiration'].isoformat()
+        }
+
+    def GetSession(self, Account, RoleName=None):
+        """Return (Session, SessionKey) for account, assuming the role on first use
+
+        The credentials refresh themselves shortly before they expire. SessionKey is the
+        role arn and identifies the session in the client pool."""
+
+        RoleArn = self.GetRoleArn(Account, RoleName)
+
+        with self.Lock:
+            if RoleArn in self.Sessions:
+                return self.Sessions[RoleArn], RoleArn
+            Pending = self.Pending.setdefault(RoleArn, threading.Lock())
+
+        ### one thread assumes the role of an account while other accounts proceed
+        with Pending:
+            with self.Lock:
+                if RoleArn in self.Sessions:
+                    return self.Sessions[RoleArn], RoleArn
+
+            Credentials = RefreshableCredentials.create_from_metadata(
+                metadata = self.AssumeRole(RoleArn),
+                refresh_using = lambda: self.AssumeRole(RoleArn),
+                method = 'sts-assume-role'
+            )
+
+            with self.Lock:
+                BotoSession = botocore.session.get_session()
+                BotoSession._credentials = Credentials
+                self.Sessions[RoleArn] = boto3.session.Session(botocore_session=BotoSession)
+                self.Pending.pop(RoleArn, None)
+                return self.Sessions[RoleArn], RoleArn
+
+    def GetStats(self):
+        """Return session statistics as dictionary"""
+
+        with self.Lock:
+            return {'Sessions': len(self.Sessions), 'AssumeRoleCalls': self.AssumeCalls}
+
+
+### process-wide sessions shared by every AwsTag instance
+Sessions = AccountSessions()
+
+### account id of the ambient credentials, read once by GetAccountId
+CallerAccount = None
+
+def ConfigureAccounts(RoleName=None, SessionName=None, Duration=None, MaxRefreshes=None, Partition=None, ExternalId=None):
+    """Set the role assumed in each account and how its sessions are created"""
+
+    Sessions.Configure(RoleName, SessionName, Duration, MaxRefreshes, Partition, ExternalId)
+
+
+def GetAccountSession(Account):
+    """Return (Session, SessionKey) for account, or (None, None) to use the ambient credentials"""
+
+    if Account == None:
+        return None, None
+
+    return Sessions.GetSession(Account)
+
+
+def GetAccountId(Account=None):
+    """Return account id, the account of the ambient credentials if Account is None"""
+
+    global CallerAccount
+    if Account != None:
+        return Account
+    if CallerAccount == None:
+        CallerAccount = aws.client.GetClient('sts').get_caller_identity()['Account']
+    return CallerAccount
+
+
+def RunForAccounts(Accounts, Function, *Args, MaxAccounts=8, **Kwargs):
+    """Run Function(Account, *Args, **Kwargs) for each account, at most MaxAccounts at once
+
+    Yield (Account, Result, Error) as accounts finish, Error is None on success"""
+
+    Executor = ThreadPoolExecutor(max_workers=max(1, min(MaxAccounts, len(Accounts))))
+    try:
+        Futures = {Executor.submit(Function, Account, *Args, **Kwargs): Account for Account in Accounts}
+        for Future in as_completed(Futures):
+            try:
+                yield Futures[Future], Future.result(), None
+            except Exception as e:
+                yield Futures[Future], None, e
+    finally:
+        Executor.shutdown(wait=True)
+
+
+def GetAccountStats():
+    """Return account session statistics, i.e. {'Sessions': 60, 'AssumeRoleCalls': 60}"""
+
+    return Sessions.GetStats()
@@ -0,0 +1,90 @@
+"""This module provides a cached parser that turns arns and resource ids into immutable resource references"""
+
+import functools
+
+### ec2 resource type of each id prefix, i.e. vol-0123 is a volume
+Ec2Prefixes = {
+                'i-': 'instance', 'vol-': 'volume', 'snap-': 'snapshot', 'sg-': 'security-group', 'subnet-': 'subnet',
+                'vpc-': 'vpc', 'pcx-': 'vpc-peering-connection', 'vpn-': 'vpn-connection', 'vgw-': 'vpn-gateway',
+                'cgw-': 'customer-gateway', 'nat-': 'natgateway', 'h-': 'dedicated-host', 'dopt-': 'dhcp-options',
+                'eigw-': 'egress-only-internet-gateway', 'egpu-': 'elastic-gpu', 'ami-': 'image',
+                'iip-': 'instance-profile', 'igw-': 'internet-gateway', 'key-': 'key-pair', 'lt-': 'launch-template',
+                'acl-': 'network-acl', 'eni-': 'network-interface', 'pg-': 'placement-group', 'rtb-': 'route-table',
+                'sir-': 'spot-instances-request'
+            }
+
+class ResourceRef:
+    """Immutable parts of an arn or resource id
+
+    For an arn Partition, Service, Region and Account come from the arn and the
+    resource part is split into Type and Id on the first '/' or ':'. For a plain
+    resource id they are None, Id is the whole id and Type is the ec2 resource
+    type of its prefix or None. ResourceId is the original string."""
+
+    __slots__ = ('Partition', 'Service', 'Region', 'Account', 'Type', 'Id', 'ResourceId')
+
+    def __init__(self, Partition, Service, Region, Account, Type, Id, ResourceId):
+        """Constructor"""
+
+        for Name, Value in zip(ResourceRef.__slots__, (Partition, Service, Region, Account, Type, Id, ResourceId)):
+            object.__setattr__(self, Name, Value)
+
+    def __setattr__(self, Name, Value):
+        raise AttributeError('ResourceRef is immutable')
+
+    def __eq__(self, Other):
+        return isinstance(Other, ResourceRef) and self.ResourceId == Other.ResourceId
+
+    def __hash__(self):
+        return hash(self.ResourceId)
+
+    def __str__(self):
+        return self.ResourceId
+
+    def __repr__(self):
+        return 'ResourceRef(' + repr(self.ResourceId) + ')'
+
+    def IsArn(self):
+        """Return True if parsed from an arn otherwise False"""
+
+        return self.Partition != None
+
+
+@functools.lru_cache(maxsize=65536)
+def ParseResourceId(ResourceId):
+    """Parse an arn or resource id string, results are memoized"""
+
+    if ResourceId.startswith('arn:'):
+        Parts = ResourceId.split(':', 5)
+        if len(Parts) == 6:
+            Partition, Service, Region, Account, Resource = Parts[1:]
+
+            ### resource part is 'id', 'type/id' or 'type:id', apigateway starts with '/restapis/...'
+            Resource = Resource.lstrip('/')
+            Slash = Resource.find('/')
+            Colon = Resource.find(':')
+            Positions = [P for P in (Slash, Colon) if P != -1]
+            if len(Positions) > 0:
+                Type, Id = Resource[:min(Positions)], Resource[min(Positions) + 1:]
+            else:
+                Type, Id = None, Resource
+            return ResourceRef(Partition, Service, Region or None, Account or None, Type, Id, ResourceId)
+
+    Prefix = ResourceId.split('-', 1)[0] + '-'
+    return ResourceRef(None, None, None, None, Ec2Prefixes.get(Prefix), ResourceId, ResourceId)
+
+
+def Parse(ResourceId):
+    """Return ResourceRef of an arn or resource id, a ResourceRef is returned unchanged"""
+
+    if isinstance(ResourceId, ResourceRef):
+        return ResourceId
+
+    return ParseResourceId(ResourceId)
+
+
+def GetParseStats():
+    """Return parser cache statistics, i.e. {'Hits': 10, 'Misses': 5, 'Entries': 5}"""
+
+    Info = ParseResourceId.cache_info()
+    return {'Hits': Info.hits, 'Misses': Info.misses, 'Entries': Info.currsize}
@@ -0,0 +1,90 @@
+"""This module provides a bounded, thread-safe LRU cache of resource tags with expiry"""
+
+import threading
+import time
+from collections import OrderedDict
+
+class TagCache:
+    """Cache tag dictionaries keyed by resource, evicting least recently used and expired entries"""
+
+    def __init__(self, MaxSize=100000, Ttl=900):
+        """Constructor, Ttl is in seconds"""
+
+        self.MaxSize = MaxSize
+        self.Ttl = Ttl
+        self.Lock = threading.Lock()
+        self.Entries = OrderedDict() # Key: (ExpiresAt, Tags)
+        self.Hits = 0
+        self.Misses = 0
+
+    def Get(self, Key):
+        """Return copy of cached tags or None if missing or expired"""
+
+        with self.Lock:
+            Entry = self.Entries.get(Key)
+            if Entry == None or Entry[0] < time.monotonic():
+                if Entry != None:
+                    del self.Entries[Key]
+                self.Misses += 1
+                return None
+            self.Entries.move_to_end(Key)
+            self.Hits += 1
+            return dict(Entry[1])
+
+    def Put(self, Key, Tags):
+        """Store the complete tag set of a resource"""
+
+        with self.Lock:
+            self.Entries[Key] = (time.monotonic() + self.Ttl, dict(Tags))
+            self.Entries.move_to_end(Key)
+            while len(self.Entries) > self.MaxSize:
+                self.Entries.popitem(last=False)
+
+    def Update(self, Key, Tags):
+        """Merge written tags into a cached entry so a write does not leave a stale read behind"""
+
+        with self.Lock:
+            Entry = self.Entries.get(Key)
+            if Entry != None:
+                Entry[1].update(Tags)
+
+    def Invalidate(self, Key=None):
+        """Drop one entry, or every entry if Key is None"""
+
+        with self.Lock:
+            if Key == None:
+                self.Entries.clear()
+            else:
+                self.Entries.pop(Key, None)
+
+    def Configure(self, MaxSize=None, Ttl=None):
+        """Change cache size and time to live"""
+
+        with self.Lock:
+            if MaxSize != None:
+                self.MaxSize = MaxSize
+            if Ttl != None:
+                self.Ttl = Ttl
+            while len(self.Entries) > self.MaxSize:
+                self.Entries.popitem(last=False)
+
+    def GetStats(self):
+        """Return cache statistics as dictionary"""
+
+        with self.Lock:
+            return {'Hits': self.Hits, 'Misses': self.Misses, 'Entries': len(self.Entries)}
+
+
+### per-run cache shared by every AwsTag instance
+Tags = TagCache()
+
+def ConfigureTagCache(MaxSize=None, Ttl=None):
+    """Set maximum entries and time to live in seconds of the tag cache"""
+
+    Tags.Configure(MaxSize, Ttl)
+
+
+def GetTagCacheStats():
+    """Return tag cache statistics, i.e. {'Hits': 10, 'Misses': 5, 'Entries': 5}"""
+
+    return Tags.GetStats()
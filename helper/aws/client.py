@@ -0,0 +1,135 @@
+"""This module provides a process-wide, thread-safe pool of boto3 clients"""
+
+import threading
+import boto3
+from botocore.config import Config
+import aws.metrics
+import aws.throttle
+
+class ClientPool:
+    """Share boto3 clients keyed by service, region, session and config"""
+
+    def __init__(self, MaxPoolConnections=50, TcpKeepalive=True, MaxAttempts=10):
+        """Constructor, MaxAttempts includes the first call and retries use exponential backoff with jitter"""
+
+        self.MaxPoolConnections = MaxPoolConnections
+        self.TcpKeepalive = TcpKeepalive
+        self.MaxAttempts = MaxAttempts
+        self.Lock = threading.Lock()
+        self.Session = None
+        self.Clients = {}
+        self.Hits = 0
+        self.Creations = 0
+
+    def Configure(self, MaxPoolConnections=None, TcpKeepalive=None, MaxAttempts=None):
+        """Change connection and retry settings used for clients created from now on"""
+
+        with self.Lock:
+            if MaxPoolConnections != None:
+                self.MaxPoolConnections = MaxPoolConnections
+            if TcpKeepalive != None:
+                self.TcpKeepalive = TcpKeepalive
+            if MaxAttempts != None:
+                self.MaxAttempts = MaxAttempts
+
+    def GetClient(self, Service, Region=None, Session=None, SessionKey=None, **ConfigOptions):
+        """Return a cached client, creating it on first use
+
+        Session is a boto3 session for another account or role, and SessionKey is a
+        string that identifies it, i.e. the role arn. ConfigOptions are passed to
+        botocore Config and become part of the cache key."""
+
+        if Session != None and SessionKey == None:
+            SessionKey = str(id(Session))
+
+        with self.Lock:
+            Options = dict(max_pool_connections=self.MaxPoolConnections, tcp_keepalive=self.TcpKeepalive, \
+                           retries={'mode': 'standard', 'max_attempts': self.MaxAttempts})
+            Options.update(ConfigOptions)
+            Key = (Service, Region, SessionKey, repr(sorted(Options.items())))
+
+            Client = self.Clients.get(Key)
+            if Client != None:
+                self.Hits += 1
+                return Client
+
+            ### boto3 sessions are not thread safe, so clients are only created under the lock
+            if Session == None:
+                if self.Session == None:
+                    self.Session = boto3.session.Session()
+                Session = self.Session
+
+            Client = Session.client(Service, region_name=Region, config=Config(**Options))
+            aws.throttle.Limiter.Attach(Client, Service, SessionKey)
+            aws.metrics.Recorder.Attach(Client, Service)
+            self.Clients[Key] = Client
+            self.Creations += 1
+
+        return Client
+
+    def GetStats(self):
+        """Return pool statistics as dictionary"""
+
+        with self.Lock:
+            return {'Hits': self.Hits, 'Creations': self.Creations, 'Clients': len(self.Clients)}
+
+    def Clear(self):
+        """Drop all cached clients and reset statistics"""
+
+        with self.Lock:
+            self.Clients = {}
+            self.Session = None
+            self.Hits = 0
+            self.Creations = 0
+
+
+### process-wide pool shared by every AwsTag instance and worker thread
+Pool = ClientPool()
+
+def GetClient(Service, Region=None, Session=None, SessionKey=None, **ConfigOptions):
+    """Return a pooled boto3 client for service"""
+
+    return Pool.GetClient(Service, Region, Session, SessionKey, **ConfigOptions)
+
+
+### (response, request) names of the page token of operations without a botocore paginator
+PageTokens = [('NextToken', 'NextToken'), ('nextToken', 'nextToken'), ('NextMarker', 'Marker'), ('Marker', 'Marker')]
+
+def Paginate(Client, Operation, **Params):
+    """Yield every response page of operation, using a botocore paginator when one exists
+
+    Without a paginator the page token is followed by hand, i.e. NextToken or Marker, for the
+    token names the operation accepts."""
+
+    if Client.can_paginate(Operation):
+        yield from Client.get_paginator(Operation).paginate(**Params)
+        return
+
+    Model = Client.meta.service_model.operation_model(Client.meta.method_to_api_mapping[Operation])
+    Members = Model.input_shape.members if Model.input_shape != None else {}
+    Tokens = [(Output, Input) for Output, Input in PageTokens if Input in Members]
+    Params = dict(Params)
+    while True:
+        Page = getattr(Client, Operation)(**Params)
+        yield Page
+        Token = None
+        for Output, Input in Tokens:
+            if Page.get(Output):
+                Token = (Input, Page[Output])
+                break
+        ### some operations echo the marker they were called with on the last page
+        if Token == None or Params.get(Token[0]) == Token[1]:
+            return
+        Params[Token[0]] = Token[1]
+
+
+def ConfigureClientPool(MaxPoolConnections=None, TcpKeepalive=None, MaxAttempts=None):
+    """Set max_pool_connections, tcp keep-alive and retry attempts for pooled clients"""
+
+    Pool.Configure(MaxPoolConnections, TcpKeepalive, MaxAttempts)
+
+
+def GetClientStats():
+    """Return client pool statistics, i.e. {'Hits': 10, 'Creations': 2, 'Clients': 2}"""
+
+    return Pool.GetStats()
@@ -0,0 +1,161 @@
+"""This module provides a bulk tag inventory built on the resource groups tagging api get_resources()"""
+
+import aws.client
+import aws.cache
+import aws.registry
+import aws.arn
+import aws.account
+import aws.store
+from aws.tag import AwsTag, IterResources
+
+class TagInventory:
+    """Read resources and their full tag sets 100 at a time, falling back to per-service calls"""
+
+    def __init__(self, Region=None, Account=None):
+        """Constructor, Account is the account id to read, None uses the ambient credentials"""
+
+        self.Region = Region
+        self.Account = Account
+
+    def IsSupported(self, Service):
+        """Return True if service is covered by the resource groups tagging api otherwise False"""
+
+        Descriptor = aws.registry.GetDescriptor(Service)
+        return Descriptor != None and Descriptor.ResourceTypes != None
+
+    def GetResourceId(self, Service, Arn):
+        """Return resource id of an arn in the form the per-service methods use"""
+
+        Descriptor = aws.registry.GetDescriptor(Service)
+        if Descriptor == None or Descriptor.ArnToId == None:
+            return Arn
+        return Descriptor.ArnToId(aws.arn.Parse(Arn))
+
+    def IterTaggedResources(self, Service, Ec2Types=None, TagFilters=None):
+        """Yield (ResourceId, Tags, Type) for resources of service that have or had tags, 100 per call
+
+        Type is the resource type of the arn, i.e. 'key-pair'. TagFilters are resource groups tagging
+        api tag filters, i.e. [{'Key': 'Channel'}]"""
+
+        if Service == 'ec2' and Ec2Types != None:
+            ResourceTypes = ['ec2:' + Type for Type in Ec2Types]
+        else:
+            ResourceTypes = aws.registry.Services[Service].ResourceTypes
+
+        Params = {'ResourceTypeFilters': ResourceTypes, 'ResourcesPerPage': 100}
+        if TagFilters != None:
+            Params['TagFilters'] = TagFilters
+
+        ### global services are only returned by their home region
+        Region = aws.registry.Services[Service].HomeRegion or self.Region
+        Session, SessionKey = aws.account.GetAccountSession(self.Account)
+        Client = aws.client.GetClient('resourcegroupstaggingapi', Region, Session, SessionKey)
+        for Page in aws.client.Paginate(Client, 'get_resources', **Params):
+            for Mapping in Page['ResourceTagMappingList']:
+                Ref = aws.arn.Parse(Mapping['ResourceARN'])
+                ResourceId = self.GetResourceId(Service, Mapping['ResourceARN'])
+                Tags = {Tag['Key']: Tag.get('Value', '') for Tag in Mapping.get('Tags', [])}
+
+                ### fill the tag cache so later IsTagExists/GetTagValues calls do not read again
+                Tag = AwsTag(Service, ResourceId, Region, self.Account)
+                aws.cache.Tags.Put(Tag.GetCacheKey(ResourceId), Tags)
+
+                yield ResourceId, Tags, Ref.Type
+
+    def PrefetchTags(self, Service, ResourceIds):
+        """Read tags of arns the resource groups tagging api covers, 100 per call, into the tag cache
+
+        The api only returns resources that have or had tags, and may spell an arn differently, so
+        only returned resources are cached and the rest are read one at a time when needed.
+        Return number of resources cached."""
+
+        Groups = {}
+        for ResourceId in ResourceIds:
+            Ref = aws.arn.Parse(ResourceId)
+            Tag = AwsTag(Service, Ref, self.Region, self.Account)
+            if Tag.IsTaggingApiResource(Ref):
+                Groups.setdefault((Tag.GetServiceName(), Tag.GetRegion()), (Tag, {}))[1][Ref.ResourceId] = Ref
+
+        Cached = 0
+        Session, SessionKey = aws.account.GetAccountSession(self.Account)
+        for (Name, Region), (Tag, Refs) in Groups.items():
+            Client = aws.client.GetClient('resourcegroupstaggingapi', Region, Session, SessionKey)
+            Arns = list(Refs)
+            for i in range(0, len(Arns), 100):
+                for Page in aws.client.Paginate(Client, 'get_resources', ResourceARNList=Arns[i:i + 100]):
+                    for Mapping in Page['ResourceTagMappingList']:
+                        Ref = Refs.get(Mapping['ResourceARN'])
+                        if Ref == None:
+                            continue
+                        Tags = {T['Key']: T.get('Value', '') for T in Mapping.get('Tags', [])}
+                        aws.cache.Tags.Put(Tag.GetCacheKey(Ref), Tags)
+                        aws.store.PutTags(Tag.GetCacheKey(Ref), Tags)
+                        Cached += 1
+
+        return Cached
+
+    def IterResourceTags(self, Service, Ec2Types=None, IncludeUntagged=True):
+        """Yield (ResourceId, Tags, Error) for every resource of service
+
+        Covered services read tags in bulk. The api only returns resources that have or had
+        tags, so with IncludeUntagged the per-service discovery lists the rest, which have no
+        tags. Other services fall back to discovery plus one tag read per resource."""
+
+        for ResourceId, Tags, Error, Type in self.IterTypedResourceTags(Service, Ec2Types, IncludeUntagged):
+            yield ResourceId, Tags, Error
+
+    def IterTypedResourceTags(self, Service, Ec2Types=None, IncludeUntagged=True):
+        """Yield (ResourceId, Tags, Error, Type) for every resource of service, like IterResourceTags()
+
+        Type is the ec2 resource type the resource was found as, i.e. 'key-pair', None for other services."""
+
+        if not self.IsSupported(Service):
+            for ResourceId in IterResources(Service, Ec2Types, Region=self.Region, Account=self.Account):
+                try:
+                    Tag = AwsTag(Service, ResourceId, self.Region, self.Account)
+                    yield ResourceId, Tag.GetAllTags(ResourceId), None, None
+                except Exception as e:
+                    yield ResourceId, None, e, None
+            return
+
+        Seen = set()
+        for ResourceId, Tags, Type in self.IterTaggedResources(Service, Ec2Types):
+            Seen.add(ResourceId)
+            yield ResourceId, Tags, None, Type if Service == 'ec2' else None
+
+        if IncludeUntagged:
+            if Service == 'ec2':
+                Resources = AwsTag(Service, Region=self.Region, Account=self.Account).IterEc2TypedResources(Ec2Types)
+            else:
+                Resources = ((None, ResourceId) for ResourceId in IterResources(Service, Region=self.Region, \
+                                                                               Account=self.Account))
+            for Type, ResourceId in Resources:
+                if ResourceId not in Seen:
+                    Seen.add(ResourceId)
+                    Tag = AwsTag(Service, ResourceId, self.Region, self.Account)
+                    aws.cache.Tags.Put(Tag.GetCacheKey(ResourceId), {})
+                    yield ResourceId, {}, None, Type
+
+
+def IterResourceTags(Service, Ec2Types=None, IncludeUntagged=True, Region=None, Account=None):
+    """Yield (ResourceId, Tags, Error) for every resource of service using bulk reads where possible"""
+
+    yield from TagInventory(Region, Account).IterResourceTags(Service, Ec2Types, IncludeUntagged)
+
+
+def IterTypedResourceTags(Service, Ec2Types=None, IncludeUntagged=True, Region=None, Account=None):
+    """Yield (ResourceId, Tags, Error, Type) for every resource of service, Type is the ec2 resource type or None"""
+
+    yield from TagInventory(Region, Account).IterTypedResourceTags(Service, Ec2Types, IncludeUntagged)
+
+
+def PrefetchTags(Service, ResourceIds, Account=None):
+    """Read tags of many resources of one account into the tag cache with bulk calls where possible"""
+
+    return TagInventory(Account=Account).PrefetchTags(Service, ResourceIds)
+
+
+def IsInventorySupported(Service):
+    """Return True if service tags can be read in bulk otherwise False"""
+
+    return TagInventory().IsSupported(Service)
@@ -0,0 +1,234 @@
+"""This module records call counts, latency, payload sizes and error codes of every AWS call made through pooled clients"""
+
+import json
+import os
+import threading
+import time
+from botocore.exceptions import ClientError
+
+### upper bounds in seconds of the latency histogram buckets, the last bucket has no bound
+LatencyBuckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+def GetErrorCode(Error):
+    """Return the aws error code of an exception, i.e. NoSuchTagSet, or None if it did not come from aws
+
+    Exceptions that wrap a ClientError, i.e. Exception(ClientError), return the code of the ClientError."""
+
+    if isinstance(Error, ClientError):
+        return Error.response.get('Error', {}).get('Code')
+    if isinstance(Error, ErrorMessage):
+        return Error.Code
+    if isinstance(Error, Exception) and len(Error.args) > 0 and isinstance(Error.args[0], ClientError):
+        return GetErrorCode(Error.args[0])
+
+    return None
+
+
+class ErrorMessage(str):
+    """Text of an exception that also carries its aws error code as Code, None if it did not come from aws"""
+
+    def __new__(cls, Error, Code=None):
+        Message = super().__new__(cls, str(Error))
+        Message.Code = Code if Code != None else GetErrorCode(Error)
+        return Message
+
+
+class OperationMetrics:
+    """Counters, latency histogram and payload sizes of one operation of a service in a region"""
+
+    def __init__(self):
+        """Constructor"""
+
+        self.Calls = 0
+        self.Retries = 0
+        self.Errors = {}
+        self.Seconds = 0.0
+        self.MaxSeconds = 0.0
+        self.Buckets = [0] * (len(LatencyBuckets) + 1)
+        self.RequestBytes = 0
+        self.ResponseBytes = 0
+
+    def Add(self, Seconds, ErrorCode, RequestBytes, ResponseBytes, Retries):
+        """Add one call, the caller holds the lock"""
+
+        self.Calls += 1
+        self.Retries += Retries
+        self.Seconds += Seconds
+        self.MaxSeconds = max(self.MaxSeconds, Seconds)
+        Bucket = 0
+        while Bucket < len(LatencyBuckets) and Seconds > LatencyBuckets[Bucket]:
+            Bucket += 1
+        self.Buckets[Bucket] += 1
+        self.RequestBytes += RequestBytes
+        self.ResponseBytes += ResponseBytes
+        if ErrorCode != None:
+            self.Errors[ErrorCode] = self.Errors.get(ErrorCode, 0) + 1
+
+    def GetQuantile(self, Quantile):
+        """Return the upper bound of the bucket that holds Quantile of the calls, at most MaxSeconds"""
+
+        Count = 0
+        for Bucket, Calls in enumerate(self.Buckets):
+            Count += Calls
+            if Count >= Quantile * self.Calls:
+                return min(LatencyBuckets[Bucket], self.MaxSeconds) if Bucket < len(LatencyBuckets) else self.MaxSeconds
+
+        return 0.0
+
+    def GetStats(self):
+        """Return metrics as dictionary"""
+
+        return {'Calls': self.Calls, 'Retries': self.Retries, 'Errors': dict(self.Errors), 'Seconds': round(self.Seconds, 6), \
+                'MeanSeconds': round(self.Seconds / self.Calls, 6) if self.Calls > 0 else 0.0, \
+                'P95Seconds': round(self.GetQuantile(0.95), 6), 'MaxSeconds': round(self.MaxSeconds, 6), \
+                'Buckets': dict(zip([str(Bound) for Bound in LatencyBuckets] + ['+Inf'], self.Buckets)), \
+                'RequestBytes': self.RequestBytes, 'ResponseBytes': self.ResponseBytes}
+
+
+class CallMetrics:
+    """Keep OperationMetrics per service, operation and region, filled by botocore event handlers"""
+
+    def __init__(self):
+        """Constructor"""
+
+        self.Lock = threading.Lock()
+        self.Operations = {}
+
+    def Record(self, Service, Operation, Region, Seconds, ErrorCode=None, RequestBytes=0, ResponseBytes=0, Retries=0):
+        """Record one call, Seconds includes retries and ErrorCode is None for a successful call"""
+
+        with self.Lock:
+            Key = (Service, Operation, Region)
+            if Key not in self.Operations:
+                self.Operations[Key] = OperationMetrics()
+            self.Operations[Key].Add(Seconds, ErrorCode, RequestBytes, ResponseBytes, Retries)
+
+    def Attach(self, Client, Service):
+        """Register event handlers that time every call of a client, including its retries"""
+
+        Region = Client.meta.region_name
+
+        def BeforeCall(model=None, context=None, **kwargs):
+            context['metrics_start'] = time.perf_counter()
+            context['metrics_operation'] = model.name
+            context['metrics_request_bytes'] = 0
+
+        def RequestCreated(request=None, **kwargs):
+            Body = getattr(request, 'body', None)
+            if isinstance(Body, (bytes, str)) and 'metrics_start' in request.context:
+                request.context['metrics_request_bytes'] = len(Body)
+
+        def AfterCall(http_response=None, parsed=None, model=None, context=None, **kwargs):
+            if 'metrics_start' not in context:
+                return
+            Content = getattr(http_response, 'content', None)
+            parsed = parsed or {}
+            self.Record(Service, model.name, Region, time.perf_counter() - context.pop('metrics_start'), \
+                        parsed.get('Error', {}).get('Code'), context.get('metrics_request_bytes', 0), \
+                        len(Content) if isinstance(Content, bytes) else 0, \
+                        parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0))
+
+        ### after-call-error has no operation model, so the operation is taken from before-call
+        def AfterCallError(exception=None, context=None, **kwargs):
+            if 'metrics_start' not in context:
+                return
+            self.Record(Service, context['metrics_operation'], Region, time.perf_counter() - context.pop('metrics_start'), \
+                        type(exception).__name__, context.get('metrics_request_bytes', 0))
+
+        Client.meta.events.register('before-call', BeforeCall)
+        Client.meta.events.register('request-created', RequestCreated)
+        Client.meta.events.register('after-call', AfterCall)
+        Client.meta.events.register('after-call-error', AfterCallError)
+
+    def GetStats(self):
+        """Return {'service:operation:region': metrics} and totals of calls, errors and seconds"""
+
+        with self.Lock:
+            Operations = {Service + ':' + Operation + ':' + str(Region): Metrics.GetStats() \
+                          for (Service, Operation, Region), Metrics in sorted(self.Operations.items(), \
+                                                                              key=lambda Item: str(Item[0]))}
+
+        return {'Calls': sum([Stats['Calls'] for Stats in Operations.values()]), \
+                'Errors': sum([sum(Stats['Errors'].values()) for Stats in Operations.values()]), \
+                'Seconds': round(sum([Stats['Seconds'] for Stats in Operations.values()]), 6), \
+                'Operations': Operations}
+
+    def GetSlowest(self, Count=5):
+        """Return the Count operations with the most time spent as list of (Name, Stats)"""
+
+        Operations = self.GetStats()['Operations']
+        return sorted(Operations.items(), key=lambda Item: Item[1]['Seconds'], reverse=True)[:Count]
+
+    def WriteJson(self, Filename):
+        """Write GetStats() as json"""
+
+        with open(Filename, 'w', encoding='utf-8') as Stream:
+            json.dump(self.GetStats(), Stream, indent=2)
+
+    def WritePrometheus(self, Filename, Prefix='ta_aws'):
+        """Write metrics in the prometheus text format, i.e. for the node exporter textfile collector
+
+        The file is written next to Filename and renamed, so a collector never reads a partial file."""
+
+        with self.Lock:
+            Operations = {Key: Metrics.GetStats() for Key, Metrics in self.Operations.items()}
+
+        Lines = ['# HELP ' + Prefix + '_calls_total AWS calls by service, operation and region.', \
+                 '# TYPE ' + Prefix + '_calls_total counter']
+        Retries = ['# HELP ' + Prefix + '_retries_total AWS call retries, i.e. after throttling.', \
+                   '# TYPE ' + Prefix + '_retries_total counter']
+        Errors = ['# HELP ' + Prefix + '_errors_total AWS call errors by error code.', \
+                  '# TYPE ' + Prefix + '_errors_total counter']
+        Latency = ['# HELP ' + Prefix + '_call_seconds AWS call latency including retries.', \
+                   '# TYPE ' + Prefix + '_call_seconds histogram']
+        Payload = ['# HELP ' + Prefix + '_payload_bytes_total AWS request and response body bytes.', \
+                   '# TYPE ' + Prefix + '_payload_bytes_total counter']
+        for (Service, Operation, Region), Stats in sorted(Operations.items(), key=lambda Item: str(Item[0])):
+            Labels = 'service="' + Service + '",operation="' + Operation + '",region="' + str(Region) + '"'
+            Lines.append(Prefix + '_calls_total{' + Labels + '} ' + str(Stats['Calls']))
+            Retries.append(Prefix + '_retries_total{' + Labels + '} ' + str(Stats['Retries']))
+            for Code, Count in sorted(Stats['Errors'].items()):
+                Errors.append(Prefix + '_errors_total{' + Labels + ',code="' + Code + '"} ' + str(Count))
+            Cumulative = 0
+            for Bound, Count in Stats['Buckets'].items():
+                Cumulative += Count
+                Latency.append(Prefix + '_call_seconds_bucket{' + Labels + ',le="' + Bound + '"} ' + str(Cumulative))
+            Latency.append(Prefix + '_call_seconds_sum{' + Labels + '} ' + str(Stats['Seconds']))
+            Latency.append(Prefix + '_call_seconds_count{' + Labels + '} ' + str(Stats['Calls']))
+            Payload.append(Prefix + '_payload_bytes_total{' + Labels + ',direction="request"} ' + str(Stats['RequestBytes']))
+            Payload.append(Prefix + '_payload_bytes_total{' + Labels + ',direction="response"} ' + str(Stats['ResponseBytes']))
+
+        Temporary = Filename + '.tmp'
+        with open(Temporary, 'w', encoding='utf-8') as Stream:
+            Stream.write('\n'.join(Lines + Retries + Errors + Latency + Payload) + '\n')
+        os.replace(Temporary, Filename)
+
+    def Clear(self):
+        """Drop all metrics"""
+
+        with self.Lock:
+            self.Operations = {}
+
+
+### process-wide metrics shared by all pooled clients
+Recorder = CallMetrics()
+
+def GetCallMetrics():
+    """Return call metrics, i.e. {'Calls': 100, 'Errors': 2, 'Seconds': 12.5, 'Operations': {...}}"""
+
+    return Recorder.GetStats()
+
+
+def GetSlowestOperations(Count=5):
+    """Return the Count operations with the most time spent as list of (Name, Stats)"""
+
+    return Recorder.GetSlowest(Count)
+
+
+def WriteCallMetrics(JsonFilename=None, PrometheusFilename=None):
+    """Write call metrics as json and or in the prometheus text format"""
+
+    if JsonFilename != None:
+        Recorder.WriteJson(JsonFilename)
+    if PrometheusFilename != None:
+        Recorder.WritePrometheus(PrometheusFilename)
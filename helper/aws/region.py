@@ -0,0 +1,101 @@
+"""This module provides the region of a resource so calls can be sent to a client in that region"""
+
+import threading
+from botocore.exceptions import ClientError
+import aws.client
+import aws.arn
+import aws.account
+
+class RegionMap:
+    """Find the region of each resource, caching s3 bucket regions read with get_bucket_location()"""
+
+    def __init__(self):
+        """Constructor"""
+
+        self.Lock = threading.Lock()
+        self.Buckets = {}
+        self.Lookups = 0
+
+    def GetBucketRegion(self, Bucket, Account=None):
+        """Return region of an s3 bucket or None if aws refuses to return it, Account owns the bucket
+
+        Other errors, i.e. no connection, no credentials or a role that cannot be assumed, are raised
+        and not remembered, so the next lookup of the bucket tries again."""
+
+        with self.Lock:
+            if Bucket in self.Buckets:
+                return self.Buckets[Bucket]
+
+        ### get_bucket_location works from any region, so use the default region client of the owning account
+        Session, SessionKey = aws.account.GetAccountSession(Account)
+        try:
+            response = aws.client.GetClient('s3', None, Session, SessionKey).get_bucket_location(Bucket = Bucket)
+            Region = response.get('LocationConstraint') or 'us-east-1'
+            if Region == 'EU':
+                Region = 'eu-west-1'
+        except ClientError as c:
+            Region = None
+
+        with self.Lock:
+            self.Buckets[Bucket] = Region
+            self.Lookups += 1
+
+        return Region
+
+    def PutBucketRegion(self, Bucket, Region):
+        """Remember the region of a bucket found some other way, i.e. from list_buckets()"""
+
+        with self.Lock:
+            self.Buckets[Bucket] = Region
+
+    def GetRegion(self, Service, ResourceId, Account=None):
+        """Return region of a resource or None for the default region
+
+        The region comes from the arn, from the url of an sqs queue or, for an s3
+        bucket, from get_bucket_location(). Plain ids of other services use the
+        default region."""
+
+        Ref = aws.arn.Parse(ResourceId)
+        if Ref.Region != None:
+            return Ref.Region
+        elif Service == 's3':
+            return self.GetBucketRegion(Ref.Id, Account)
+        elif Service == 'sqs' and Ref.Id.startswith('https://sqs.'):
+            return Ref.Id.split('/')[2].split('.')[1]
+
+        return None
+
+    def GetStats(self):
+        """Return region map statistics as dictionary"""
+
+        with self.Lock:
+            return {'Buckets': len(self.Buckets), 'Lookups': self.Lookups}
+
+
+### process-wide map shared by every AwsTag instance
+Regions = RegionMap()
+
+def GetResourceRegion(Service, ResourceId, Account=None):
+    """Return region of a resource, i.e. 'eu-west-1', or None for the default region"""
+
+    return Regions.GetRegion(Service, ResourceId, Account)
+
+
+def GetRegions(Account=None):
+    """Return names of the regions enabled for the account, i.e. ['eu-west-1', 'us-east-1']"""
+
+    Session, SessionKey = aws.account.GetAccountSession(Account)
+    response = aws.client.GetClient('ec2', None, Session, SessionKey).describe_regions()
+    return sorted([Region['RegionName'] for Region in response['Regions']])
+
+
+def GetDefaultRegion():
+    """Return name of the default region of the pooled clients"""
+
+    return aws.client.GetClient('ec2').meta.region_name
+
+
+def GetRegionStats():
+    """Return region map statistics, i.e. {'Buckets': 10, 'Lookups': 10}"""
+
+    return Regions.GetStats()
@@ -0,0 +1,384 @@
+"""This module provides the table of supported services and how each one reads, writes and discovers tags"""
+
+### largest number of arns accepted by resource groups tagging api tag_resources()
+TaggingApiBatchLimit = 20
+
+### characters most services accept in tag keys and values: letters, digits, spaces and _ . : / = + - @
+DefaultTagChars = r'[\w\s_.:/=+\-@]*'
+
+def TagList(Tags):
+    """Return [{'Key': TagName, 'Value': TagValue}] from dictionary of TagName: TagValue"""
+
+    return [{'Key': K, 'Value': V} for K,V in Tags.items()]
+
+
+def LowerTagList(Tags):
+    """Return [{'key': TagName, 'value': TagValue}] from dictionary of TagName: TagValue"""
+
+    return [{'key': K, 'value': V} for K,V in Tags.items()]
+
+
+def FromTagList(Tags):
+    """Return dictionary of TagName: TagValue from [{'Key': TagName, 'Value': TagValue}]"""
+
+    return {Tag['Key']: Tag.get('Value', '') for Tag in Tags}
+
+
+def FromLowerTagList(Tags):
+    """Return dictionary of TagName: TagValue from [{'key': TagName, 'value': TagValue}]"""
+
+    return {Tag['key']: Tag.get('value', '') for Tag in Tags}
+
+
+def GetId(Ref):
+    """Return name or id at the end of an arn, or the resource id if it is not an arn"""
+
+    return Ref.Id
+
+
+def GetElbName(Ref):
+    """Return classic load balancer name or None"""
+
+    if Ref.Service == 'elasticloadbalancing' and Ref.Type == 'loadbalancer' and Ref.Id.find('/') == -1:
+        return Ref.Id
+    else:
+        return None
+
+
+def GetLogGroupName(Ref):
+    """Return log group name without the ':*' an arn of a log group ends with"""
+
+    if Ref.IsArn() and Ref.Id.endswith(':*'):
+        return Ref.Id[:-2]
+
+    return Ref.Id
+
+
+class ServiceDescriptor:
+    """Describe how one service writes, reads, sanitizes and discovers tags
+
+    Write is (Operation, Params) where Params(ResourceId, Tags) returns the call parameters,
+    or WriteHandler names an AwsTag method for services that need more than one call.
+    Read is (Operation, Params, Extract) where Params(ResourceId) returns the call parameters
+    and Extract(response) returns dictionary of TagName: TagValue. EmptyErrors are error
+    codes of Read that mean the resource has no tags. Sanitize(Ref) returns the id the api
+    expects from an aws.arn.ResourceRef. Discovery is (Operation, Params, Extract) where Extract(Page) returns
+    resource ids, or DiscoveryHandler names an AwsTag generator. Batch is (Operation, Limit,
+    Params) for a native call that tags many resources, Params(ResourceIds, Tags).
+    TaggingApi is True if arns can be written with tag_resources(). ResourceTypes are the
+    get_resources() type filters and ArnToId(Ref) returns the id discovery reports.
+    RegionParam is the Discovery parameter that limits results to one region when the
+    operation lists every region, and HomeRegion is the only region of a global service.
+    ReplacesTagSet is True if a write replaces every tag of the resource, so writes are a
+    read-modify-write that is merged and serialized per resource. TagChars is the regular
+    expression tag keys and values must match in full, None for any character, and TagLimits
+    is (MaxKeyLength, MaxValueLength)."""
+
+    __slots__ = ('Name', 'Write', 'WriteHandler', 'Read', 'EmptyErrors', 'Sanitize', 'Discovery', \
+                 'DiscoveryHandler', 'Batch', 'TaggingApi', 'ResourceTypes', 'ArnToId', 'RegionParam', 'HomeRegion', \
+                 'ReplacesTagSet', 'TagChars', 'TagLimits')
+
+    def __init__(self, Name, Write=None, WriteHandler=None, Read=None, EmptyErrors=(), Sanitize=None, \
+                 Discovery=None, DiscoveryHandler=None, Batch=None, TaggingApi=False, ResourceTypes=None, \
+                 ArnToId=None, RegionParam=None, HomeRegion=None, ReplacesTagSet=False, TagChars=DefaultTagChars, \
+                 TagLimits=(128, 256)):
+        """Constructor"""
+
+        self.Name = Name
+        self.Write = Write
+        self.WriteHandler = WriteHandler
+        self.Read = Read
+        self.EmptyErrors = EmptyErrors
+        self.Sanitize = Sanitize
+        self.Discovery = Discovery
+        self.DiscoveryHandler = DiscoveryHandler
+        self.Batch = Batch
+        self.TaggingApi = TaggingApi
+        self.ResourceTypes = ResourceTypes
+        self.ArnToId = ArnToId
+        self.RegionParam = RegionParam
+        self.HomeRegion = HomeRegion
+        self.ReplacesTagSet = ReplacesTagSet
+        self.TagChars = TagChars
+        self.TagLimits = TagLimits
+
+
+### one descriptor per supported service, ec2 arns of load balancers resolve to elb or elbv2
+Services = {Descriptor.Name: Descriptor for Descriptor in [
+    ServiceDescriptor('ec2',
+        Write = ('create_tags', lambda Id, Tags: {'Resources': [Id], 'Tags': TagList(Tags)}),
+        Read = ('describe_tags', lambda Id: {'Filters': [{'Name': 'resource-id', 'Values': [Id]}]}, \
+                lambda R: FromTagList(R['Tags'])),
+        Sanitize = GetId,
+        Batch = ('create_tags', 1000, lambda Ids, Tags: {'Resources': Ids, 'Tags': TagList(Tags)}),
+        ResourceTypes = ['ec2', 'elasticloadbalancing:loadbalancer'],
+        ArnToId = lambda Ref: Ref.ResourceId if Ref.Service == 'elasticloadbalancing' else Ref.Id,
+        TagChars = None),
+    ServiceDescriptor('elb',
+        Write = ('add_tags', lambda Id, Tags: {'LoadBalancerNames': [Id], 'Tags': TagList(Tags)}),
+        Read = ('describe_tags', lambda Id: {'LoadBalancerNames': [Id]}, \
+                lambda R: {K: V for TD in R['TagDescriptions'] for K,V in FromTagList(TD['Tags']).items()}),
+        Sanitize = GetElbName,
+        Batch = ('add_tags', 20, lambda Ids, Tags: {'LoadBalancerNames': Ids, 'Tags': TagList(Tags)})),
+    ServiceDescriptor('elbv2',
+        Write = ('add_tags', lambda Id, Tags: {'ResourceArns': [Id], 'Tags': TagList(Tags)}),
+        Read = ('describe_tags', lambda Id: {'ResourceArns': [Id]}, \
+                lambda R: {K: V for TD in R['TagDescriptions'] for K,V in FromTagList(TD['Tags']).items()}),
+        Batch = ('add_tags', 20, lambda Ids, Tags: {'ResourceArns': Ids, 'Tags': TagList(Tags)})),
+    ServiceDescriptor('s3',
+        WriteHandler = 'PutBucketTagging',
+        Read = ('get_bucket_tagging', lambda Id: {'Bucket': Id}, lambda R: FromTagList(R['TagSet'])),
+        EmptyErrors = ('NoSuchTagSet',),
+        Sanitize = GetId,
+        Discovery = ('list_buckets', {}, lambda Page: [Bucket['Name'] for Bucket in Page['Buckets']]),
+        RegionParam = 'BucketRegion',
+        ResourceTypes = ['s3'],
+        ArnToId = GetId,
+        ReplacesTagSet = True),
+    ServiceDescriptor('lambda',
+        Write = ('tag_resource', lambda Id, Tags: {'Resource': Id, 'Tags': Tags}),
+        Read = ('list_tags', lambda Id: {'Resource': Id}, lambda R: dict(R.get('Tags', {}))),
+        Discovery = ('list_functions', {}, lambda Page: [Function['FunctionName'] for Function in Page['Functions']]),
+        TaggingApi = True,
+        ResourceTypes = ['lambda:function'],
+        ArnToId = lambda Ref: Ref.Id.split(':')[0]),
+    ServiceDescriptor('logs',
+        Write = ('tag_log_group', lambda Id, Tags: {'logGroupName': Id, 'tags': Tags}),
+        Read = ('list_tags_log_group', lambda Id: {'logGroupName': Id}, lambda R: dict(R.get('tags', {}))),
+        Sanitize = GetLogGroupName,
+        Discovery = ('describe_log_groups', {}, lambda Page: [LogGroup['logGroupName'] for LogGroup in Page['logGroups']]),
+        TaggingApi = True,
+        ResourceTypes = ['logs:log-group'],
+        ArnToId = GetLogGroupName),
+    ServiceDescriptor('rds',
+        Write = ('add_tags_to_resource', lambda Id, Tags: {'ResourceName': Id, 'Tags': TagList(Tags)}),
+        Read = ('list_tags_for_resource', lambda Id: {'ResourceName': Id}, lambda R: FromTagList(R['TagList'])),
+        Discovery = ('describe_db_instances', {}, lambda Page: [Instance['DBInstanceArn'] for Instance in Page['DBInstances']]),
+        TaggingApi = True,
+        ResourceTypes = ['rds:db']),
+    ServiceDescriptor('es',
+        Write = ('add_tags', lambda Id, Tags: {'ARN': Id, 'TagList': TagList(Tags)}),
+        Read = ('list_tags', lambda Id: {'ARN': Id}, lambda R: FromTagList(R['TagList'])),
+        DiscoveryHandler = 'DescribeElasticSearchDomainArns',
+        TaggingApi = True,
+        ResourceTypes = ['es:domain']),
+    ServiceDescriptor('emr',
+        Write = ('add_tags', lambda Id, Tags: {'ResourceId': Id, 'Tags': TagList(Tags)}),
+        Read = ('describe_cluster', lambda Id: {'ClusterId': Id}, lambda R: FromTagList(R['Cluster'].get('Tags', []))),
+        Sanitize = GetId,
+        Discovery = ('list_clusters', {}, lambda Page: [Cluster['Id'] for Cluster in Page['Clusters']]),
+        ResourceTypes = ['elasticmapreduce:cluster'],
+        ArnToId = GetId),
+    ServiceDescriptor('dynamodb',
+        Write = ('tag_resource', lambda Id, Tags: {'ResourceArn': Id, 'Tags': TagList(Tags)}),
+        Read = ('list_tags_of_resource', lambda Id: {'ResourceArn': Id}, lambda R: FromTagList(R.get('Tags', []))),
+        Discovery = ('list_tables', {}, lambda Page: Page['TableNames']),
+        TaggingApi = True,
+        ResourceTypes = ['dynamodb:table'],
+        ArnToId = GetId),
+    ServiceDescriptor('firehose',
+        Write = ('tag_delivery_stream', lambda Id, Tags: {'DeliveryStreamName': Id, 'Tags': TagList(Tags)}),
+        Read = ('list_tags_for_delivery_stream', lambda Id: {'DeliveryStreamName': Id}, lambda R: FromTagList(R['Tags'])),
+        Sanitize = GetId,
+        DiscoveryHandler = 'DescribeDeliveryStreamNames',
+        TaggingApi = True,
+        ResourceTypes = ['firehose:deliverystream'],
+        ArnToId = GetId),
+    ServiceDescriptor('glacier',
+        Write = ('add_tags_to_vault', lambda Id, Tags: {'vaultName': Id, 'Tags': Tags}),
+        Read = ('list_tags_for_vault', lambda Id: {'vaultName': Id}, lambda R: dict(R.get('Tags', {}))),
+        Sanitize = GetId,
+        Discovery = ('list_vaults', {}, lambda Page: [Vault['VaultName'] for Vault in Page['VaultList']]),
+        TaggingApi = True,
+        ResourceTypes = ['glacier'],
+        ArnToId = GetId),
+    ServiceDescriptor('kms',
+        Write = ('tag_resource', lambda Id, Tags: {'KeyId': Id, \
+                 'Tags': [{'TagKey': K, 'TagValue': V} for K,V in Tags.items()]}),
+        Read = ('list_resource_tags', lambda Id: {'KeyId': Id}, \
+                lambda R: {Tag['TagKey']: Tag.get('TagValue', '') for Tag in R['Tags']}),
+        Discovery = ('list_keys', {}, lambda Page: [Key['KeyId'] for Key in Page['Keys']]),
+        TaggingApi = True,
+        ResourceTypes = ['kms:key'],
+        ArnToId = GetId),
+    ServiceDescriptor('apigateway',
+        Write = ('tag_resource', lambda Id, Tags: {'resourceArn': Id, 'tags': Tags}),
+        Read = ('get_tags', lambda Id: {'resourceArn': Id}, lambda R: dict(R.get('tags', {}))),
+        Discovery = ('get_rest_apis', {}, lambda Page: [Item['id'] for Item in Page['items']]),
+        TaggingApi = True,
+        ResourceTypes = ['apigateway:restapis'],
+        ArnToId = GetId),
+    ServiceDescriptor('kinesis',
+        Write = ('add_tags_to_stream', lambda Id, Tags: {'StreamName': Id, 'Tags': Tags}),
+        Read = ('list_tags_for_stream', lambda Id: {'StreamName': Id}, lambda R: FromTagList(R['Tags'])),
+        Sanitize = GetId,
+        Discovery = ('list_streams', {}, lambda Page: Page['StreamNames']),
+        TaggingApi = True,
+        ResourceTypes = ['kinesis:stream'],
+        ArnToId = GetId),
+    ServiceDescriptor('cloudtrail',
+        Write = ('add_tags', lambda Id, Tags: {'ResourceId': Id, 'TagsList': TagList(Tags)}),
+        Read = ('list_tags', lambda Id: {'ResourceIdList': [Id]}, \
+                lambda R: {K: V for RT in R['ResourceTagList'] for K,V in FromTagList(RT.get('TagsList', [])).items()}),
+        Discovery = ('describe_trails', {}, lambda Page: [Trail['TrailARN'] for Trail in Page['trailList']]),
+        TaggingApi = True,
+        ResourceTypes = ['cloudtrail:trail']),
+    ServiceDescriptor('sqs',
+        Write = ('tag_queue', lambda Id, Tags: {'QueueUrl': Id, 'Tags': Tags}),
+        Read = ('list_queue_tags', lambda Id: {'QueueUrl': Id}, lambda R: dict(R.get('Tags', {}))),
+        Discovery = ('list_queues', {}, lambda Page: Page.get('QueueUrls', [])),
+        ResourceTypes = ['sqs'],
+        ArnToId = lambda Ref: 'https://sqs.' + Ref.Region + '.amazonaws.com/' + Ref.Account + '/' + Ref.Id),
+    ServiceDescriptor('secretsmanager',
+        Write = ('tag_resource', lambda Id, Tags: {'SecretId': Id, 'Tags': TagList(Tags)}),
+        Read = ('describe_secret', lambda Id: {'SecretId': Id}, lambda R: FromTagList(R.get('Tags', []))),
+        Discovery = ('list_secrets', {}, lambda Page: [Secret['Name'] for Secret in Page['SecretList']]),
+        TaggingApi = True,
+        ResourceTypes = ['secretsmanager:secret'],
+        ArnToId = lambda Ref: Ref.Id.rsplit('-', 1)[0]),
+    ServiceDescriptor('cloudfront',
+        Write = ('tag_resource', lambda Id, Tags: {'Resource': Id, 'Tags': {'Items': TagList(Tags)}}),
+        Read = ('list_tags_for_resource', lambda Id: {'Resource': Id}, lambda R: FromTagList(R['Tags'].get('Items', []))),
+        Discovery = ('list_distributions', {}, \
+                     lambda Page: [Item['ARN'] for Item in Page['DistributionList'].get('Items', [])]),
+        ResourceTypes = ['cloudfront:distribution'],
+        HomeRegion = 'us-east-1'),
+    ServiceDescriptor('efs',
+        Write = ('create_tags', lambda Id, Tags: {'FileSystemId': Id, 'Tags': TagList(Tags)}),
+        Read = ('describe_tags', lambda Id: {'FileSystemId': Id}, lambda R: FromTagList(R['Tags'])),
+        Sanitize = GetId,
+        Discovery = ('describe_file_systems', {}, lambda Page: [FS['FileSystemId'] for FS in Page['FileSystems']]),
+        TaggingApi = True,
+        ResourceTypes = ['elasticfilesystem:file-system'],
+        ArnToId = GetId),
+    ServiceDescriptor('sagemaker',
+        Write = ('add_tags', lambda Id, Tags: {'ResourceArn': Id, 'Tags': TagList(Tags)}),
+        Read = ('list_tags', lambda Id: {'ResourceArn': Id}, lambda R: FromTagList(R['Tags'])),
+        Discovery = ('list_notebook_instances', {}, \
+                     lambda Page: [Instance['NotebookInstanceArn'] for Instance in Page['NotebookInstances']]),
+        TaggingApi = True,
+        ResourceTypes = ['sagemaker:notebook-instance']),
+    ServiceDescriptor('redshift',
+        Write = ('create_tags', lambda Id, Tags: {'ResourceName': Id, 'Tags': TagList(Tags)}),
+        Read = ('describe_tags', lambda Id: {'ResourceName': Id}, \
+                lambda R: {TR['Tag']['Key']: TR['Tag'].get('Value', '') for TR in R['TaggedResources']}),
+        Discovery = ('describe_clusters', {}, lambda Page: [Cluster['ClusterIdentifier'] for Cluster in Page['Clusters']]),
+        TaggingApi = True,
+        ResourceTypes = ['redshift:cluster'],
+        ArnToId = GetId),
+    ServiceDescriptor('elasticache',
+        Write = ('add_tags_to_resource', lambda Id, Tags: {'ResourceName': Id, 'Tags': TagList(Tags)}),
+        Read = ('list_tags_for_resource', lambda Id: {'ResourceName': Id}, lambda R: FromTagList(R['TagList'])),
+        Discovery = ('describe_cache_clusters', {}, lambda Page: [Cluster['CacheClusterId'] for Cluster in Page['CacheClusters']]),
+        TaggingApi = True,
+        ResourceTypes = ['elasticache:cluster'],
+        ArnToId = GetId),
+    ServiceDescriptor('workspaces',
+        Write = ('create_tags', lambda Id, Tags: {'ResourceId': Id, 'Tags': TagList(Tags)}),
+        Read = ('describe_tags', lambda Id: {'ResourceId': Id}, lambda R: FromTagList(R['TagList'])),
+        Discovery = ('describe_workspaces', {}, lambda Page: [Workspace['WorkspaceId'] for Workspace in Page['Workspaces']]),
+        TaggingApi = True,
+        ResourceTypes = ['workspaces:workspace'],
+        ArnToId = GetId),
+    ServiceDescriptor('ds',
+        Write = ('add_tags_to_resource', lambda Id, Tags: {'ResourceId': Id, 'Tags': TagList(Tags)}),
+        Read = ('list_tags_for_resource', lambda Id: {'ResourceId': Id}, lambda R: FromTagList(R['Tags'])),
+        Discovery = ('describe_directories', {}, \
+                     lambda Page: [Directory['DirectoryId'] for Directory in Page['DirectoryDescriptions']]),
+        TaggingApi = True,
+        ResourceTypes = ['ds:directory'],
+        ArnToId = GetId),
+    ServiceDescriptor('dax',
+        Write = ('tag_resource', lambda Id, Tags: {'ResourceName': Id, 'Tags': TagList(Tags)}),
+        Read = ('list_tags', lambda Id: {'ResourceName': Id}, lambda R: FromTagList(R['Tags'])),
+        Discovery = ('describe_clusters', {}, lambda Page: [Cluster['ClusterArn'] for Cluster in Page['Clusters']]),
+        TaggingApi = True,
+        ResourceTypes = ['dax:cache']),
+    ServiceDescriptor('route53',
+        ### change_tags_for_resource takes a single hosted zone, so route53 has no batch write
+        Write = ('change_tags_for_resource', lambda Id, Tags: {'ResourceType': 'hostedzone', 'ResourceId': Id, \
+                 'AddTags': TagList(Tags)}),
+        Read = ('list_tags_for_resource', lambda Id: {'ResourceType': 'hostedzone', 'ResourceId': Id}, \
+                lambda R: FromTagList(R['ResourceTagSet'].get('Tags', []))),
+        Discovery = ('list_hosted_zones', {}, lambda Page: [HZ['Id'] for HZ in Page['HostedZones']]),
+        ResourceTypes = ['route53:hostedzone'],
+        ArnToId = lambda Ref: '/hostedzone/' + Ref.Id,
+        HomeRegion = 'us-east-1'),
+    ServiceDescriptor('directconnect',
+        Write = ('tag_resource', lambda Id, Tags: {'resourceArn': Id, 'tags': LowerTagList(Tags)}),
+        Read = ('describe_tags', lambda Id: {'resourceArns': [Id]}, \
+                lambda R: {K: V for RT in R['resourceTags'] for K,V in FromLowerTagList(RT.get('tags', [])).items()}),
+        Discovery = ('describe_virtual_interfaces', {}, lambda Page: [VI['virtualInterfaceId'] for VI in Page['virtualInterfaces']]),
+        ResourceTypes = ['directconnect:dxvif'],
+        ArnToId = GetId),
+    ServiceDescriptor('datapipeline',
+        Write = ('add_tags', lambda Id, Tags: {'pipelineId': Id, 'tags': LowerTagList(Tags)}),
+        Read = ('describe_pipelines', lambda Id: {'pipelineIds': [Id]}, \
+                lambda R: {K: V for PD in R['pipelineDescriptionList'] for K,V in FromLowerTagList(PD.get('tags', [])).items()}),
+        Discovery = ('list_pipelines', {}, lambda Page: [Pipeline['id'] for Pipeline in Page['pipelineIdList']]))
+]}
+
+### ec2 resource type: describe operation, parameters and function to get ids from each page.
+### parameters scope results on the server to resources we own that are not deleted, and ids have
+### the form in the arns of the tagging api, i.e. key pairs by KeyPairId, so both paths match
+Ec2Discovery = {
+    'snapshot': ('describe_snapshots', {'OwnerIds': ['self']}, lambda Page: [R['SnapshotId'] for R in Page['Snapshots']]),
+    'natgateway': ('describe_nat_gateways', {'Filter': [{'Name': 'state', 'Values': ['pending', 'available']}]}, \
+                   lambda Page: [R['NatGatewayId'] for R in Page['NatGateways']]),
+    'customer-gateway': ('describe_customer_gateways', {'Filters': [{'Name': 'state', 'Values': ['pending', 'available']}]}, \
+                         lambda Page: [R['CustomerGatewayId'] for R in Page['CustomerGateways']]),
+    'dedicated-host': ('describe_hosts', {}, lambda Page: [R['HostId'] for R in Page['Hosts']]),
+    'dhcp-options': ('describe_dhcp_options', {}, lambda Page: [R['DhcpOptionsId'] for R in Page['DhcpOptions']]),
+    'egress-only-internet-gateway': ('describe_egress_only_internet_gateways', {}, \
+                         lambda Page: [R['EgressOnlyInternetGatewayId'] for R in Page['EgressOnlyInternetGateways']]),
+    'elastic-gpu': ('describe_elastic_gpus', {}, lambda Page: [R['ElasticGpuId'] for R in Page.get('ElasticGpuSet', [])]),
+    'image': ('describe_images', {'Owners': ['self']}, lambda Page: [R['ImageId'] for R in Page['Images']]),
+    'instance': ('describe_instances', {'Filters': [{'Name': 'instance-state-name', \
+                 'Values': ['pending', 'running', 'shutting-down', 'stopping', 'stopped']}]}, \
+                 lambda Page: [I['InstanceId'] for R in Page['Reservations'] for I in R['Instances']]),
+    'instance-profile': ('describe_iam_instance_profile_associations', {'Filters': [{'Name': 'state', \
+                         'Values': ['associating', 'associated']}]}, \
+                         lambda Page: [R['IamInstanceProfile']['Id'] for R in Page['IamInstanceProfileAssociations']]),
+    'internet-gateway': ('describe_internet_gateways', {}, \
+                         lambda Page: [R['InternetGatewayId'] for R in Page['InternetGateways']]),
+    'key-pair': ('describe_key_pairs', {}, lambda Page: [R['KeyPairId'] for R in Page['KeyPairs']]),
+    'launch-template': ('describe_launch_templates', {}, lambda Page: [R['LaunchTemplateId'] for R in Page['LaunchTemplates']]),
+    'network-acl': ('describe_network_acls', {}, lambda Page: [R['NetworkAclId'] for R in Page['NetworkAcls']]),
+    'network-interface': ('describe_network_interfaces', {}, \
+                          lambda Page: [R['NetworkInterfaceId'] for R in Page['NetworkInterfaces']]),
+    'placement-group': ('describe_placement_groups', {}, lambda Page: [R['GroupName'] for R in Page['PlacementGroups']]),
+    'reserved-instances': ('describe_reserved_instances', {'Filters': [{'Name': 'state', \
+                           'Values': ['payment-pending', 'active']}]}, \
+                           lambda Page: [R['ReservedInstancesId'] for R in Page['ReservedInstances']]),
+    'route-table': ('describe_route_tables', {}, lambda Page: [R['RouteTableId'] for R in Page['RouteTables']]),
+    'security-group': ('describe_security_groups', {}, lambda Page: [R['GroupId'] for R in Page['SecurityGroups']]),
+    'spot-instances-request': ('describe_spot_instance_requests', {'Filters': [{'Name': 'state', \
+                               'Values': ['open', 'active']}]}, \
+                               lambda Page: [R['SpotInstanceRequestId'] for R in Page['SpotInstanceRequests']]),
+    'subnet': ('describe_subnets', {}, lambda Page: [R['SubnetId'] for R in Page['Subnets']]),
+    'volume': ('describe_volumes', {}, lambda Page: [R['VolumeId'] for R in Page['Volumes']]),
+    'vpc': ('describe_vpcs', {}, lambda Page: [R['VpcId'] for R in Page['Vpcs']]),
+    'vpc-peering-connection': ('describe_vpc_peering_connections', {'Filters': [{'Name': 'status-code', \
+                               'Values': ['pending-acceptance', 'provisioning', 'active']}]}, \
+                               lambda Page: [R['VpcPeeringConnectionId'] for R in Page['VpcPeeringConnections']]),
+    'vpn-connection': ('describe_vpn_connections', {'Filters': [{'Name': 'state', 'Values': ['pending', 'available']}]}, \
+                       lambda Page: [R['VpnConnectionId'] for R in Page['VpnConnections']]),
+    'vpn-gateway': ('describe_vpn_gateways', {'Filters': [{'Name': 'state', 'Values': ['pending', 'available']}]}, \
+                    lambda Page: [R['VpnGatewayId'] for R in Page['VpnGateways']])
+}
+
+### name of the filter parameter of ec2 types whose describe call does not use Filters,
+### None when the call cannot filter by tag
+Ec2FilterParams = {'natgateway': 'Filter', 'dedicated-host': 'Filter', 'instance-profile': None, 'elastic-gpu': None}
+
+def IsGlobalService(Service):
+    """Return True if service has one home region whatever region it is called from otherwise False"""
+
+    Descriptor = Services.get(Service)
+    return Descriptor != None and Descriptor.HomeRegion != None
+
+
+def GetDescriptor(Service):
+    """Return descriptor of service or None if service is not supported"""
+
+    return Services.get(Service)
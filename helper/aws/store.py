@@ -0,0 +1,318 @@
+"""This module provides a persistent sqlite inventory of resources and tags that is refreshed per partition"""
+
+import sqlite3
+import threading
+import time
+import aws.region
+import aws.registry
+
+class InventoryStore:
+    """Keep resources, tags and last seen times per service, region and account in a local database
+
+    A partition is the resources of one service in one region and account. Each service has a
+    ttl, and Refresh() only rediscovers partitions older than it. Resources are keyed by region
+    too, since names such as log groups repeat across regions. Region None is the default region,
+    a global service is stored under its home region, and Account is stored as '' when None so
+    it can be part of a primary key."""
+
+    ### databases of an older schema version are rebuilt, the store only caches what aws returns
+    __Version = 3
+
+    ### seconds a partition or resource is trusted, resources that change often are rediscovered sooner
+    __Ttls = {
+                'ec2': 900, 'elb': 900, 'elbv2': 900, 'emr': 900, 'lambda': 1800, 'sagemaker': 1800,
+                's3': 86400, 'glacier': 86400, 'kms': 86400, 'route53': 86400, 'cloudfront': 86400,
+                'cloudtrail': 86400, 'directconnect': 86400
+            }
+
+    __Schema = [
+                'CREATE TABLE IF NOT EXISTS partitions (service TEXT, region TEXT, account TEXT, scope TEXT, \
+                 refreshed_at REAL, PRIMARY KEY (service, region, account, scope))',
+                'CREATE TABLE IF NOT EXISTS resources (service TEXT, resource_id TEXT, account TEXT, region TEXT, \
+                 type TEXT, last_seen REAL, PRIMARY KEY (service, resource_id, account, region))',
+                'CREATE TABLE IF NOT EXISTS tags (service TEXT, resource_id TEXT, account TEXT, region TEXT, key TEXT, \
+                 value TEXT, PRIMARY KEY (service, resource_id, account, region, key))',
+                'CREATE INDEX IF NOT EXISTS tags_key ON tags (key)',
+                'CREATE INDEX IF NOT EXISTS tags_key_value ON tags (key, value)',
+                'CREATE INDEX IF NOT EXISTS resources_service ON resources (service)',
+                'CREATE INDEX IF NOT EXISTS resources_partition ON resources (service, region, account)'
+            ]
+
+    def __init__(self, Filename='inventory.db', DefaultTtl=3600, Ttls=None):
+        """Constructor, Ttls overrides the default ttl in seconds of a service, i.e. {'s3': 3600}"""
+
+        self.Filename = Filename
+        self.DefaultTtl = DefaultTtl
+        self.Ttls = dict(InventoryStore.__Ttls)
+        if Ttls != None:
+            self.Ttls.update(Ttls)
+        self.Lock = threading.Lock()
+        self.Hits = 0
+        self.Misses = 0
+        self.Refreshes = 0
+
+        ### one connection shared by worker threads, every statement runs under the lock
+        self.Connection = sqlite3.connect(Filename, check_same_thread=False)
+        with self.Lock, self.Connection:
+            self.Connection.execute('PRAGMA journal_mode=WAL')
+            self.Connection.execute('PRAGMA synchronous=NORMAL')
+            if self.Connection.execute('PRAGMA user_version').fetchone()[0] < InventoryStore.__Version:
+                for Table in ['tags', 'resources', 'partitions']:
+                    self.Connection.execute('DROP TABLE IF EXISTS ' + Table)
+                self.Connection.execute('PRAGMA user_version = ' + str(InventoryStore.__Version))
+            for Statement in InventoryStore.__Schema:
+                self.Connection.execute(Statement)
+
+    def GetTtl(self, Service):
+        """Return ttl in seconds of a service"""
+
+        return self.Ttls.get(Service, self.DefaultTtl)
+
+    def GetRegion(self, Service, Region):
+        """Return the region a partition or resource is stored under, the home region for a global service"""
+
+        Descriptor = aws.registry.GetDescriptor(Service)
+        if Descriptor != None and Descriptor.HomeRegion != None:
+            return Descriptor.HomeRegion
+
+        return Region or aws.region.GetDefaultRegion()
+
+    def GetScope(self, Ec2Types):
+        """Return scope of a partition, '' for every resource type or the sorted ec2 types scanned"""
+
+        return '' if Ec2Types == None else ','.join(sorted(Ec2Types))
+
+    def IsStale(self, Service, Region=None, Account=None, Ec2Types=None):
+        """Return True if the partition was never refreshed or is older than the service ttl
+
+        A partition of some ec2 types is also fresh when every type was refreshed since."""
+
+        Since = time.time() - self.GetTtl(Service)
+        with self.Lock:
+            Row = self.Connection.execute('SELECT MAX(refreshed_at) FROM partitions WHERE service = ? AND region = ? \
+                                           AND account = ? AND scope IN (?, ?)', (Service, self.GetRegion(Service, Region), \
+                                           Account or '', self.GetScope(Ec2Types), '')).fetchone()
+
+        return Row[0] == None or Row[0] < Since
+
+    def Refresh(self, Service, Region=None, Account=None, Ec2Types=None, Force=False):
+        """Rediscover a partition if it is stale and return number of resources written
+
+        Resources no longer discovered are removed. Resources whose tags cannot be read keep
+        their stored tags."""
+
+        if not Force and not self.IsStale(Service, Region, Account, Ec2Types):
+            return 0
+
+        ### imported here because aws.inventory imports aws.tag, which writes through this module
+        import aws.inventory
+
+        Started = time.time()
+        Resources = []
+        Kept = []
+        for ResourceId, Tags, Error, Type in aws.inventory.IterTypedResourceTags(Service, Ec2Types, Region=Region, \
+                                                                                 Account=Account):
+            if Error != None:
+                Kept.append(ResourceId)
+            else:
+                Resources.append((ResourceId, Tags, Type))
+
+        ### one transaction per partition so readers never see it half written
+        Region = self.GetRegion(Service, Region)
+        Account = Account or ''
+        with self.Lock, self.Connection:
+            for ResourceId, Tags, Type in Resources:
+                self.WriteResource(Service, ResourceId, Account, Region, Tags, Started, Type)
+            self.Connection.executemany('UPDATE resources SET last_seen = ? WHERE service = ? AND resource_id = ? \
+                                         AND account = ? AND region = ?', [(Started, Service, ResourceId, Account, Region) \
+                                                                           for ResourceId in Kept])
+
+            Gone = 'service = ? AND region = ? AND account = ? AND last_seen < ?'
+            Params = [Service, Region, Account, Started]
+            if Ec2Types != None:
+                Gone += ' AND type IN (' + ','.join('?' * len(Ec2Types)) + ')'
+                Params += list(Ec2Types)
+            self.Connection.execute('DELETE FROM tags WHERE (service, resource_id, account, region) IN (SELECT service, \
+                                     resource_id, account, region FROM resources WHERE ' + Gone + ')', Params)
+            self.Connection.execute('DELETE FROM resources WHERE ' + Gone, Params)
+            self.Connection.execute('INSERT OR REPLACE INTO partitions VALUES (?, ?, ?, ?, ?)', \
+                                    (Service, Region, Account, self.GetScope(Ec2Types), Started))
+            self.Refreshes += 1
+
+        return len(Resources)
+
+    def WriteResource(self, Service, ResourceId, Account, Region, Tags, LastSeen, Type=None):
+        """Replace a resource and its tags, the caller holds the lock and a transaction
+
+        Type is the ec2 resource type discovery scanned, i.e. 'key-pair', None keeps the stored type."""
+
+        self.Connection.execute('INSERT INTO resources VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (service, resource_id, \
+                                 account, region) DO UPDATE SET last_seen = excluded.last_seen' + \
+                                (', type = excluded.type' if Type != None else ''), \
+                                (Service, ResourceId, Account, Region, Type or '', LastSeen))
+        self.Connection.execute('DELETE FROM tags WHERE service = ? AND resource_id = ? AND account = ? AND region = ?', \
+                                (Service, ResourceId, Account, Region))
+        self.Connection.executemany('INSERT INTO tags VALUES (?, ?, ?, ?, ?, ?)', \
+                                    [(Service, ResourceId, Account, Region, K, V) for K, V in Tags.items()])
+
+    def GetTags(self, Key):
+        """Return tags of a resource seen within the service ttl or None, Key is AwsTag.GetCacheKey()"""
+
+        Service, ResourceId, Account, Region = Key
+        Params = (Service, ResourceId, Account or '', self.GetRegion(Service, Region))
+        with self.Lock:
+            Row = self.Connection.execute('SELECT last_seen FROM resources WHERE service = ? AND resource_id = ? \
+                                           AND account = ? AND region = ?', Params).fetchone()
+            if Row == None or Row[0] < time.time() - self.GetTtl(Service):
+                self.Misses += 1
+                return None
+            self.Hits += 1
+            return dict(self.Connection.execute('SELECT key, value FROM tags WHERE service = ? AND resource_id = ? \
+                                                 AND account = ? AND region = ?', Params))
+
+    def Put(self, Key, Tags):
+        """Store the complete tag set of a resource read or written outside Refresh(), Key is AwsTag.GetCacheKey()"""
+
+        Service, ResourceId, Account, Region = Key
+        with self.Lock, self.Connection:
+            self.WriteResource(Service, ResourceId, Account or '', self.GetRegion(Service, Region), Tags, time.time())
+
+    def Update(self, Key, Tags):
+        """Merge written tags into a stored resource so a write does not leave a stale read behind"""
+
+        Service, ResourceId, Account, Region = Key
+        Region = self.GetRegion(Service, Region)
+        with self.Lock, self.Connection:
+            self.Connection.executemany('INSERT OR REPLACE INTO tags SELECT service, resource_id, account, region, ?, ? \
+                                         FROM resources WHERE service = ? AND resource_id = ? AND account = ? \
+                                         AND region = ?', [(K, V, Service, ResourceId, Account or '', Region) \
+                                                           for K, V in Tags.items()])
+
+    def GetPartitionFilter(self, Service=None, Region=None, Account=None, Ec2Types=None):
+        """Return (Sql, Params) of a where clause on resources r, None matches everything"""
+
+        Sql = '1'
+        Params = []
+        for Column, Value in [('service', Service), ('region', Region), ('account', Account)]:
+            if Value != None:
+                Sql += ' AND r.' + Column + ' = ?'
+                Params.append(Value)
+        if Ec2Types != None:
+            Sql += ' AND r.type IN (' + ','.join('?' * len(Ec2Types)) + ')'
+            Params += list(Ec2Types)
+
+        return Sql, Params
+
+    def GetResources(self, Service, Region=None, Account=None, Ec2Types=None):
+        """Return list of stored resource ids of a partition"""
+
+        Sql, Params = self.GetPartitionFilter(Service, self.GetRegion(Service, Region), Account or '', Ec2Types)
+        with self.Lock:
+            return [Row[0] for Row in self.Connection.execute('SELECT r.resource_id FROM resources r WHERE ' + Sql + \
+                                                                  ' ORDER BY r.resource_id', Params)]
+
+    def IterResourceTags(self, Service, Region=None, Account=None, Ec2Types=None):
+        """Yield (ResourceId, Tags, None) for stored resources of a partition, like aws.inventory.IterResourceTags()"""
+
+        Sql, Params = self.GetPartitionFilter(Service, self.GetRegion(Service, Region), Account or '', Ec2Types)
+        Resources = {}
+        with self.Lock:
+            for ResourceId, Key, Value in self.Connection.execute('SELECT r.resource_id, t.key, t.value FROM resources r \
+                    LEFT JOIN tags t ON t.service = r.service AND t.resource_id = r.resource_id AND t.account = r.account \
+                    AND t.region = r.region WHERE ' + Sql + ' ORDER BY r.resource_id', Params):
+                Tags = Resources.setdefault(ResourceId, {})
+                if Key != None:
+                    Tags[Key] = Value
+
+        for ResourceId, Tags in Resources.items():
+            yield ResourceId, Tags, None
+
+    def GetMissingTag(self, TagName, Service=None, Region=None, Account=None):
+        """Return list of (Service, Region, Account, ResourceId) of stored resources without tag TagName
+
+        None matches every service, region or account"""
+
+        Sql, Params = self.GetPartitionFilter(Service, Region, Account)
+        with self.Lock:
+            return self.Connection.execute('SELECT r.service, r.region, r.account, r.resource_id FROM resources r \
+                    WHERE ' + Sql + ' AND NOT EXISTS (SELECT 1 FROM tags t WHERE t.service = r.service AND \
+                    t.resource_id = r.resource_id AND t.account = r.account AND t.region = r.region AND t.key = ?) \
+                    ORDER BY r.service, r.region, r.resource_id', Params + [TagName]).fetchall()
+
+    def GetTagged(self, TagName, TagValue=None):
+        """Return list of (Service, Region, Account, ResourceId) of stored resources with tag TagName, and TagValue if given"""
+
+        Sql = 'SELECT service, region, account, resource_id FROM tags WHERE key = ?'
+        Params = [TagName]
+        if TagValue != None:
+            Sql += ' AND value = ?'
+            Params.append(TagValue)
+        with self.Lock:
+            return self.Connection.execute(Sql + ' ORDER BY service, region, resource_id', Params).fetchall()
+
+    def GetStats(self):
+        """Return store statistics as dictionary"""
+
+        with self.Lock:
+            Resources = self.Connection.execute('SELECT COUNT(*) FROM resources').fetchone()[0]
+            Partitions = self.Connection.execute('SELECT COUNT(*) FROM partitions').fetchone()[0]
+            return {'Resources': Resources, 'Partitions': Partitions, 'Refreshes': self.Refreshes, \
+                    'Hits': self.Hits, 'Misses': self.Misses}
+
+    def Close(self):
+        """Close the database"""
+
+        with self.Lock:
+            self.Connection.close()
+
+
+### process-wide store, None until OpenInventoryStore() is called so reads and writes go to aws only
+Store = None
+
+def OpenInventoryStore(Filename='inventory.db', DefaultTtl=3600, Ttls=None):
+    """Open or create the inventory database that tag reads and GetResources() read through"""
+
+    global Store
+    Store = InventoryStore(Filename, DefaultTtl, Ttls)
+    return Store
+
+
+def GetInventoryStore():
+    """Return the open inventory store or None"""
+
+    return Store
+
+
+def CloseInventoryStore():
+    """Close the inventory store, reads and writes go to aws only afterwards"""
+
+    global Store
+    if Store != None:
+        Store.Close()
+        Store = None
+
+
+def GetTags(Key):
+    """Return stored tags of a resource or None if no store is open or the resource is stale"""
+
+    return Store.GetTags(Key) if Store != None else None
+
+
+def PutTags(Key, Tags):
+    """Store the complete tag set of a resource if a store is open, Key is AwsTag.GetCacheKey()"""
+
+    if Store != None:
+        Store.Put(Key, Tags)
+
+
+def UpdateTags(Key, Tags):
+    """Merge written tags into a stored resource if a store is open"""
+
+    if Store != None:
+        Store.Update(Key, Tags)
+
+
+def GetInventoryStoreStats():
+    """Return store statistics, i.e. {'Resources': 100, 'Partitions': 4, 'Refreshes': 1, 'Hits': 10, 'Misses': 2}"""
+
+    return Store.GetStats() if Store != None else {}
@@ -1,7 +1,31 @@
 """This module provides classes and functions to update tags for AWS services"""
-import boto3
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
 
+### run as a script for the self-test, i.e. python helper/aws/tag.py, the helper directory is not on the path
+if __name__ == '__main__':
+    import os
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aws.client
+import aws.cache
+import aws.metrics
+import aws.store
+import aws.registry
+import aws.arn
+import aws.region
+import aws.account
+import aws.throttle
+
+### errors that fail every resource of a batch alike, so a failed batch is not split to find the bad ids
+BatchWideErrors = set([
+                    'AccessDenied', 'AccessDeniedException', 'UnauthorizedOperation', 'AuthFailure',
+                    'ExpiredToken', 'ExpiredTokenException', 'InvalidClientTokenId', 'UnrecognizedClientException'
+                ]) | aws.throttle.ThrottlingErrors
+
 class TagNotSupportedError(Exception):
     """An exception class which can be raised when tagging not supported"""
 
@@ -13,22 +37,37 @@ class InvalidEc2TypeError(Exception):
     """An exception class which can be raised for invalid ec2 type"""
 
     def __init__(self, ResourceId):
-        super().__init__('Invalid ec2 type for ResourceId ' + ResourceId)
+        super().__init__('Invalid ec2 type for ResourceId ' + str(ResourceId))
+
+### one lock per resource whose writes replace the whole tag set, so concurrent read-modify-writes do not
+### overwrite each other
+ResourceLocks = {}
+ResourceLocksLock = threading.Lock()
+
+def GetResourceLock(Key):
+    """Return the lock that serializes tag set writes of a resource, Key is AwsTag.GetWriteKey()"""
+
+    with ResourceLocksLock:
+        if Key not in ResourceLocks:
+            ResourceLocks[Key] = threading.Lock()
+        return ResourceLocks[Key]
+
 
 class AwsTag:
     """Update tags for supported AWS services"""
 
-    __Services = ['ec2', 's3', 'lambda', 'logs', 'rds', 'es', 'emr', 'dynamodb', 'firehose', \
-                     'glacier', 'kms', 'apigateway', 'kinesis', 'cloudtrail', 'sqs', 'secretsmanager', \
-		     'cloudfront', 'efs', 'sagemaker', 'redshift', 'elasticache', 'workspaces', \
-		     'ds', 'dax', 'route53', 'directconnect', 'datapipeline', 'elb', 'elbv2'
-                    ]
+    def __init__(self, Service=None, ResourceId=None, Region=None, Account=None):
+        """Constructor, ResourceId is an arn, a resource id or an aws.arn.ResourceRef
 
-    def __init__(self, Service=None, ResourceId=None):
-        """Constructor"""
+        Region defaults to the region of ResourceId, found when the first client is needed.
+        Account is the account id to work in through the role set by aws.account.ConfigureAccounts,
+        None uses the ambient credentials"""
 
         self.Service = Service
-        if self.Service not in AwsTag.__Services:
+        self.ResourceId = ResourceId
+        self.Region = Region
+        self.Account = Account
+        if self.Service not in aws.registry.Services:
             raise TagNotSupportedError(str(self.Service))
         elif self.Service == 'ec2':
             try:
@@ -37,6 +76,9 @@ class AwsTag:
             except Exception as e:
                 raise e
 
+        ### everything this service needs to read, write and discover tags
+        self.Descriptor = aws.registry.Services[self.Service]
+
 
     def GetServiceName(self):
         """Return service name"""
@@ -46,1701 +88,606 @@ class AwsTag:
 
     def GetEc2Type(self, ResourceId):
         """Return type of ec2 such as elb, elbv2 or ec2"""
-    
-        if ResourceId != None and ResourceId.find('elasticloadbalancing') != -1:
-            LbName = ResourceId.split(':')[-1].split('/')
-            if len(LbName) == 2:
+
+        Ref = aws.arn.Parse(ResourceId) if ResourceId != None else None
+        if Ref != None and Ref.Service == 'elasticloadbalancing':
+            ### classic load balancers are loadbalancer/name, v2 are loadbalancer/app/name/id or targetgroup/name/id
+            if Ref.Type == 'loadbalancer' and Ref.Id.find('/') == -1:
                 return 'elb'
-            elif len(LbName) == 4:
+            elif Ref.Type in ['loadbalancer', 'targetgroup']:
                 return 'elbv2'
+            raise InvalidEc2TypeError(ResourceId)
         elif self.Service == 'ec2':
             return 'ec2'
         else:
             raise InvalidEc2TypeError(ResourceId)
 
 
-    def GetServicesCount(self):
-        """Return number of supported services"""
-
-        return len(AwsTag.__Services)
-
+    def GetRegion(self):
+        """Return region of this instance's resource or None for the default region"""
 
-    def TagResource(self, ResourceId, TagName, TagValue):
-        """Update tags using boto3 method tag_resource()"""
+        if self.Descriptor.HomeRegion != None:
+            self.Region = self.Descriptor.HomeRegion
+        elif self.Region == None and self.ResourceId != None:
+            self.Region = aws.region.GetResourceRegion(self.Service, self.ResourceId, self.Account)
 
-        Client = boto3.client(self.Service)
+        return self.Region
 
-        if self.Service == 'lambda':
-            response = Client.tag_resource (
-                Resource = ResourceId,
-		Tags =  {
-                    TagName: TagValue
-                }
-	    )
-        elif self.Service == 'dax':
-            response = Client.tag_resource (
-                ResourceName = ResourceId,
-		Tags = [
-		    {
-                        'Key': TagName,
-			'Value': TagValue
-		    }
-		]
-	    )
-        elif self.Service == 'directconnect':
-            response = Client.tag_resource (
-                resourceArn = ResourceId,
-		Tags = [
-		    {
-                        'key': TagName,
-			'value': TagValue
-		    }
-		]
-	    )
-        elif self.Service == 'dynamodb':
-            response = Client.tag_resource (
-                ResourceArn = ResourceId,
-		Tags = [
-		    {
-                        'Key': TagName,
-			'Value': TagValue
-		    }
-		]
-	    )
-        elif self.Service == 'kms':
-            response = Client.tag_resource (
-                KeyId = ResourceId,
-		Tags = [
-		    {
-                        'TagKey': TagName,
-			'TagValue': TagValue
-		    }
-		]
-	    )
-        elif self.Service == 'apigateway':
-            response = Client.tag_resource (
-                resourceArn = ResourceId,
-		tags = [
-		    {
-			TagName: TagValue
-		    }
-		]
-	    )
-        elif self.Service == 'secretsmanager':
-            response = Client.tag_resource (
-                SecretId = ResourceId,
-		Tags = [
-		    {
-			'Key': TagName,
-			'Value': TagValue
-		    }
-		]
-	    )
-        elif self.Service == 'cloudfront':
-            response = Client.tag_resource (
-                Resource = ResourceId,
-		Tags = {
-                    'Items': [
-		        {
-			    'Key': TagName,
-			    'Value': TagValue
-		        }
-                    ]
-		}
-	    )
-        else:
-            raise TagNotSupportedError(str(self.Service))
+    def GetClient(self, Service=None):
+        """Return pooled boto3 client for service in the region and account of the resource, default to this instance's service"""
 
-        return True
+        Session, SessionKey = aws.account.GetAccountSession(self.Account)
+        return aws.client.GetClient(Service if Service != None else self.Service, self.GetRegion(), Session, SessionKey)
 
-    def AddTagsToResource(self, ResourceId, TagName, TagValue):
-        """Update tags using boto3 method add_tags_to_resource()"""
-
-        Client = boto3.client(self.Service)
-
-        if self.Service == 'rds':
-            response = Client.add_tags_to_resource (
-                ResourceName = ResourceId,
-                Tags = [
-                    {
-                        'Key': TagName,
-                        'Value': TagValue
-		    }
-		]
-	    )
-        elif self.Service == 'elasticache':
-            response = Client.add_tags_to_resource (
-                ResourceName = ResourceId,
-                Tags = [
-                    {
-                        'Key': TagName,
-                        'Value': TagValue
-		    }
-		]
-	    )
-        elif self.Service == 'ds':
-            response = Client.add_tags_to_resource (
-                ResourceId = ResourceId,
-                Tags = [
-                    {
-                        'Key': TagName,
-                        'Value': TagValue
-		    }
-		]
-	    )
-        else:
-            raise TagNotSupportedError(str(self.Service))
 
-        return True
+    def GetServicesCount(self):
+        """Return number of supported services"""
 
-    def GetElbName(self, ResourceId):
-        """Return elb name"""
+        return len(aws.registry.Services)
 
-        LbName = ResourceId.split(':')[-1].split('/')
-        if ResourceId.find('elasticloadbalancing') != -1 and len(LbName) == 2:
-            return LbName[-1]
-        else:
-            return None
 
     def GetSnapshotId(self, ResourceId):
         """Return snapshot id"""
 
-        return ResourceId.split(':')[-1].split('/')[-1]
-
-    def AddTags(self, ResourceId, TagName, TagValue):
-        """Update tags using boto3 method add_tags()"""
-
-        Client = boto3.client(self.Service)
-
-        ### get sanitized resource id
-        ResourceId = self.GetSanitizedResourceId(ResourceId)
-
-        if self.Service == 'es':
-            response = Client.add_tags (
-                ARN = ResourceId,
-                TagList = [
-		    {
-                        'Key': TagName,
-                        'Value': TagValue
-		    }
-                ]
-	    )
-        elif self.Service == 'emr':
-            response = Client.add_tags (
-                ResourceId = ResourceId,
-                Tags = [
-		    {
-                        'Key': TagName,
-                        'Value': TagValue
-		    }
-                ]
-	    )
-        elif self.Service == 'cloudtrail':
-            response = Client.add_tags (
-                ResourceId = ResourceId,
-                TagsList = [
-		    {
-                        'Key': TagName,
-                        'Value': TagValue
-		    }
-                ]
-	    )
-        elif self.Service == 'sagemaker':
-            response = Client.add_tags (
-                ResourceArn = ResourceId,
-                Tags = [
-		    {
-                        'Key': TagName,
-                        'Value': TagValue
-		    }
-                ]
-	    )
-        elif self.Service == 'datapipeline':
-            response = Client.add_tags (
-                pipelineId = ResourceId,
-                tags = [
-		    {
-                        'Key': TagName,
-                        'Value': TagValue
-		    }
-                ]
-	    )
-        elif self.Service == 'elb':
-            response = Client.add_tags (
-                LoadBalancerNames = [ResourceId],
-                Tags = [
-	            {
-                        'Key': TagName,
-                        'Value': TagValue
-	            }
-                ]
-	    )
-        elif self.Service == 'elbv2':
-            response = Client.add_tags (
-                ResourceArns =  [ResourceId],
-                Tags = [
-	            {
-                        'Key': TagName,
-                        'Value': TagValue
-		    }
-                ]
-	    )
-        else:
-            raise TagNotSupportedError(str(self.Service))
-
-        return True
-
+        return aws.arn.Parse(ResourceId).Id
 
     def IsEc2Snapshot(self, ResourceId):
         """Return True if ec2 snapshot otherwise False"""
 
-        if ResourceId.find('snapshot') != -1:
-            return True
-        else:
-            return False
-
+        return aws.arn.Parse(ResourceId).Type == 'snapshot'
 
-    def GetEc2ResourceId(self, ResourceId):
-        """Return name or id of ec2 arn"""
-
-        ### all ec2 resources (snapshots, internet gateway, nat gateway, etc...) uses id or name
-        return ResourceId.split(':')[-1].split('/')[-1]
 
     def IsNatGateway(self, ResourceId):
         """Return True if nat gateway otherwise False"""
 
-        if ResourceId.find('natgateway') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'natgateway'
 
     def IsCustomerGateway(self, ResourceId):
         """Return True if customer gateway otherwise False"""
 
-        if ResourceId.find('customer-gateway') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'customer-gateway'
 
     def IsDedicatedHost(self, ResourceId):
         """Return True if dedicated host otherwise False"""
 
-        if ResourceId.find('dedicated-host') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'dedicated-host'
 
     def IsDhcpOptions(self, ResourceId):
         """Return True if dhcp options otherwise False"""
 
-        if ResourceId.find('dhcp-options') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'dhcp-options'
 
     def IsEgressIgw(self, ResourceId):
         """Return True if egress internet gateway otherwise False"""
 
-        if ResourceId.find('egress-only-internet-gateway') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'egress-only-internet-gateway'
 
     def IsElasticGpu(self, ResourceId):
         """Return True if elastic gpu otherwise False"""
 
-        if ResourceId.find('elastic-gpu') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'elastic-gpu'
 
     def IsEc2Image(self, ResourceId):
         """Return True if ec2 image otherwise False"""
 
-        if ResourceId.find('image') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'image'
 
     def IsEc2Instance(self, ResourceId):
         """Return True if ec2 instance otherwise False"""
 
-        if ResourceId.find('instance') != -1 and ResourceId.split(':')[-1].split('/')[0] == 'instance':
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'instance'
 
     def IsEc2InstanceProfile(self, ResourceId):
         """Return True if ec2 instance profile otherwise False"""
 
-        if ResourceId.find('instance-profile') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'instance-profile'
 
     def IsInternetGateway(self, ResourceId):
         """Return True if internet gateway otherwise False"""
 
-        if ResourceId.find('internet-gateway') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'internet-gateway'
 
     def IsEc2KeyPair(self, ResourceId):
         """Return True if ec2 keypair otherwise False"""
 
-        if ResourceId.find('key-pair') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'key-pair'
 
     def IsLaunchTemplate(self, ResourceId):
         """Return True if launch template otherwise False"""
 
-        if ResourceId.find('launch-template') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'launch-template'
 
     def IsNacl(self, ResourceId):
         """Return True if network acl otherwise False"""
 
-        if ResourceId.find('network-acl') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'network-acl'
 
     def IsEni(self, ResourceId):
         """Return True if eni otherwise False"""
 
-        if ResourceId.find('network-interface') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'network-interface'
 
     def IsPlacementGroup(self, ResourceId):
         """Return True if placement group otherwise False"""
 
-        if ResourceId.find('placement-group') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'placement-group'
 
     def IsReservedInstance(self, ResourceId):
         """Return True if reserved instance otherwise False"""
 
-        if ResourceId.find('reserved-instances') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'reserved-instances'
 
     def IsRouteTable(self, ResourceId):
         """Return True if route table otherwise False"""
 
-        if ResourceId.find('route-table') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'route-table'
 
     def IsSecurityGroup(self, ResourceId):
         """Return True if security group otherwise False"""
 
-        if ResourceId.find('security-group') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'security-group'
 
     def IsSpotInstanceRequest(self, ResourceId):
         """Return True if spot instance request otherwise False"""
 
-        if ResourceId.find('spot-instances-request') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'spot-instances-request'
 
     def IsSubnet(self, ResourceId):
         """Return True if subnet otherwise False"""
 
-        if ResourceId.find('subnet') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'subnet'
 
     def IsEc2Volume(self, ResourceId):
         """Return True if ec2 volume otherwise False"""
 
-        if ResourceId.find('volume') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'volume'
 
     def IsVpc(self, ResourceId):
         """Return True if vpc otherwise False"""
 
-        if ResourceId.find('vpc') != -1 and ResourceId.split(':')[-1].split('/')[0] == 'vpc':
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'vpc'
 
     def IsVpcPeeringConnection(self, ResourceId):
         """Return True if vpc peering connection otherwise False"""
 
-        if ResourceId.find('vpc-peering-connection') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'vpc-peering-connection'
 
     def IsVpnConnection(self, ResourceId):
         """Return True if vpn connection otherwise False"""
 
-        if ResourceId.find('vpn-connection') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'vpn-connection'
 
     def IsVpnGateway(self, ResourceId):
         """Return True if vpn gateway otherwise False"""
 
-        if ResourceId.find('vpn-gateway') != -1:
-            return True
-        else:
-            return False
+        return aws.arn.Parse(ResourceId).Type == 'vpn-gateway'
 
-    def CreateTags(self, ResourceId, TagName, TagValue):
-        """Update tags using boto3 method create_tags()"""
+    def WriteTags(self, ResourceId, Tags):
+        """Write tags of a resource with the operation of its service, Tags is dictionary of TagName: TagValue"""
 
-        Client = boto3.client(self.Service)
+        if self.Descriptor.WriteHandler != None:
+            return getattr(self, self.Descriptor.WriteHandler)(ResourceId, Tags)
 
-        ### get sanitized resource id
-        ResourceId = self.GetSanitizedResourceId(ResourceId)
-
-        if self.Service == 'ec2':
-            response = Client.create_tags(
-                Resources = [
-		    ResourceId
-		],
-		Tags = [
-                    {
-		        'Key': TagName,
-		        'Value': TagValue
-                    }
-		]
-	    )
-        elif self.Service == 'efs':
-
-            response = Client.create_tags(
-                FileSystemId = ResourceId,
-		Tags = [
-                    {
-		        'Key': TagName,
-		        'Value': TagValue
-                    }
-		]
-	    )
-        elif self.Service == 'redshift':
-            response = Client.create_tags(
-                ResourceName = ResourceId,
-		Tags = [
-                    {
-		        'Key': TagName,
-		        'Value': TagValue
-                    }
-		]
-	    )
-        elif self.Service == 'workspaces':
-            response = Client.create_tags(
-                ResourceId = ResourceId,
-		Tags = [
-                    {
-		        'Key': TagName,
-		        'Value': TagValue
-                    }
-		]
-	    )
-        else:
-            raise TagNotSupportedError(str(self.Service))
+        Operation, Params = self.Descriptor.Write
+        response = getattr(self.GetClient(), Operation)(**Params(self.GetSanitizedResourceId(ResourceId), Tags))
 
         return True
 
-    def PutBucketTagging(self, ResourceId, TagName, TagValue):
-        """Update s3 service tag"""
-        Client = boto3.client('s3')
+    def PutBucketTagging(self, ResourceId, Tags):
+        """Update s3 service tags, Tags is dictionary of TagName: TagValue
 
-        ### get sanitized resource id
-        ResourceId = self.GetSanitizedResourceId(ResourceId)
+        put_bucket_tagging replaces the whole tag set, so the current tags are read from aws, not
+        the cache, and merged with Tags while holding the lock of the bucket. That is one read and
+        one write per bucket, and concurrent updates of a bucket cannot drop each other's tags."""
 
-        response = {}
-        try:
-            response = Client.get_bucket_tagging (
-                Bucket = ResourceId
-	    )
-        except Exception as e:
-            if str(e).find('NoSuchTagSet') == -1:
-                return False
-
-        if 'TagSet' not in response:
-            Tags = []
-            Tags.append (
-                {
-                    'Key': TagName,
-                    'Value': TagValue
-                }
-            )
-        else:
-            Tags = response['TagSet']
-
-            ### if tag exists, replace tag value; otherwise, append tag
-            if IsTagExists(self.Service, ResourceId, TagName):
-                for Tag in Tags:
-                    if Tag['Key'] == TagName:
-                        Tag['Value'] = TagValue
-            else:
-                Tags.append (
-                    {
-                        'Key': TagName,
-                        'Value': TagValue
-                    }
-                )
-           
-        response = Client.put_bucket_tagging (
-            Bucket = ResourceId,
-            Tagging = {
-                'TagSet': Tags
-	    }
-        )
-
-
-        return True
-
-    def GetLogGroupName(self, ResourceId):
-        """Return log group name"""
-
-        return ResourceId.split(':')[-1]
-
-    def TagLogGroup(self, ResourceId, TagName, TagValue):
-        """Update cloudwatch logs service tag"""
-        Client = boto3.client('logs')
-
-        response = Client.tag_log_group(
-            logGroupName = self.GetSanitizedResourceId(ResourceId),
-            tags = {
-	        TagName: TagValue
-            }
-	)
-
-        return True
-
-    def AddTagsToVault(self, ResourceId, TagName, TagValue):
-        """Update glacier service tag"""
-        Client = boto3.client('glacier')
-
-        response = Client.add_tags_to_vault(
-            vaultName = self.GetSanitizedResourceId(ResourceId),
-            Tags = {
-	            TagName: TagValue
-            }
-	)
-
-        return True
-
-    def AddTagsToStream(self, ResourceId, TagName, TagValue):
-        """Update kinesis service tag"""
-        Client = boto3.client('kinesis')
-
-        response = Client.add_tags_to_stream(
-            StreamName = self.GetSanitizedResourceId(ResourceId),
-            Tags = {
-	            TagName: TagValue
-            }
-	)
-
-        return True
+        Client = self.GetClient('s3')
+        Key = self.GetCacheKey(ResourceId)
 
-    def TagQueue(self, ResourceId, TagName, TagValue):
-        """Update sqs service tag"""
-        Client = boto3.client('sqs')
+        with GetResourceLock(self.GetWriteKey(ResourceId)):
+            TagSet = self.ReadTags(ResourceId)
+            TagSet.update(Tags)
 
-        response = Client.tag_queue(
-            QueueUrl = self.GetSanitizedResourceId(ResourceId),
-            Tags = [
-                {
-	            TagName: TagValue
+            response = Client.put_bucket_tagging (
+                Bucket = self.GetSanitizedResourceId(ResourceId),
+                Tagging = {
+                    'TagSet': [{'Key': K, 'Value': V} for K,V in TagSet.items()]
                 }
-	    ]
-	)
-
-        return True
-
-    def ChangeTagsForResource(self, ResourceId, TagName, TagValue):
-        """Update route53 service tag"""
-
-        Client = boto3.client('route53')
-
-        response = Client.change_tags_for_resource ( 
-            ResourceType = 'hostedzone',
-            ResourceId = self.GetSanitizedResourceId(ResourceId),
-            AddTags = [
-	        {
-		    'Key': TagName,
-		    'Value': TagValue
-		}
-	    ]
-	)
+            )
+            aws.cache.Tags.Put(Key, TagSet)
+            aws.store.PutTags(Key, TagSet)
 
         return True
 
-    def TagDeliveryStream(self, ResourceId, TagName, TagValue):
-        """Update firehose service tag"""
-
-        Client = boto3.client('firehose')
+    def UpdateTags(self, ResourceId, Tags):
+        """Update all tags of a resource in one request, Tags is dictionary of TagName: TagValue"""
 
-        response = Client.tag_delivery_stream(
-	    DeliveryStreamName = self.GetSanitizedResourceId(ResourceId),
-	    Tags = [
-	        {
-		    'Key': TagName,
-		    'Value': TagValue
-		}
-	    ]
-	)
+        self.WriteTags(ResourceId, Tags)
+        aws.cache.Tags.Update(self.GetCacheKey(ResourceId), Tags)
+        aws.store.UpdateTags(self.GetCacheKey(ResourceId), Tags)
 
         return True
 
     def UpdateTag(self, ResourceId, TagName, TagValue):
-        """Calls other methods to update tags"""
-
-        try:
-            if self.Service == 'ec2':
-                response = self.CreateTags(ResourceId, TagName, TagValue)
-            elif self.Service == 'elb':
-                response = self.AddTags(ResourceId, TagName, TagValue)
-            elif self.Service == 'elbv2':
-                response = self.AddTags(ResourceId, TagName, TagValue)
-            elif self.Service == 's3':
-                response = self.PutBucketTagging(ResourceId, TagName, TagValue)
-            elif self.Service == 'lambda':
-                response = self.TagResource(ResourceId, TagName, TagValue)
-            elif self.Service == 'logs':
-                response = self.TagLogGroup(ResourceId, TagName, TagValue)
-            elif self.Service == 'rds':
-                response = self.AddTagsToResource(ResourceId, TagName, TagValue)
-            elif self.Service == 'es':
-                response = self.AddTags(ResourceId, TagName, TagValue)
-            elif self.Service == 'emr':
-                response = self.AddTags(ResourceId, TagName, TagValue)
-            elif self.Service == 'dynamodb':
-                response = self.TagResource(ResourceId, TagName, TagValue)
-            elif self.Service == 'firehose':
-                response = self.TagDeliveryStream(ResourceId, TagName, TagValue)
-            elif self.Service == 'glacier':
-                response = self.AddTagsToVault(ResourceId, TagName, TagValue)
-            elif self.Service == 'kms':
-                response = self.TagResource(ResourceId, TagName, TagValue)
-            elif self.Service == 'apigateway':
-                response = self.TagResource(ResourceId, TagName, TagValue)
-            elif self.Service == 'kinesis':
-                response = self.AddTagsToStream(ResourceId, TagName, TagValue)
-            elif self.Service == 'cloudtrail':
-                response = self.AddTags(ResourceId, TagName, TagValue)
-            elif self.Service == 'sqs':
-                response = self.TagQueue(ResourceId, TagName, TagValue)
-            elif self.Service == 'secretsmanager':
-                response = self.TagResource(ResourceId, TagName, TagValue)
-            elif self.Service == 'cloudfront':
-                response = self.TagResource(ResourceId, TagName, TagValue)
-            elif self.Service == 'efs':
-                response = self.CreateTags(ResourceId, TagName, TagValue)
-            elif self.Service == 'sagemaker':
-                response = self.AddTags(ResourceId, TagName, TagValue)
-            elif self.Service == 'redshift':
-                response = self.CreateTags(ResourceId, TagName, TagValue)
-            elif self.Service == 'elasticache':
-                response = self.AddTagsToResource(ResourceId, TagName, TagValue)
-            elif self.Service == 'workspaces':
-                response = self.CreateTags(ResourceId, TagName, TagValue)
-            elif self.Service == 'ds':
-                response = self.AddTagsToResource(ResourceId, TagName, TagValue)
-            elif self.Service == 'dax':
-                response = self.TagResource(ResourceId, TagName, TagValue)
-            elif self.Service == 'route53':
-                response = self.ChangeTagsForResource(ResourceId, TagName, TagValue)
-            elif self.Service == 'directconnect':
-                response = self.TagResource(ResourceId, TagName, TagValue)
-            elif self.Service == 'datapipeline':
-                response = self.AddTags(ResourceId, TagName, TagValue)
-            else:
-                raise TagNotSupportedError(self.Service)
-        except Exception as e:
-            raise e
-
-        return True
-
-    def GetSanitizedResourceId(self, ResourceId):
-        """Return the sanitized resource id"""
-
-        ### list services that does not required sanitization
-        NotRequired = ['elbv2', 's3', 'lambda', 'rds', 'es', 'dynamodb', 'kms', 'apigateway', \
-	               'cloudtrail', 'sqs', 'secretsmanager', 'cloudfront', 'sagemaker', 'redshift', \
-		       'elasticache', 'workspaces', 'ds', 'dax', 'route53', 'directconnect', \
-		       'datapipeline']
-       
-        try:
-            if self.Service in NotRequired:
-                return ResourceId
-            elif self.Service == 'elb':
-                return self.GetElbName(ResourceId)
-            elif self.Service == 'ec2':
-                return self.GetEc2ResourceId(ResourceId)
-            elif self.Service == 'logs':
-                return self.GetLogGroupName(ResourceId)
-            elif self.Service == 'emr':
-                return self.GetEmrClusterId(ResourceId)
-            elif self.Service == 'firehose':
-                return self.GetDeliveryStreamName(ResourceId)
-            elif self.Service == 'glacier':
-                return self.GetVaultName(ResourceId)
-            elif self.Service == 'kinesis':
-                return self.GetStreamName(ResourceId)
-            elif self.Service == 'efs':
-                return self.GetFileSystemId(ResourceId)
-            else:
-                raise TagNotSupportedError(self.Service)
-        except Exception as e:
-            raise e
-
-        return ResourceId
+        """Update a single tag"""
 
-    def GetFileSystemId(self, ResourceId):
-        """Return efs filesystem id"""
+        return self.UpdateTags(ResourceId, {TagName: TagValue})
 
-        return ResourceId.split(':')[-1].split('/')[-1]
+    def TagResources(self, ResourceArns, Tags):
+        """Update tags for up to 20 arns using resource groups tagging api tag_resources()
 
-    def DescribeTags(self, ResourceId):
-        """Get tags using boto3 method describe_tags()"""
+        Return dictionary of failed arn to error message"""
 
-        Client = boto3.client(self.Service) 
+        Client = self.GetClient('resourcegroupstaggingapi')
 
-        ### get sanitized resource id
-        ResourceId = self.GetSanitizedResourceId(ResourceId)
-        
-        if self.Service == 'elb':
-            response = Client.describe_tags (
-                LoadBalancerNames = [ResourceId]
-	    )
-        elif self.Service == 'elbv2':
-            response = Client.describe_tags (
-                ResourceArns = [ResourceId]
-	    )
-        elif self.Service == 'ec2':
-            response = Client.describe_tags (
-                Filters = [
-	            {
-                        'Name': 'resource-id',
-	                'Values': [
-	                    ResourceId
-	                ]
-		    }
-	        ]
-	    )
-        elif self.Service == 'efs':
-
-            response = Client.describe_tags (
-                FileSystemId = ResourceId
-	    )
-        elif self.Service == 'redshift':
-            response = Client.describe_tags (
-                ResourceName = ResourceId
-            )
-        elif self.Service == 'workspaces':
-            response = Client.describe_tags (
-                ResourceId = ResourceId
-            )
-        elif self.Service == 'directconnect':
-            response = Client.describe_tags (
-                resourceArns = [
-                    ResourceId
-		]
-            )
-        else:
-            raise TagNotSupportedError(self.Service)
-
-        return response
+        response = Client.tag_resources (
+            ResourceARNList = ResourceArns,
+            Tags = Tags
+        )
 
+        return {Arn: aws.metrics.ErrorMessage(Failure.get('ErrorCode', '') + ': ' + Failure.get('ErrorMessage', ''), \
+                                              Failure.get('ErrorCode')) for Arn, Failure in response.get('FailedResourcesMap', {}).items()}
 
-    def GetBucketTagging(self, ResourceId):
-        """Get tags using boto3 method get_bucket_tagging()"""
-   
-        Client = boto3.client('s3') 
+    def BatchWrite(self, ResourceIds, Tags):
+        """Update tags for many resources in one native batch call
 
-        response = Client.get_bucket_tagging (
-            Bucket = self.GetSanitizedResourceId(ResourceId)
-	)
+        Return dictionary of failed resource id to error message, always empty: these apis succeed
+        or fail as a whole and raise for the batch when one id is bad, see WriteBatch()"""
 
-        return response
-
-
-    def ListTags(self, ResourceId):
-        """Get tags using boto3 method list_tags()"""
-   
-        Client = boto3.client(self.Service) 
-
-        ### get sanitized resource id
-        ResourceId = self.GetSanitizedResourceId(ResourceId)
-
-        if self.Service == 's3':
-            response = Client.list_tags (
-                Bucket = ResourceId
-	    )
-        elif self.Service == 'es':
-            response = Client.list_tags (
-                ARN = ResourceId
-	    )
-        elif self.Service == 'cloudtrail':
-            response = Client.list_tags (
-                ResourceIdList = [
-                    ResourceId
-		]
-	    )
-        elif self.Service == 'sagemaker':
-            response = Client.list_tags (
-                ResourceArn = ResourceId
-	    )
-        elif self.Service == 'dax':
-            response = Client.list_tags (
-                ResourceName = ResourceId
-	    )
-        elif self.Service == 'lambda':
-            response = Client.list_tags (
-                Resource = ResourceId
-	    )
-        else:
+        if self.Descriptor.Batch == None:
             raise TagNotSupportedError(self.Service)
-       
-        return response
-
-    def ListTagsLogGroup(self, ResourceId):
-        """Get tags using boto3 method list_tags_log_group()"""
-   
-        Client = boto3.client('logs') 
 
-        response = Client.list_tags_log_group (
-            logGroupName = self.GetSanitizedResourceId(ResourceId)
-	)
-
-        return response
-
-
-    def ListTagsForResource(self, ResourceId):
-        """Get tags using boto3 method list_tags_for_resource()"""
-
-        Client = boto3.client(self.Service) 
-        
-        ### get sanitized resource id
-        ResourceId = self.GetSanitizedResourceId(ResourceId)
-
-        if self.Service == 's3':
-            response = Client.list_tags_for_resource (
-                ResourceName = ResourceId
-	    )
-        elif self.Service == 'cloudfront':
-            response = Client.list_tags_for_resource (
-                Resource = ResourceId
-	    )
-        elif self.Service == 'elasticache':
-            response = Client.list_tags_for_resource (
-                ResourceName = ResourceId
-            )
-        elif self.Service == 'ds':
-            response = Client.list_tags_for_resource (
-                ResourceId = ResourceId
-            )
-        elif self.Service == 'route53':
-            response = Client.list_tags_for_resource (
-                ResourceType = 'hostedzone',
-                ResourceId = ResourceId
-            )
-        elif self.Service == 'rds':
-            response = Client.list_tags_for_resource (
-                ResourceName = ResourceId
-            )
-        else:
-            raise TagNotSupportedError(self.Service)
+        Operation, Limit, Params = self.Descriptor.Batch
+        response = getattr(self.GetClient(), Operation)(**Params([self.GetSanitizedResourceId(ResourceId) \
+                                                                  for ResourceId in ResourceIds], Tags))
 
-        return response
+        return {}
 
+    def WriteBatch(self, ResourceIds, Tags):
+        """Update tags of a batch with BatchWrite() or TagResources() and return dictionary of failed resource id to error message
 
-    def ListTagsOfResource(self, ResourceId):
-        """Get tags using boto3 method list_tags_of_resource()"""
+        A batch fails as a whole when one id is bad, i.e. an ec2 instance that no longer exists,
+        so a failed batch is split in halves until only the bad ids fail. Errors that fail every
+        id alike, such as throttling or access denied, fail the batch without splitting."""
 
-        Client = boto3.client('dynamodb')
-        
-        response = Client.list_tags_of_resource (
-            ResourceArn = self.GetSanitizedResourceId(ResourceId)
-	)
-
-        return response
-
-
-    def GetVaultName(self, ResourceId):
-        """Return glacier vault name"""
-
-        return ResourceId.split(':')[-1].split('/')[-1]
-
-    def ListTagsForVault(self, ResourceId):
-        """Get tags using boto3 method list_tags_for_vault()"""
-
-        Client = boto3.client('glacier')
-
-        response = Client.list_tags_for_vault (
-            vaultName = self.GetSanitizedResourceId(ResourceId)
-	)
-
-        return response
-
-
-    def ListResourceTags(self, ResourceId):
-        """Get tags using boto3 method list_resource_tags()"""
-
-        Client = boto3.client('kms')
-        
-        response = Client.list_resource_tags (
-            KeyId = self.GetSanitizedResourceId(ResourceId)
-	)
-
-        return response
-
-
-    def GetStreamName(self, ResourceId):
-        """Return kinesis data stream name"""
-
-        return ResourceId.split(':')[-1].split('/')[-1]
-
-    def ListTagsForStream(self, ResourceId):
-        """Get tags using boto3 method list_tags_for_stream()"""
-
-        Client = boto3.client('kinesis')
-
-        response = Client.list_tags_for_stream (
-            StreamName = self.GetSanitizedResourceId(ResourceId)
-	)
-
-        return response
-
-
-    def ListQueueTags(self, ResourceId):
-        """Get tags using boto3 method list_queue_tags()"""
-
-        Client = boto3.client('sqs')
-        
-        response = Client.list_queue_tags (
-            QueueUrl = self.GetSanitizedResourceId(ResourceId)
-	)
-
-        return response
-
-    def GetDeliveryStreamName(self, ResourceId):
-        """Return firehose delivery stream name"""
-
-        return ResourceId.split(':')[-1].split('/')[-1]
-
-    def ListTagsForDeliveryStream(self, ResourceId):
-        """Get tags using boto3 method list_tags_for_delivery_stream()"""
-
-        Client = boto3.client('firehose')
-
-        response = Client.list_tags_for_delivery_stream (
-            DeliveryStreamName = self.GetSanitizedResourceId(ResourceId)
-	)
-
-        return response
-
-
-    def DescribeSecret(self, ResourceId):
-        """Get tags using boto3 method describe_secret()"""
-
-        Client = boto3.client('secretsmanager')
-        
-        response = Client.describe_secret (
-            SecretId = self.GetSanitizedResourceId(ResourceId)
-	)
+        try:
+            if self.Descriptor.Batch != None:
+                return self.BatchWrite(ResourceIds, Tags)
+            return self.TagResources(ResourceIds, Tags)
+        except Exception as e:
+            Error = aws.metrics.ErrorMessage(e)
+            if len(ResourceIds) == 1 or Error.Code == None or Error.Code in BatchWideErrors:
+                return {ResourceId: Error for ResourceId in ResourceIds}
+
+        Half = len(ResourceIds) // 2
+        Failed = self.WriteBatch(ResourceIds[:Half], Tags)
+        Failed.update(self.WriteBatch(ResourceIds[Half:], Tags))
+
+        return Failed
+
+    def IsTaggingApiResource(self, ResourceId):
+        """Return True if resource can be tagged with resource groups tagging api otherwise False"""
+
+        return self.Descriptor.TaggingApi and aws.arn.Parse(ResourceId).IsArn()
+
+    def BulkUpdateTags(self, Requests):
+        """Update tags for many resources of this service using the largest batch each api allows
+
+        Requests is list of (ResourceId, {TagName: TagValue}) where ResourceId may be a
+        ResourceRef. Return list of (ResourceId, Succeeded, Error) in the same order as Requests."""
+
+        Results = [None] * len(Requests)
+
+        ### a write that replaces the tag set reads it first, so send all tags of a resource in one write
+        if self.Descriptor.ReplacesTagSet:
+            Merged = {}
+            for i, (ResourceId, Tags) in enumerate(Requests):
+                Entry = Merged.setdefault(self.GetWriteKey(ResourceId), (ResourceId, {}, []))
+                Entry[1].update(Tags)
+                Entry[2].append(i)
+            for ResourceId, Tags, Positions in Merged.values():
+                try:
+                    self.UpdateTags(ResourceId, Tags)
+                    Result = (True, None)
+                except Exception as e:
+                    Result = (False, aws.metrics.ErrorMessage(e))
+                for i in Positions:
+                    Results[i] = (Requests[i][0],) + Result
+            return Results
+
+        ### group requests with identical tag sets and the same api so they can share a call
+        Groups = {}
+        for i, (ResourceId, Tags) in enumerate(Requests):
+            if self.Descriptor.Batch != None:
+                Limit = self.Descriptor.Batch[1]
+            elif self.IsTaggingApiResource(ResourceId):
+                Limit = aws.registry.TaggingApiBatchLimit
+            else:
+                Limit = 1
+            Groups.setdefault((Limit, tuple(sorted(Tags.items()))), []).append(i)
+
+        for (Limit, TagItems), Positions in Groups.items():
+            Tags = dict(TagItems)
+
+            ### no batch api, so update one resource at a time
+            if Limit == 1:
+                for i in Positions:
+                    ResourceId = Requests[i][0]
+                    try:
+                        self.UpdateTags(ResourceId, Tags)
+                        Results[i] = (ResourceId, True, None)
+                    except Exception as e:
+                        Results[i] = (ResourceId, False, aws.metrics.ErrorMessage(e))
+                continue
+
+            for j in range(0, len(Positions), Limit):
+                Batch = Positions[j:j + Limit]
+                ResourceIds = list(dict.fromkeys([aws.arn.Parse(Requests[i][0]).ResourceId for i in Batch]))
+                Failed = self.WriteBatch(ResourceIds, Tags)
+
+                for i in Batch:
+                    ResourceId = Requests[i][0]
+                    Key = aws.arn.Parse(ResourceId).ResourceId
+                    Results[i] = (ResourceId, Key not in Failed, Failed.get(Key))
+                    if Key not in Failed:
+                        aws.cache.Tags.Update(self.GetCacheKey(ResourceId), Tags)
+                        aws.store.UpdateTags(self.GetCacheKey(ResourceId), Tags)
+
+        return Results
 
-        return response
+    def GetSanitizedResourceId(self, ResourceId):
+        """Return the resource id in the form the service api expects"""
 
-    def GetEmrClusterId(self, ResourceId):
-        """Return emr cluster id"""
+        Ref = aws.arn.Parse(ResourceId)
+        if self.Descriptor.Sanitize == None:
+            return Ref.ResourceId
 
-        return ResourceId.split(':')[-1].split('/')[-1]
+        return self.Descriptor.Sanitize(Ref)
 
+    def ReadTags(self, ResourceId):
+        """Read all tags of a resource from aws and return them as dictionary of TagName: TagValue"""
 
-    def DescribeCluster(self, ResourceId):
-        """Get tags using boto3 method describe_cluster()"""
+        Operation, Params, Extract = self.Descriptor.Read
 
-        Client = boto3.client('emr')
-        
-        response = Client.describe_cluster (
-            ClusterId = self.GetSanitizedResourceId(ResourceId)
-	)
+        try:
+            response = getattr(self.GetClient(), Operation)(**Params(self.GetSanitizedResourceId(ResourceId)))
+        except ClientError as c:
+            ### some apis raise an error instead of returning an empty tag set, i.e. s3 NoSuchTagSet
+            if c.response.get('Error', {}).get('Code') in self.Descriptor.EmptyErrors:
+                return {}
+            raise c
 
-        return response
+        return Extract(response)
 
+    def GetCacheKey(self, ResourceId):
+        """Return the key of a resource in the tag cache as (Service, ResourceId, Account, Region)
 
-    def DescribePipelines(self, ResourceId):
-        """Get tags using boto3 method describe_pipelines()"""
+        Names such as log groups repeat across accounts and regions, so the key holds the account
+        and the region of the resource: the region of its arn, otherwise the region of this
+        instance, or the default region."""
 
-        Client = boto3.client('datapipeline')
-        
-        response = Client.describe_cluster (
-            pipelineIds = [
-                self.GetSanitizedResourceId(ResourceId)
-            ]
-	)
+        Ref = aws.arn.Parse(ResourceId)
+        return (self.Service, Ref.ResourceId, self.Account, Ref.Region or self.GetRegion() or aws.region.GetDefaultRegion())
 
-        return response
+    def GetWriteKey(self, ResourceId):
+        """Return the key of a resource as the api sees it, so every spelling of a resource, i.e. arn:aws:s3:::b and b,
+        shares one merge and one lock"""
 
+        return (self.Service, self.GetSanitizedResourceId(ResourceId), self.Account)
 
-    def GetTags(self, ResourceId):
-        """Get tags using boto3 method get_tags()"""
+    def GetAllTags(self, ResourceId):
+        """Return all tags of a resource as dictionary, reading each resource at most once per cache ttl
 
-        Client = boto3.client('apigateway')
-        
-        response = Client.get_tags (
-            resourceArn = self.GetSanitizedResourceId(ResourceId)
-	)
+        With an inventory store open, tags seen within the store ttl are read from it instead of aws"""
 
-        return response
+        Key = self.GetCacheKey(ResourceId)
+        Tags = aws.cache.Tags.Get(Key)
+        if Tags == None:
+            Tags = aws.store.GetTags(Key)
+            if Tags == None:
+                Tags = self.ReadTags(ResourceId)
+                aws.store.PutTags(Key, Tags)
+            aws.cache.Tags.Put(Key, Tags)
 
+        return Tags
 
     def IsTagExists(self, ResourceId, TagName):
-        """Calls other methods to check if tag exists"""
+        """Check if tag exists"""
 
-        try:
-            if self.Service == 'elb' or self.Service == 'elbv2':
-                response = self.DescribeTags(ResourceId)
-                return True if len(list(filter(lambda TagKey: TagKey == TagName , [Tag['Key'] for Tag in [TD['Tags'] for TD in response['TagDescriptions']][0]]))) == 1 else False
-            elif self.Service == 'ec2':
-                response = self.DescribeTags(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['Tags']])) else False
-            elif self.Service == 's3':
-                response = self.GetBucketTagging(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['TagSet']])) else False
-            elif self.Service == 'lambda':
-                response = self.ListTags(ResourceId)
-                return True if TagName in [x for x in response['Tags']] else False
-            elif self.Service == 'logs':
-                response = self.ListTagsLogGroup(ResourceId)
-                return True if TagName in [x for x in response['tags']] else False
-            elif self.Service == 'rds':
-                response = self.ListTagsForResource(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['TagList']])) else False
-            elif self.Service == 'es':
-                response = self.ListTags(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['TagList']])) else False
-            elif self.Service == 'emr':
-                response = self.DescribeCluster(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [Tag for Tag in response['Cluster']['Tags']])) else False
-            elif self.Service == 'dynamodb':
-                response = self.ListTagsOfResource(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['Tags']])) else False
-            elif self.Service == 'firehose':
-                response = self.ListTagsForDeliveryStream(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['Tags']])) else False
-            elif self.Service == 'glacier':
-                response = self.ListTagsForVault(ResourceId)
-                return True if TagName in [x for x in response['Tags']] else False
-            elif self.Service == 'kms':
-                response = self.ListResourceTags(ResourceId)
-                return True if TagName in list(map(lambda x: x['TagKey'], [x for x in response['Tags']])) else False
-            elif self.Service == 'apigateway':
-                response = self.GetTags(ResourceId)
-                return True if len([x for x in response['tags'] if x == TagName]) == 1 else False
-            elif self.Service == 'kinesis':
-                response = self.ListTagsForStream(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['Tags']])) else False
-            elif self.Service == 'cloudtrail':
-                response = self.ListTags(ResourceId)
-                return True if len(list(filter(lambda TagKey: TagKey == TagName , [Tag['Key'] for Tag in [TD['TagsList'] for TD in response['ResourceTagList']][0]]))) == 1 else False
-            elif self.Service == 'sqs':
-                response = self.ListTags(ResourceId)
-                return True if TagName in [x for x in response['Tags']] else False
-            elif self.Service == 'secretsmanager':
-                response = self.DescribeSecret(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['Tags']])) else False
-            elif self.Service == 'cloudfront':
-                response = self.ListTagsForResource(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['Tags']])) else False
-            elif self.Service == 'efs':
-                response = self.DescribeTags(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['Tags']])) else False
-            elif self.Service == 'sagemaker':
-                response = self.ListTags(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['Tags']])) else False
-            elif self.Service == 'redshift':
-                response = self.DescribeTags(ResourceId)
-                return True if TagName in [Tag['Key'] for Tag in [TR['Tag'] for TR in response['TaggedResources']]] else False
-            elif self.Service == 'elasticache':
-                response = self.ListTagsForResource(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['TagList']])) else False
-            elif self.Service == 'workspaces':
-                response = self.DescribeTags(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['Tags']])) else False
-            elif self.Service == 'ds':
-                response = self.ListTagsForResource(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['Tags']])) else False
-            elif self.Service == 'dax':
-                response = self.ListTags(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['Tags']])) else False
-            elif self.Service == 'route53':
-                response = self.ListTagsForResource(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['Tags']])) else False
-            elif self.Service == 'directconnect':
-                response = self.DescribeTags(ResourceId)
-                return True if TagName in list(map(lambda x: x['Key'], [x for x in response['Tags']])) else False
-            elif self.Service == 'datapipeline':
-                response = self.DescribePipelines(ResourceId)
-                return True if TagName in [Tag['key'] for Tag in [PD['tags'] for PD in response['pipelineDescriptionList']][0]] else False
-            else:
-                raise TagNotSupportedError(self.Service)
-        except Exception as e:
-            raise e
-
-        return False
+        return TagName in self.GetAllTags(ResourceId)
 
     def GetTagValues(self, ResourceId, TagNames):
-        """Get tag value corresponding to tag name for resource"""
-
-        try:
-            if self.Service == 'ec2':
-                response = self.DescribeTags(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 's3':
-                response = self.GetBucketTagging(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['TagSet'] if Tag['Key'] in TagNames]
-            elif self.Service == 'lambda':
-                response = self.ListTags(ResourceId)
-                return [{K: V} for K,V in response['Tags'] if K in TagNames]
-            elif self.Service == 'logs':
-                response = self.ListTagsLogGroup(ResourceId)
-                return [{K: V} for K,V in response['tags'] if K in TagNames]
-            elif self.Service == 'rds':
-                response = self.ListTagsForResource(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['TagList'] if Tag['Key'] in TagNames]
-            elif self.Service == 'es':
-                response = self.ListTags(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['TagList'] if Tag['Key'] in TagNames]
-            elif self.Service == 'emr':
-                response = self.DescribeCluster(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Cluster']['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 'dynamodb':
-                response = self.ListTagsOfResource(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 'firehose':
-                response = self.ListTagsForDeliveryStream(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 'glacier':
-                response = self.ListTagsForVault(ResourceId)
-                return [{K: V} for K,V in response['Tags'] if K in TagNames]
-            elif self.Service == 'kms':
-                response = self.ListResourceTags(ResourceId)
-                return [{Tag['TagKey']: Tag['TagValue']} for Tag in response['Tags'] if Tag['TagKey'] in TagNames]
-            elif self.Service == 'apigateway':
-                response = self.GetTags(ResourceId)
-                return [{K: V} for K,V in response['tags'] if K in TagNames]
-            elif self.Service == 'kinesis':
-                response = self.ListTagsForStream(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 'cloudtrail':
-                response = self.ListTags(ResourceId)
-                TagsList = map(lambda RTL: RTL['TagsList'], [RTL for RTL in response['ResourceTagList']])
-                return [{Tag['Key']: Tag['Value']} for Tag in TagsList if Tag['Key'] in TagNames]
-            elif self.Service == 'sqs':
-                response = self.ListTags(ResourceId)
-                return [{K: V} for K,V in response['Tags'] if K in TagNames]
-            elif self.Service == 'secretsmanager':
-                response = self.DescribeSecret(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 'cloudfront':
-                response = self.ListTagsForResource(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 'efs':
-                response = self.DescribeTags(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 'sagemaker':
-                response = self.ListTags(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 'redshift':
-                response = self.DescribeTags(ResourceId)
-                Tags = [Tag['Tag'] for Tag in response['TaggedResources']]
-                return [{Tag['Key']: Tag['Value']} for Tag in Tags if Tag['Key'] in TagNames]
-            elif self.Service == 'elasticache':
-                response = self.ListTagsForResource(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['TagList'] if Tag['Key'] in TagNames]
-            elif self.Service == 'workspaces':
-                response = self.DescribeTags(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 'ds':
-                response = self.ListTagsForResource(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 'dax':
-                response = self.ListTags(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 'route53':
-                response = self.ListTagsForResource(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 'directconnect':
-                response = self.DescribeTags(ResourceId)
-                return [{Tag['Key']: Tag['Value']} for Tag in response['Tags'] if Tag['Key'] in TagNames]
-            elif self.Service == 'datapipeline':
-                response = self.DescribePipelines(ResourceId)
-                Tags = list(map(lambda x: x['tags'], [tags for tags in response['pipelineDescriptionList']]))
-                return [{Tag['Key']: Tag['Value']} for Tag in Tags if Tag['Key'] in TagNames]
-            else:
-                raise TagNotSupportedError(self.Service)
-        except Exception as e:
-            raise e
-
-        return []
-
-
-    def ListBuckets(self):
-        """Return S3 buckets"""
-
-        Client = boto3.client(self.Service)
-        response = Client.list_buckets()
-        return response
-
-
-    def ListFunctions(self):
-        """Return lambda functions"""
-
-        Client = boto3.client(self.Service)
-        response = Client.list_functions(
-            MasterRegion = 'ALL',
-            FunctionVersion = 'ALL'
-	)
-        return response
-
-
-    def DescribeLogGroups(self):
-        """Return cloudwatch logs"""
-
-        Client = boto3.client(self.Service)
-        return Client.describe_log_groups()
-
-
-    def DescribeDbInstances(self):
-        """Return rds instances"""
-
-        Client = boto3.client(self.Service)
-        return Client.describe_db_instances()
+        """Get tag value corresponding to tag name for resource, i.e. [{TagName: TagValue}]"""
 
+        return [{K: V} for K,V in self.GetAllTags(ResourceId).items() if K in TagNames]
 
     def ListDomainNames(self):
         """Return elastic search domain names"""
 
-        Client = boto3.client(self.Service)
+        Client = self.GetClient()
         return Client.list_domain_names()
 
     
     def DescribeElasticSearchDomains(self, DomainNames):
         """Return elastic search domain arn"""
 
-        Client = boto3.client(self.Service)
+        Client = self.GetClient()
         return Client.describe_elasticsearch_domains(
             DomainNames = DomainNames
 	)
 
 
-    def ListClusters(self):
-        """Return emr clusters id"""
+    def IterEc2Resources(self, Types=None, Filters=None):
+        """Yield de-duplicated ec2 resource ids, see IterEc2TypedResources()"""
 
-        Client = boto3.client(self.Service)
-        return Client.list_clusters()
+        for Type, ResourceId in self.IterEc2TypedResources(Types, Filters):
+            yield ResourceId
 
-    def ListTables(self):
-        """Return dynamodb tables"""
+    def IterEc2TypedResources(self, Types=None, Filters=None):
+        """Yield (Type, ResourceId) of de-duplicated ec2 resources, describing each resource type concurrently
 
-        Client = boto3.client(self.Service)
-        return Client.list_tables()
+        Types is list of ec2 resource types to scan, i.e. ['volume', 'snapshot'], default all types.
+        Filters are extra ec2 filters applied on the server, i.e. [{'Name': 'tag-key', 'Values': ['Channel']}].
+        When Filters are given, types that cannot filter by tag are skipped unless listed in Types."""
 
-    def ListDeliveryStreams(self):
-        """Return firehose delivery streams"""
+        if Types == None:
+            Types = [Type for Type in aws.registry.Ec2Discovery \
+                     if Filters == None or aws.registry.Ec2FilterParams.get(Type, 'Filters') != None]
+        for Type in Types:
+            if Type not in aws.registry.Ec2Discovery:
+                raise InvalidEc2TypeError(Type)
+            if Filters != None and aws.registry.Ec2FilterParams.get(Type, 'Filters') == None:
+                raise InvalidEc2TypeError(Type)
 
-        Client = boto3.client(self.Service)
-        return Client.list_delivery_streams()
+        Client = self.GetClient('ec2')
+        Pages = queue.Queue()
+        Stopped = threading.Event()
 
-    def ListVaults(self):
-        """Return vaults"""
-
-        Client = boto3.client(self.Service)
-        return Client.list_vaults()
-
-    def ListKeys(self):
-        """Return kms keys"""
-
-        Client = boto3.client(self.Service)
-        return Client.list_keys()
-
-    def GetRestApis(self):
-        """Return api gateway rest api"""
-
-        Client = boto3.client(self.Service)
-        return Client.get_rest_apis()
-
-    def ListStreams(self):
-        """Return kinesis streams"""
-
-        Client = boto3.client(self.Service)
-        return Client.list_streams()
-
-    def DescribeTrails(self):
-        """Return cloudtrail"""
-
-        Client = boto3.client(self.Service)
-        return Client.describe_trails()
-
-    def ListQueues(self):
-        """Return sqs"""
-
-        Client = boto3.client(self.Service)
-        return Client.list_queues()
-
-    def ListSecrets(self):
-        """Return secrets manager"""
-
-        Client = boto3.client(self.Service)
-        return Client.list_secrets()
+        def Describe(Type):
+            Operation, Params, Extract = aws.registry.Ec2Discovery[Type]
+            if Filters != None:
+                FilterParam = aws.registry.Ec2FilterParams.get(Type, 'Filters')
+                Params = dict(Params)
+                Params[FilterParam] = Params.get(FilterParam, []) + Filters
+            try:
+                for Page in aws.client.Paginate(Client, Operation, **Params):
+                    Pages.put((Type, Extract(Page), None))
+                    if Stopped.is_set():
+                        break
+            except Exception as e:
+                Pages.put((Type, [], e))
+            Pages.put((Type, None, None))
 
-    def ListDistributions(self):
-        """Return cloudfront distributions"""
+        Executor = ThreadPoolExecutor(max_workers=min(8, len(Types)) or 1)
+        try:
+            for Type in Types:
+                Executor.submit(Describe, Type)
+
+            ### yield ids as pages arrive until every type has finished
+            Seen = set()
+            Errors = []
+            Running = len(Types)
+            while Running > 0:
+                Type, Ids, Error = Pages.get()
+                if Ids == None:
+                    Running -= 1
+                elif Error != None:
+                    Errors.append(Error)
+                for Id in Ids or []:
+                    if Id not in Seen:
+                        Seen.add(Id)
+                        yield Type, Id
+            if len(Errors) > 0:
+                raise Errors[0]
+        finally:
+            ### the caller may stop early, types not started are cancelled and running ones stop after their page
+            Stopped.set()
+            Executor.shutdown(wait=True, cancel_futures=True)
+
+    def GetEc2Resources(self, Types=None, Filters=None):
+        """Return list of ec2 resources"""
 
-        Client = boto3.client(self.Service)
-        return Client.list_distributions()
+        return list(self.IterEc2Resources(Types, Filters))
 
-    def DescribeFileSystems(self):
-        """Return efs"""
+    def DescribeDeliveryStreamNames(self):
+        """Yield firehose delivery stream names, following HasMoreDeliveryStreams"""
 
-        Client = boto3.client(self.Service)
-        return Client.describe_file_systems()
+        Client = self.GetClient()
+        Params = {}
+        while True:
+            response = Client.list_delivery_streams(**Params)
+            yield from response['DeliveryStreamNames']
+            if not response.get('HasMoreDeliveryStreams') or len(response['DeliveryStreamNames']) == 0:
+                break
+            Params['ExclusiveStartDeliveryStreamName'] = response['DeliveryStreamNames'][-1]
 
-    def ListNotebookInstances(self):
-        """Return sagemaker notebook instances"""
+    def DescribeElasticSearchDomainArns(self):
+        """Yield elastic search domain arns, describing at most 5 domains per call"""
 
-        Client = boto3.client(self.Service)
-        return Client.list_notebook_instances()
+        response = self.ListDomainNames()
+        DomainNames = [Domains['DomainName'] for Domains in response['DomainNames']]
+        for i in range(0, len(DomainNames), 5):
+            response = self.DescribeElasticSearchDomains(DomainNames[i:i + 5])
+            yield from [Domains['ARN'] for Domains in response['DomainStatusList']]
 
-    def DescribeClusters(self):
-        """Return resources using boto3 describe_clusters()"""
+    def IterResources(self, Ec2Types=None, Ec2Filters=None):
+        """Yield resources for a service as each page arrives
 
-        Client = boto3.client(self.Service)
+        Ec2Types limits the ec2 resource types scanned and Ec2Filters are ec2 filters applied on the server"""
 
-        if self.Service == 'redshift':
-            response = Client.describe_clusters() 
-        elif self.Service == 'dax':
-            response = Client.describe_clusters() 
+        ### ec2 is discovered per resource type, see aws.registry.Ec2Discovery
+        if self.Service == 'ec2':
+            yield from self.IterEc2Resources(Ec2Types, Ec2Filters)
+        elif self.Descriptor.DiscoveryHandler != None:
+            yield from getattr(self, self.Descriptor.DiscoveryHandler)()
+        elif self.Descriptor.Discovery != None:
+            Operation, Params, Extract = self.Descriptor.Discovery
+
+            ### operations that list every region, i.e. s3 list_buckets, are limited to this instance's region
+            Region = self.GetRegion()
+            if self.Descriptor.RegionParam != None and Region != None:
+                Params = dict(Params)
+                Params[self.Descriptor.RegionParam] = Region
+
+            for Page in aws.client.Paginate(self.GetClient(), Operation, **Params):
+                for ResourceId in Extract(Page):
+                    if self.Service == 's3' and Region != None:
+                        aws.region.Regions.PutBucketRegion(ResourceId, Region)
+                    yield ResourceId
         else:
             raise TagNotSupportedError(self.Service)
 
-        return response
-
-    def DescribeCacheClusters(self):
-        """Return elasticache clusters"""
-
-        Client = boto3.client(self.Service)
-        return Client.describe_cache_clusters()
-
-    def DescribeWorkspaces(self):
-        """Return workspaces"""
-
-        Client = boto3.client(self.Service)
-        return Client.describe_workspaces()
-
-    def DescribeDirectories(self):
-        """Return directory services"""
-
-        Client = boto3.client(self.Service)
-        return Client.describe_directories()
-
-    def ListHostedZones(self):
-        """Return hosted zones"""
-
-        Client = boto3.client(self.Service)
-        return Client.list_hosted_zones()
-
-    def DescribeVirtualInterfaces(self):
-        """Return direct connect vifs"""
-
-        Client = boto3.client(self.Service)
-        return Client.describe_virtual_interfaces()
-
-    def ListPipelines(self):
-        """Return datapipelines"""
-
-        Client = boto3.client(self.Service)
-        return Client.list_pipelines()
-
-    def GetEc2Resources(self):
-        """Return list of ec2 resources"""
-
-        Resources = []
-        Client = boto3.client('ec2')
-
-        ### get snapshots
-        response = Client.describe_snapshots(
-	)
-        Resources += [R['SnapshotId'] for R in response['Snapshots']]
-
-        ### get nat gateways
-        response = Client.describe_nat_gateways(
-	)
-        Resources += [R['NatGatewayId'] for R in response['NatGateways']]
-
-        ### get customer gateways
-        response = Client.describe_customer_gateways(
-	)
-        Resources += [R['CustomerGatewayId'] for R in response['CustomerGateways']]
-
-        ### get dedicated hosts
-        response = Client.describe_hosts(
-	)
-        Resources += [R['HostId'] for R in response['Hosts']]
-
-        ### get dedicated hosts
-        response = Client.describe_hosts(
-	)
-        Resources += [R['HostId'] for R in response['Hosts']]
-
-        ### get dhcp options
-        response = Client.describe_dhcp_options(
-	)
-        Resources += [R['DhcpOptionsId'] for R in response['DhcpOptions']]
-
-        ### get egress internet gateways
-        response = Client.describe_egress_only_internet_gateways(
-	)
-        Resources += [R['EgressOnlyInternetGatewayId'] for R in response['EgressOnlyInternetGateways']]
-
-        ### get egress internet gateways
-        response = Client.describe_egress_only_internet_gateways(
-	)
-        Resources += [R['EgressOnlyInternetGatewayId'] for R in response['EgressOnlyInternetGateways']]
-
-        ### get elastic gpus
-        response = Client.describe_elastic_gpus(
-	)
-        Resources += [R['ElasticGpuId'] for R in response['ElasticGpuSet']]
-
-        ### get ec2 images
-        response = Client.describe_images(
-	)
-        Resources += [R['ImageId'] for R in response['Images']]
-
-        ### get ec2 instances
-        response = Client.describe_instances(
-	)
-        Resources += [InstanceId for InstanceId in [[J['InstanceId'] for J in I ]for I in [R['Instances'] for R in response['Reservations']]][0]]
-
-        ### get ec2 instance profiles from instance profile associations
-        response = Client.describe_iam_instance_profile_associations(
-	)
-        Resources += [R['IamInstanceProfile']['Id'] for R in response['IamInstanceProfileAssociations']]
-
-        ### get internet gateways
-        response = Client.describe_internet_gateways(
-	)
-        Resources += [R['InternetGatewayId'] for R in response['InternetGateways']]
-
-        ### get ec2 key pairs
-        response = Client.describe_key_pairs(
-	)
-        Resources += [R['KeyName'] for R in response['KeyPairs']]
-
-        ### get launch templates
-        response = Client.describe_launch_templates(
-	)
-        Resources += [R['LaunchTemplateId'] for R in response['LaunchTemplates']]
-
-        ### get nacls
-        response = Client.describe_network_acls(
-	)
-        Resources += [R['NetworkAclId'] for R in response['NetworkAcls']]
-
-        ### get enis
-        response = Client.describe_network_interfaces(
-	)
-        Resources += [R['NetworkInterfaceId'] for R in response['NetworkInterfaces']]
-
-        ### get placement groups
-        response = Client.describe_placement_groups(
-	)
-        Resources += [R['GroupName'] for R in response['PlacementGroups']]
-
-        ### get reserved instances
-        response = Client.describe_reserved_instances(
-	)
-        Resources += [R['ReservedInstancesId'] for R in response['ReservedInstances']]
+    def GetResources(self, Ec2Types=None, Ec2Filters=None):
+        """Return list of resources for a service"""
 
-        ### get route tables
-        response = Client.describe_route_tables(
-	)
-        Resources += [R['RouteTablesId'] for R in response['RouteTables']]
+        return list(self.IterResources(Ec2Types, Ec2Filters))
 
-        ### get security groups
-        response = Client.describe_security_groups(
-	)
-        Resources += [R['GroupId'] for R in response['SecurityGroups']]
+def UpdateTag(Service, ResourceId, TagName, TagValue, Account=None):
+    """Update tag for services"""
 
-        ### get spot instance requests
-        response = Client.describe_spot_instance_requests(
-	)
-        Resources += [R['SpotInstanceRequestId'] for R in response['SpotInstanceRequests']]
+    return UpdateTags(Service, ResourceId, {TagName: TagValue}, Account)
 
-        ### get subnets
-        response = Client.describe_subnets(
-	)
-        Resources += [R['SubnetId'] for R in response['Subnets']]
 
-        ### get ec2 volumes
-        response = Client.describe_volumes(
-	)
-        Resources += [R['VolumeId'] for R in response['Volumes']]
+def UpdateTags(Service, ResourceId, Tags, Account=None):
+    """Update several tags for a resource in one request, i.e. {TagName: TagValue}"""
 
-        ### get ec2 volumes
-        response = Client.describe_volumes(
-	)
-        Resources += [R['VolumeId'] for R in response['Volumes']]
+    try:
+        Ref = aws.arn.Parse(ResourceId)
+        Tag = AwsTag(Service, Ref, Account=Account)
+        Tag.UpdateTags(Ref, Tags)
+    except ClientError as c:
+        #raise Exception(type(c))
+        raise Exception(c)
+    except Exception as e:
+        raise e
 
-        ### get vpcs
-        response = Client.describe_vpcs(
-	)
-        Resources += [R['VpcId'] for R in response['Vpcs']]
+    return True
 
-        ### get vpc peering connections
-        response = Client.describe_vpc_peering_connections(
-	)
-        Resources += [R['VpcPeeringConnectionId'] for R in response['VpcPeeringConnections']]
 
-        ### get vpc peering connections
-        response = Client.describe_vpc_peering_connections(
-	)
-        Resources += [R['VpcPeeringConnectionId'] for R in response['VpcPeeringConnections']]
+def BulkUpdateTags(Service, Requests, Account=None):
+    """Update tags for many resources of one account, i.e. [(ResourceId, {TagName: TagValue})]
 
-        ### get vpn connections
-        response = Client.describe_vpn_connections(
-	)
-        Resources += [R['VpnConnectionId'] for R in response['VpnConnections']]
+    Requests are grouped by service type and tag set and sent in the largest batch
+    each api allows. Return list of (ResourceId, Succeeded, Error) in request order."""
 
-        ### get vpn gateway
-        response = Client.describe_vpn_gateways(
-	)
-        Resources += [R['VpnGatewayId'] for R in response['VpnGateways']]
+    Results = [None] * len(Requests)
 
-    def GetResources(self):
-        """Return list of resources for a service"""
-        
+    ### ec2 resource ids can resolve to ec2, elb or elbv2, and every call must go to the
+    ### region of its resources, so group by resolved service and region
+    Groups = {}
+    for i, (ResourceId, Tags) in enumerate(Requests):
         try:
-            if self.Service == 'ec2':
-                return self.GetEc2Resources()
-            elif self.Service == 's3':
-                response = self.ListBuckets()
-                return [Buckets['Name'] for Buckets in response['Buckets']]
-            elif self.Service == 'lambda':
-                response = self.ListFunctions()
-                return [Functions['FunctionName'] for Functions in response['Functions']]
-            elif self.Service == 'logs':
-                response = self.DescribeLogGroups()
-                return [LogGroups['logGroupName'] for LogGroups in response['logGroups']]
-            elif self.Service == 'rds':
-                response = self.DescribeDbInstances()
-                return [Instances['DBInstanceArn'] for Instances in response['DBInstances']]
-            elif self.Service == 'es':
-                response = self.ListDomainNames()
-                DomainNames = [Domains['DomainName'] for Domains in response['DomainNames']]
-                response = self.DescribeElasticSearchDomains(DomainNames)
-                return [Domains['ARN'] for Domains in response['DomainStatusList']]
-            elif self.Service == 'emr':
-                response = self.ListClusters()
-                return [Clusters['Id'] for Clusters in response['Clusters']]
-            elif self.Service == 'dynamodb':
-                response = self.ListTables()
-                return [Tables for Tables in response['TableNames']]
-            elif self.Service == 'firehose':
-                response = self.ListDeliveryStreams()
-                return [StreamName for StreamName in response['DeliveryStreamNames']]
-            elif self.Service == 'glacier':
-                response = self.ListVaults()
-                return [Vault['VaultName'] for Vault in response['VaultList']]
-            elif self.Service == 'kms':
-                response = self.ListKeys()
-                return [Keys['KeyId'] for Keys in response['Keys']]
-            elif self.Service == 'apigateway':
-                response = self.GetRestApis()
-                return [Item['id'] for Item in response['items']]
-            elif self.Service == 'kinesis':
-                response = self.ListStreams()
-                return [StreamName for StreamName in response['StreamNames']]
-            elif self.Service == 'cloudtrail':
-                response = self.DescribeTrails()
-                return [Trail['TrailARN'] for Trail in response['trailList']]
-            elif self.Service == 'sqs':
-                response = self.ListQueues()
-                return [QueueUrl for QueueUrl in response['QueueUrls']]
-            elif self.Service == 'secretsmanager':
-                response = self.ListSecrets()
-                return [Secret['Name'] for Secret in response['SecretList']]
-            elif self.Service == 'cloudfront':
-                response = self.ListDistributions()
-                response = [V['ARN'] for K,V in response['DistributionList'].items() if 'Items' == K]
-            elif self.Service == 'efs':
-                response = self.DescribeFileSystems()
-                return [FS['FileSystemId'] for FS in response['FileSystems']]
-            elif self.Service == 'sagemaker':
-                response = self.ListNotebookInstances()
-                return [Instance['NotebookInstanceArn'] for Instance in response['NotebookInstances']]
-            elif self.Service == 'redshift':
-                response = self.DescribeClusters()
-                return [Cluster['ClusterIdentifier'] for Cluster in response['Clusters']]
-            elif self.Service == 'elasticache':
-                response = self.DescribeCacheClusters()
-                return [Cluster['CacheClusterId'] for Cluster in response['CacheClusters']]
-            elif self.Service == 'workspaces':
-                response = self.DescribeWorkspaces()
-                return [Workspace['WorkspaceId'] for Workspace in response['Workspaces']]
-            elif self.Service == 'ds':
-                response = self.DescribeDirectories()
-                return [Directory['DirectoryId'] for Directory in response['DirectoryDescriptions']]
-            elif self.Service == 'dax':
-                response = self.DescribeClusters()
-                return [Cluster['ClusterArn'] for Cluster in response['Clusters']]
-            elif self.Service == 'route53':
-                response = self.ListHostedZones()
-                return [HZ['Id'] for HZ in response['HostedZones']]
-            elif self.Service == 'directconnect':
-                response = self.DescribeVirtualInterfaces()
-                return [HZ['virtualInterfaceId'] for HZ in response['virtualInterfaces']]
-            elif self.Service == 'datapipeline':
-                response = self.ListPipelines()
-                return [Pipeline['id'] for Pipeline in response['pipelineIdList']]
-            else:
-                raise TagNotSupportedError(self.Service)
+            Tag = AwsTag(Service, aws.arn.Parse(ResourceId), Account=Account)
+            Region = Tag.GetRegion()
         except Exception as e:
-            raise e
-
-        return []
-
-def UpdateTag(Service, ResourceId, TagName, TagValue):
-    """Update tag for services"""
+            Results[i] = (ResourceId, False, aws.metrics.ErrorMessage(e))
+            continue
+        Groups.setdefault((Tag.GetServiceName(), Region), (Tag, []))[1].append(i)
 
+    for Tag, Positions in Groups.values():
+        for i, Result in zip(Positions, Tag.BulkUpdateTags([Requests[i] for i in Positions])):
+            Results[i] = Result
 
-    try:
-        Tag = AwsTag(Service, ResourceId)
-        Tag.UpdateTag(ResourceId, TagName, TagValue)
-    except ClientError as c:
-        #raise Exception(type(c))
-        raise Exception(c)
-    except Exception as e:
-        raise e
-
-    return True
+    return Results
 
 
 def GetServiceName(Service, ResourceId):
@@ -1758,16 +705,17 @@ def GetServiceName(Service, ResourceId):
     return None
 
 
-def IsTagExists(Service, ResourceId, TagName):
+def IsTagExists(Service, ResourceId, TagName, Account=None):
     """Check if tag name exists"""
 
     try:
-        Tag = AwsTag(Service, ResourceId)
-        if Tag.IsTagExists(ResourceId, TagName):
+        Ref = aws.arn.Parse(ResourceId)
+        Tag = AwsTag(Service, Ref, Account=Account)
+        if Tag.IsTagExists(Ref, TagName):
             return True
     except Exception as e:
         ### ignore NoSuchTagSet exception for s3
-        if str(e).find('NoSuchTagSet') != -1 and Service == 's3':
+        if aws.metrics.GetErrorCode(e) == 'NoSuchTagSet' and Service == 's3':
             return False
         else:
             raise e
@@ -1775,27 +723,54 @@ def IsTagExists(Service, ResourceId, TagName):
     return False
 
 
-def GetResources(Service):
-    """Get list of resources for service"""
+def IterResources(Service, Ec2Types=None, Ec2Filters=None, Region=None, Account=None):
+    """Yield resources for service as discovery pages arrive
+
+    Ec2Types limits the ec2 resource types scanned and Ec2Filters are ec2 filters applied on the server.
+    Region is the region to scan, default region if None, and Account the account, ambient if None"""
+
+    Tag = AwsTag(Service, Region=Region, Account=Account)
+    yield from Tag.IterResources(Ec2Types, Ec2Filters)
+
+
+def GetResources(Service, Ec2Types=None, Ec2Filters=None, Region=None, Account=None):
+    """Get list of resources for service in region and account, default region and ambient account if None
+
+    With an inventory store open the partition is refreshed only when stale and read from the store"""
 
     try:
-        Tag = AwsTag(Service)
-        return Tag.GetResources()
+        Store = aws.store.GetInventoryStore()
+        if Store != None and Ec2Filters == None:
+            Region = Region or aws.region.GetDefaultRegion()
+            Store.Refresh(Service, Region, Account, Ec2Types)
+            return Store.GetResources(Service, Region, Account, Ec2Types)
+
+        Tag = AwsTag(Service, Region=Region, Account=Account)
+        return Tag.GetResources(Ec2Types, Ec2Filters)
     except Exception as e:
             raise e
 
     return []
 
 
-def GetTagValues(Service, ResourceId, TagNames):
+def GetAllTags(Service, ResourceId, Account=None):
+    """Return all tags of a resource as dictionary, i.e. {TagName: TagValue}"""
+
+    Ref = aws.arn.Parse(ResourceId)
+    Tag = AwsTag(Service, Ref, Account=Account)
+    return Tag.GetAllTags(Ref)
+
+
+def GetTagValues(Service, ResourceId, TagNames, Account=None):
     """Return list of tag values corresponding to tag name for resource"""
 
     try:
-        Tag = AwsTag(Service, ResourceId)
-        return Tag.GetTagValues(ResourceId, TagNames)
+        Ref = aws.arn.Parse(ResourceId)
+        Tag = AwsTag(Service, Ref, Account=Account)
+        return Tag.GetTagValues(Ref, TagNames)
     except Exception as e:
         ### ignore NoSuchTagSet exception for s3
-        if str(e).find('NoSuchTagSet') != -1 and Service == 's3':
+        if aws.metrics.GetErrorCode(e) == 'NoSuchTagSet' and Service == 's3':
             return []
         else:
             raise e
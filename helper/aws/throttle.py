@@ -0,0 +1,148 @@
+"""This module provides adaptive rate limiting for AWS calls made through pooled clients"""
+
+import threading
+import time
+
+### error codes aws returns when a caller is throttled
+ThrottlingErrors = set([
+                    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+                    'RequestThrottled', 'RequestLimitExceeded', 'TooManyRequestsException', 'SlowDown',
+                    'ProvisionedThroughputExceededException', 'BandwidthLimitExceeded', 'EC2ThrottledException',
+                    'PriorRequestNotComplete'
+                ])
+
+class TokenBucket:
+    """Token bucket whose rate halves on throttling and grows slowly after successes"""
+
+    def __init__(self, Rate=20.0, MinRate=0.5, MaxRate=200.0, Increase=0.5):
+        """Constructor, rates are requests per second"""
+
+        self.Rate = Rate
+        self.MinRate = MinRate
+        self.MaxRate = MaxRate
+        self.Increase = Increase
+        self.Tokens = Rate
+        self.Updated = time.monotonic()
+        self.Lock = threading.Lock()
+        self.Calls = 0
+        self.Throttles = 0
+        self.Retries = 0
+
+    def Acquire(self):
+        """Block until a token is available"""
+
+        while True:
+            with self.Lock:
+                Now = time.monotonic()
+                self.Tokens = min(max(self.Rate, 1.0), self.Tokens + (Now - self.Updated) * self.Rate)
+                self.Updated = Now
+                if self.Tokens >= 1.0:
+                    self.Tokens -= 1.0
+                    self.Calls += 1
+                    return
+                Wait = (1.0 - self.Tokens) / self.Rate
+            time.sleep(Wait)
+
+    def OnThrottle(self):
+        """Cut the rate after a throttling error"""
+
+        with self.Lock:
+            self.Throttles += 1
+            self.Rate = max(self.MinRate, self.Rate / 2.0)
+            self.Tokens = min(self.Tokens, 0.0)
+
+    def OnSuccess(self):
+        """Raise the rate a little after a successful call"""
+
+        ### each success adds Increase / Rate, so the rate grows by about Increase per second of clean calls
+        with self.Lock:
+            self.Rate = min(self.MaxRate, self.Rate + self.Increase / max(self.Rate, 1.0))
+
+    def OnRetries(self, Count):
+        """Count retry attempts reported by botocore"""
+
+        with self.Lock:
+            self.Retries += Count
+
+    def GetStats(self):
+        """Return bucket statistics as dictionary"""
+
+        with self.Lock:
+            return {'Rate': round(self.Rate, 2), 'Calls': self.Calls, 'Throttles': self.Throttles, 'Retries': self.Retries}
+
+
+class Throttle:
+    """Keep one token bucket per service, region and account session"""
+
+    ### starting rate for services with low tagging limits, everything else starts at DefaultRate
+    __Rates = {'route53': 5.0, 'cloudfront': 5.0, 'directconnect': 5.0, 'ds': 5.0, 'workspaces': 5.0}
+
+    def __init__(self, DefaultRate=20.0, MaxRate=200.0):
+        """Constructor"""
+
+        self.DefaultRate = DefaultRate
+        self.MaxRate = MaxRate
+        self.Lock = threading.Lock()
+        self.Buckets = {}
+
+    def GetBucket(self, Service, Region, SessionKey=None):
+        """Return token bucket for service and region, SessionKey identifies the account since limits are per account"""
+
+        with self.Lock:
+            Key = (Service, Region, SessionKey)
+            if Key not in self.Buckets:
+                self.Buckets[Key] = TokenBucket(Throttle.__Rates.get(Service, self.DefaultRate), MaxRate=self.MaxRate)
+            return self.Buckets[Key]
+
+    def Attach(self, Client, Service, SessionKey=None):
+        """Register event handlers that rate limit every attempt and learn from throttling"""
+
+        Bucket = self.GetBucket(Service, Client.meta.region_name, SessionKey)
+
+        def BeforeSend(**kwargs):
+            Bucket.Acquire()
+
+        def NeedsRetry(response=None, **kwargs):
+            if response == None:
+                return None
+            HttpResponse, Parsed = response
+            Code = Parsed.get('Error', {}).get('Code')
+            if HttpResponse.status_code == 429 or Code in ThrottlingErrors:
+                Bucket.OnThrottle()
+            elif HttpResponse.status_code < 300:
+                Bucket.OnSuccess()
+            return None
+
+        def AfterCall(parsed=None, **kwargs):
+            Attempts = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+            if Attempts > 0:
+                Bucket.OnRetries(Attempts)
+
+        Client.meta.events.register('before-send', BeforeSend)
+        Client.meta.events.register_first('needs-retry', NeedsRetry)
+        Client.meta.events.register('after-call', AfterCall)
+
+    def GetStats(self):
+        """Return throttle and retry counts in total and per service and region"""
+
+        with self.Lock:
+            Buckets = dict(self.Buckets)
+
+        Stats = {'Calls': 0, 'Throttles': 0, 'Retries': 0, 'Services': {}}
+        for (Service, Region, SessionKey), Bucket in Buckets.items():
+            BucketStats = Bucket.GetStats()
+            Name = Service + ':' + str(Region) + ('' if SessionKey == None else ':' + SessionKey)
+            Stats['Services'][Name] = BucketStats
+            for K in ['Calls', 'Throttles', 'Retries']:
+                Stats[K] += BucketStats[K]
+
+        return Stats
+
+
+### process-wide limiter shared by all pooled clients
+Limiter = Throttle()
+
+def GetThrottleStats():
+    """Return throttle statistics, i.e. {'Calls': 100, 'Throttles': 2, 'Retries': 2, 'Services': {...}}"""
+
+    return Limiter.GetStats()
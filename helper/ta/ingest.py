@@ -0,0 +1,180 @@
+"""This module reads large csv files in chunks that are parsed and validated in parallel while tags are updated"""
+
+import io
+import mmap
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from ta.journal import CsvOffsetReader
+from ta.services import GetB3ServiceName
+from ta.validate import TagValidator
+
+def SplitChunks(Filename, Offset=0, ChunkBytes=8 * 1024 * 1024):
+    """Yield (Start, End) byte ranges of about ChunkBytes from Offset to the end of a csv file
+
+    The file is memory-mapped and every range ends after a line break that is not inside a
+    quoted field, so each range holds whole rows and can be parsed on its own."""
+
+    with open(Filename, 'rb') as Stream:
+        Size = os.fstat(Stream.fileno()).st_size
+        if Offset >= Size:
+            return
+        with mmap.mmap(Stream.fileno(), 0, access=mmap.ACCESS_READ) as Map:
+            Start = Offset
+            while Start < Size:
+                End = Start
+                Search = min(Start + ChunkBytes, Size) - 1
+                Quotes = 0
+                while End < Size:
+                    LineBreak = Map.find(b'\n', max(Search, End))
+                    Next = LineBreak + 1 if LineBreak != -1 else Size
+                    Quotes += Map[End:Next].count(b'"')
+                    End = Next
+                    ### an odd number of quotes means the line break is inside a quoted field
+                    if Quotes % 2 == 0:
+                        break
+                yield Start, End
+                Start = End
+
+def ParseRow(Row, Columns, ServiceNames=None, Validator=None):
+    """Return (ResourceId, Service, Account, Tags, Error) of a csv row
+
+    Columns is (ResourceIdx, ServiceIdx, AccountIdx, {AwsTagName: CsvIdx}), AccountIdx may be None.
+    Service is the boto3 service name, looked up in ServiceNames if given, Account is None when the
+    row has no account id. Error is None, or the reason the row cannot be used, i.e. a tag value
+    the service does not accept, in which case the other values may be None."""
+
+    ResourceIdx, ServiceIdx, AccountIdx, TagIdx = Columns
+    Width = max([ResourceIdx, ServiceIdx] + list(TagIdx.values()) + ([AccountIdx] if AccountIdx != None else [])) + 1
+    if len(Row) < Width:
+        return None, None, None, None, 'row has ' + str(len(Row)) + ' columns, expected ' + str(Width)
+
+    Account = Row[AccountIdx] if AccountIdx != None and Row[AccountIdx] != '' else None
+    Tags = {TagName: Row[Idx] for TagName, Idx in TagIdx.items()}
+
+    Service = ServiceNames[Row[ServiceIdx]] if ServiceNames != None else GetB3ServiceName(Row[ServiceIdx])
+    Error = (Validator if Validator != None else TagValidator()).CheckRow(Row[ResourceIdx], Row[ServiceIdx], Service, Tags)
+
+    return Row[ResourceIdx], Service, Account, Tags, Error
+
+def ParseChunk(Filename, Start, End, Columns, Encoding='utf-8'):
+    """Return list of (Start, End, (ResourceId, Service, Account, Tags, Error)) of the rows in a byte range
+
+    Runs in a worker process, so the chunk is read from its own memory map of the file. Service
+    names are resolved and tags are validated once per distinct value of the chunk."""
+
+    with open(Filename, 'rb') as Stream:
+        with mmap.mmap(Stream.fileno(), 0, access=mmap.ACCESS_READ) as Map:
+            Data = Map[Start:End]
+
+    Rows = list(CsvOffsetReader(io.BytesIO(Data), Encoding))
+    ServiceIdx = Columns[1]
+    ServiceNames = {Name: GetB3ServiceName(Name) for Name in set(Row[ServiceIdx] for RowStart, RowEnd, Row in Rows \
+                                                                 if len(Row) > ServiceIdx)}
+
+    Validator = TagValidator()
+
+    return [(Start + RowStart, Start + RowEnd, ParseRow(Row, Columns, ServiceNames, Validator)) \
+            for RowStart, RowEnd, Row in Rows]
+
+
+class CsvIngest:
+    """Iterate the rows of a csv file as (Start, End, Row) in file order, parsed ahead by a pool
+
+    Chunks are split from a memory map, parsed by Parsers worker processes and handed over in
+    order through a queue of at most QueueChunks chunks, so reading and parsing run while the
+    caller updates tags and a slow caller stops the parsers instead of filling memory. With
+    Parsers 0 chunks are parsed by one background thread. Row is the ParseRow() tuple."""
+
+    def __init__(self, Filename, Columns, Offset=0, Parsers=0, ChunkBytes=8 * 1024 * 1024, QueueChunks=8, \
+                 Encoding='utf-8'):
+        """Constructor, Columns is the ParseRow() column tuple and Offset the byte offset of the first row"""
+
+        self.Filename = Filename
+        self.Columns = Columns
+        self.Offset = Offset
+        self.Parsers = Parsers
+        self.ChunkBytes = ChunkBytes
+        self.Encoding = Encoding
+        self.Queue = queue.Queue(maxsize=QueueChunks)
+        self.Stopped = threading.Event()
+        self.Executor = None
+        self.Thread = None
+        self.Chunks = 0
+        self.Rows = 0
+        self.Invalid = 0
+        self.WaitSeconds = 0.0
+
+    def Start(self):
+        """Start the pool and the thread that submits chunks and queues their rows"""
+
+        if self.Parsers > 0:
+            self.Executor = ProcessPoolExecutor(max_workers=self.Parsers)
+        else:
+            self.Executor = ThreadPoolExecutor(max_workers=1)
+        self.Thread = threading.Thread(target=self.Feed, daemon=True)
+        self.Thread.start()
+
+    def Put(self, Item):
+        """Queue a parsed chunk, waiting while the queue is full, return False once stopped"""
+
+        while not self.Stopped.is_set():
+            try:
+                self.Queue.put(Item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def Feed(self):
+        """Submit chunks to the pool, keeping one chunk per parser ahead, and queue results in file order"""
+
+        try:
+            Parsing = deque()
+            for Start, End in SplitChunks(self.Filename, self.Offset, self.ChunkBytes):
+                Parsing.append(self.Executor.submit(ParseChunk, self.Filename, Start, End, self.Columns, self.Encoding))
+                if len(Parsing) > max(1, self.Parsers) and not self.Put(Parsing.popleft().result()):
+                    return
+            while len(Parsing) > 0:
+                if not self.Put(Parsing.popleft().result()):
+                    return
+            self.Put(None)
+        except Exception as e:
+            self.Put(e)
+
+    def __iter__(self):
+        if self.Thread == None:
+            self.Start()
+        while True:
+            Waited = time.monotonic()
+            Chunk = self.Queue.get()
+            self.WaitSeconds += time.monotonic() - Waited
+            if Chunk == None:
+                return
+            if isinstance(Chunk, Exception):
+                raise Chunk
+            self.Chunks += 1
+            for Start, End, Row in Chunk:
+                self.Rows += 1
+                if Row[4] != None:
+                    self.Invalid += 1
+                yield Start, End, Row
+
+    def Close(self):
+        """Stop parsing and shut the pool down"""
+
+        self.Stopped.set()
+        if self.Thread != None:
+            self.Thread.join()
+        if self.Executor != None:
+            self.Executor.shutdown(wait=True, cancel_futures=True)
+
+    def GetStats(self):
+        """Return ingest statistics as dictionary, WaitSeconds is the time the caller waited for parsed rows"""
+
+        return {'Chunks': self.Chunks, 'Rows': self.Rows, 'Invalid': self.Invalid, 'Parsers': self.Parsers, \
+                'WaitSeconds': round(self.WaitSeconds, 3)}
@@ -0,0 +1,159 @@
+"""This module provides an append-only progress journal so long csv runs can resume where they stopped"""
+
+import csv
+import os
+import threading
+import time
+
+class CsvOffsetReader:
+    """Iterate csv rows of a binary stream as (Start, End, Row), where Start and End are byte offsets
+
+    csv.reader pulls one line at a time, so after each row the offset is exactly where the next row
+    starts, including rows with quoted line breaks."""
+
+    def __init__(self, Stream, Encoding='utf-8', Offset=0):
+        """Constructor, Offset is the byte offset to start reading at"""
+
+        self.Stream = Stream
+        self.Encoding = Encoding
+        self.Offset = Offset
+        self.Stream.seek(Offset)
+
+    def GetLines(self):
+        """Yield decoded lines and advance the offset"""
+
+        while True:
+            Line = self.Stream.readline()
+            if not Line:
+                return
+            self.Offset += len(Line)
+            yield Line.decode(self.Encoding)
+
+    def __iter__(self):
+        Start = self.Offset
+        for Row in csv.reader(self.GetLines()):
+            yield Start, self.Offset, Row
+            Start = self.Offset
+
+
+class Journal:
+    """Append completed csv rows to a journal file, flushing and fsyncing in batches
+
+    The first line identifies the csv file and the run options so a journal is never replayed against
+    another file, or by a run that would do something else with its rows, i.e. a plan run.
+    Every other line is 'row<TAB>Number<TAB>Start<TAB>End<TAB>Status<TAB>ResourceId'. Rows
+    with status 'failed' are not completed and run again on resume."""
+
+    def __init__(self, Filename, SyncRows=1000, SyncSeconds=1.0, Options=None):
+        """Constructor, the journal is synced every SyncRows rows or SyncSeconds seconds
+
+        Options is a string of the run options that decide what is done with a row, i.e. mode, tags and overwrite."""
+
+        self.Filename = Filename
+        self.Options = Options
+        self.SyncRows = SyncRows
+        self.SyncSeconds = SyncSeconds
+        self.Lock = threading.Lock()
+        self.Stream = None
+        self.Unsynced = 0
+        self.SyncedAt = time.monotonic()
+        self.Syncs = 0
+        self.Records = 0
+        self.ValidLength = None
+
+    def GetFingerprint(self, CsvFilename):
+        """Return the line that identifies a csv file by path, size and modification time, and the run options"""
+
+        Stat = os.stat(CsvFilename)
+        return '\t'.join(['csv', os.path.abspath(CsvFilename), str(Stat.st_size), str(Stat.st_mtime_ns)] + \
+                         ([self.Options] if self.Options != None else []))
+
+    def Load(self, CsvFilename):
+        """Return {Start: (Number, End)} of rows completed in a previous run of the same csv file
+
+        Raise ValueError if the journal belongs to another file, the file changed or it was written
+        with other options. A partly
+        written last line, i.e. after a crash, is ignored and cut off when the journal is opened."""
+
+        Completed = {}
+        with open(self.Filename, 'rb') as Stream:
+            Line = Stream.readline()
+            if Line.decode('utf-8').rstrip('\n') != self.GetFingerprint(CsvFilename):
+                raise ValueError('Journal ' + self.Filename + ' does not match ' + CsvFilename + \
+                                 (' with options ' + self.Options if self.Options != None else ''))
+            self.ValidLength = len(Line)
+            for Line in Stream:
+                if not Line.endswith(b'\n'):
+                    break
+                self.ValidLength += len(Line)
+                Fields = Line.decode('utf-8').rstrip('\n').split('\t', 5)
+                if len(Fields) == 6 and Fields[0] == 'row' and Fields[4] != 'failed':
+                    Completed[int(Fields[2])] = (int(Fields[1]), int(Fields[3]))
+
+        return Completed
+
+    def GetResumePoint(self, Completed, Offset):
+        """Return (Offset, Number) after the rows completed without a gap from Offset, Number is the last row number"""
+
+        Number = 0
+        while Offset in Completed:
+            Number, Offset = Completed[Offset]
+
+        return Offset, Number
+
+    def Open(self, CsvFilename, Resume=False):
+        """Open the journal for appending, starting a new journal unless Resume is True"""
+
+        if Resume and os.path.exists(self.Filename):
+            if self.ValidLength != None:
+                os.truncate(self.Filename, self.ValidLength)
+            self.Stream = open(self.Filename, 'a', encoding='utf-8')
+        else:
+            self.Stream = open(self.Filename, 'w', encoding='utf-8')
+            self.Stream.write(self.GetFingerprint(CsvFilename) + '\n')
+            self.Sync()
+
+    def Record(self, Number, Start, End, Status, ResourceId):
+        """Append a completed row, Status is 'succeeded', 'skipped', 'planned', 'rejected' or 'failed'"""
+
+        with self.Lock:
+            self.Stream.write('\t'.join(['row', str(Number), str(Start), str(End), Status, str(ResourceId)]) + '\n')
+            self.Records += 1
+            self.Unsynced += 1
+            if self.Unsynced >= self.SyncRows or time.monotonic() - self.SyncedAt >= self.SyncSeconds:
+                self.SyncLocked()
+
+    def RecordRows(self, Rows, Status, ResourceId):
+        """Append every csv row of an update, Rows is list of (Number, Start, End) of rows merged into one update"""
+
+        for Number, Start, End in Rows:
+            self.Record(Number, Start, End, Status, ResourceId)
+
+    def SyncLocked(self):
+        """Flush and fsync the journal, the caller holds the lock"""
+
+        self.Stream.flush()
+        os.fsync(self.Stream.fileno())
+        self.Unsynced = 0
+        self.SyncedAt = time.monotonic()
+        self.Syncs += 1
+
+    def Sync(self):
+        """Flush and fsync the journal"""
+
+        with self.Lock:
+            self.SyncLocked()
+
+    def Close(self):
+        """Sync and close the journal"""
+
+        if self.Stream != None:
+            self.Sync()
+            self.Stream.close()
+            self.Stream = None
+
+    def GetStats(self):
+        """Return journal statistics as dictionary"""
+
+        with self.Lock:
+            return {'Records': self.Records, 'Syncs': self.Syncs}
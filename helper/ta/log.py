@@ -1,31 +1,174 @@
-"""This module provides logging abstraction over Python's logging module"""
+"""This module provides logging abstraction over Python's logging module
 
+Records are put on a queue and written by a listener thread, so a call costs a level check
+and, when the level is enabled, a queue put. Messages are formatted by the listener, i.e.
+L.Info('Updated %s', ResourceId) never builds the string when INFO is disabled. Arguments
+must not change after the call."""
+
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import sys
+import time
 
-class Log:
+Levels = {'DEBUG': logging.DEBUG, 'INFO': logging.INFO, 'WARNING': logging.WARNING, 'ERROR': logging.ERROR, \
+          'CRITICAL': logging.CRITICAL}
+
+### all prints every message, quiet prints warnings and summaries, progress also prints a progress line
+ConsoleModes = ['all', 'quiet', 'progress']
 
-    def __init__(self, Filename=None, Level=None):
+class Line:
+    """Message made of parts joined with spaces like print(*Parts), joined only when it is written"""
+
+    __slots__ = ('Parts',)
+
+    def __init__(self, *Parts):
         """Constructor"""
 
+        self.Parts = Parts
+
+    def __str__(self):
+        return ' '.join(map(str, self.Parts))
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted, so the message is built on the listener thread and not by the caller"""
+
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one json line with time, level, logger, message and the fields passed with Fields="""
+
+    def format(self, record):
+        Entry = {'time': round(record.created, 3), 'level': record.levelname, 'logger': record.name, \
+                 'message': record.getMessage()}
+        Entry.update(getattr(record, 'fields', None) or {})
+        return json.dumps(Entry, default=str)
+
+
+class ConsoleFilter(logging.Filter):
+    """Pass the records the console mode prints, records of other loggers only from WARNING"""
+
+    def __init__(self, Name, Mode, Level):
+        """Constructor"""
+
+        super().__init__()
+        self.Name = Name
+        self.Mode = Mode
+        self.Level = Level
+
+    def filter(self, record):
+        if getattr(record, 'progress', False):
+            return self.Mode == 'progress'
+        if getattr(record, 'always', False):
+            return True
+        if record.name != self.Name:
+            return record.levelno >= logging.WARNING
+        return record.levelno >= (self.Level if self.Mode == 'all' else logging.WARNING)
+
+
+class Log:
+
+    def __init__(self, Filename=None, Level=None, Console='all', JsonFilename=None, ProgressSeconds=5.0, Name='ta'):
+        """Constructor, Console is one of ConsoleModes and JsonFilename adds a json lines log"""
+
         self.Level = Level
         self.Filename = Filename
+        self.Console = Console
+        self.JsonFilename = JsonFilename
+        self.ProgressSeconds = ProgressSeconds
+        self.ProgressAt = 0.0
+
+        if self.Level not in Levels:
+            raise Exception('Invalid log level ' + str(self.Level))
+        if self.Console not in ConsoleModes:
+            raise Exception('Invalid console mode ' + str(self.Console))
+
+        Handlers = []
+        if self.Filename != None:
+            Handler = logging.FileHandler(self.Filename)
+            Handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+            Handlers.append(Handler)
+        if self.JsonFilename != None:
+            Handler = logging.FileHandler(self.JsonFilename)
+            Handler.setFormatter(JsonFormatter())
+            Handlers.append(Handler)
+        for Handler in Handlers:
+            Handler.addFilter(lambda record: not getattr(record, 'progress', False))
+        Handler = logging.StreamHandler(sys.stdout)
+        Handler.addFilter(ConsoleFilter(Name, self.Console, Levels[self.Level]))
+        Handlers.append(Handler)
+
+        ### every logger, i.e. botocore warnings, goes through the queue to the same files
+        self.Queue = queue.SimpleQueue()
+        self.Handler = DeferredQueueHandler(self.Queue)
+        self.Listener = logging.handlers.QueueListener(self.Queue, *Handlers, respect_handler_level=True)
+        Root = logging.getLogger()
+        Root.setLevel(Levels[self.Level])
+        Root.addHandler(self.Handler)
+        self.Logger = logging.getLogger(Name)
+        self.Listener.start()
+        self.Running = True
+        atexit.register(self.Close)
+
+    def IsEnabled(self, Level):
+        """Return True if messages of Level, i.e. logging.INFO, are written otherwise False"""
+
+        return self.Logger.isEnabledFor(Level)
+
+    def Write(self, Level, Msg, *Args, Fields=None):
+        """Log Msg % Args at Level, Fields is dictionary added to the json log"""
+
+        if self.Logger.isEnabledFor(Level):
+            self.Logger.log(Level, Msg, *Args, extra={'fields': Fields})
+
+    def Debug(self, Msg, *Args, Fields=None):
+        """Log Msg % Args at DEBUG"""
 
-        if self.Level == 'DEBUG':
-            logging.basicConfig(filename=self.Filename, level=logging.DEBUG)
-        elif self.Level == 'INFO':
-            logging.basicConfig(filename=self.Filename, level=logging.INFO)
-        elif self.Level == 'WARNING':
-            logging.basicConfig(filename=self.Filename, level=logging.WARNING)
-        elif self.Level == 'ERROR':
-            logging.basicConfig(filename=self.Filename, level=logging.ERROR)
-        elif self.Level == 'CRITICAL':
-            logging.basicConfig(filename=self.Filename, level=logging.CRITICAL)
-        else:
-            raise Exception('Invalid log level ' + self.Level)
+        self.Write(logging.DEBUG, Msg, *Args, Fields=Fields)
+
+    def Info(self, Msg, *Args, Fields=None):
+        """Log Msg % Args at INFO"""
+
+        self.Write(logging.INFO, Msg, *Args, Fields=Fields)
+
+    def Warning(self, Msg, *Args, Fields=None):
+        """Log Msg % Args at WARNING"""
+
+        self.Write(logging.WARNING, Msg, *Args, Fields=Fields)
+
+    def Summary(self, Msg, *Args):
+        """Log Msg % Args at INFO whatever the level and print it in every console mode"""
+
+        self.Handler.handle(self.Logger.makeRecord(self.Logger.name, logging.INFO, '', 0, Msg, Args, None, \
+                                                   extra={'always': True}))
+
+    def Progress(self, Msg, *Args, Force=False):
+        """Print Msg % Args in progress console mode, at most once every ProgressSeconds unless Force is True"""
+
+        if self.Console != 'progress':
+            return
+        Now = time.monotonic()
+        if not Force and Now - self.ProgressAt < self.ProgressSeconds:
+            return
+        self.ProgressAt = Now
+        self.Handler.handle(self.Logger.makeRecord(self.Logger.name, logging.INFO, '', 0, Msg, Args, None, \
+                                                   extra={'progress': True}))
 
     def TeeLog(self, msg=None, level=0):
         """print to console and log"""
 
         if msg != None:
-            print(msg)
-            logging.info(msg) if level == 0 else logging.warning(msg)
+            self.Write(logging.INFO if level == 0 else logging.WARNING, msg)
+
+    def Close(self):
+        """Write queued records and stop the listener"""
+
+        if self.Running:
+            self.Running = False
+            self.Listener.stop()
+            logging.getLogger().removeHandler(self.Handler)
@@ -0,0 +1,102 @@
+"""This module provides the tag diff of plan and apply runs and reads and writes plan files"""
+
+import json
+
+### action of each planned tag, only WriteActions are sent by apply
+Actions = ['add', 'change', 'unchanged', 'skip-unknown', 'skip-exists']
+WriteActions = ['add', 'change']
+
+def IsUnknown(TagValue):
+    """Return True if a csv tag value means the value is not known, i.e. Unknown or None"""
+
+    return TagValue.lower() == 'unknown' or TagValue.lower() == 'none'
+
+
+def DiffTags(Current, Desired, Overwrite=False):
+    """Compare desired tags with the current tags of a resource
+
+    Return {TagName: {'action': Action, 'current': CurrentValue, 'desired': DesiredValue}}, where
+    current is None when the resource does not have the tag. Tags that exist with another value
+    are changed only if Overwrite is True, otherwise they are skip-exists."""
+
+    Diff = {}
+    for TagName, TagValue in Desired.items():
+        Existing = Current.get(TagName)
+        if IsUnknown(TagValue):
+            Action = 'skip-unknown'
+        elif Existing == None:
+            Action = 'add'
+        elif Existing == TagValue:
+            Action = 'unchanged'
+        elif Overwrite:
+            Action = 'change'
+        else:
+            Action = 'skip-exists'
+        Diff[TagName] = {'action': Action, 'current': Existing, 'desired': TagValue}
+
+    return Diff
+
+
+def GetWrites(Diff):
+    """Return {TagName: TagValue} of the tags of a diff that need a write"""
+
+    return {TagName: Tag['desired'] for TagName, Tag in Diff.items() if Tag['action'] in WriteActions}
+
+
+class PlanWriter:
+    """Write one json line per csv row with its location, target and tag diff, and count actions"""
+
+    def __init__(self, Filename, Append=False):
+        """Constructor, Append adds to an existing plan, i.e. when a plan run resumes"""
+
+        self.Filename = Filename
+        self.Stream = open(Filename, 'a' if Append else 'w', encoding='utf-8')
+        self.Counts = {Action: 0 for Action in Actions + ['error']}
+
+    def Write(self, Rows, Service, Account, Region, ResourceId, Diff, Error=None):
+        """Write the plan of an update, Rows is list of (Number, Start, End) of its csv rows and Diff is None if
+        tags could not be read. The first row locates the entry, rows lists every row if several were merged"""
+
+        Entry = {
+            'row': Rows[0][0], 'start': Rows[0][1], 'end': Rows[0][2], 'service': Service, 'account': Account,
+            'region': Region, 'resource_id': str(ResourceId), 'tags': Diff if Diff != None else {}
+        }
+        if len(Rows) > 1:
+            Entry['rows'] = [list(Row) for Row in Rows]
+        if Error != None:
+            Entry['error'] = Error
+            self.Counts['error'] += 1
+        for Tag in Entry['tags'].values():
+            self.Counts[Tag['action']] += 1
+        self.Stream.write(json.dumps(Entry, sort_keys=True) + '\n')
+
+    def Close(self):
+        """Close the plan file"""
+
+        self.Stream.close()
+
+    def GetStats(self):
+        """Return number of planned tags per action and number of rows with errors"""
+
+        return dict(self.Counts)
+
+
+class PlanReader:
+    """Iterate plan entries of a binary stream as (Start, End, Entry), where Start and End are byte offsets"""
+
+    def __init__(self, Stream, Offset=0):
+        """Constructor, Offset is the byte offset to start reading at"""
+
+        self.Stream = Stream
+        self.Offset = Offset
+        self.Stream.seek(Offset)
+
+    def __iter__(self):
+        while True:
+            Line = self.Stream.readline()
+            if not Line:
+                return
+            Start = self.Offset
+            self.Offset += len(Line)
+            if Line.strip():
+                yield Start, self.Offset, json.loads(Line.decode('utf-8'))
@@ -0,0 +1,275 @@
+"""This module measures wall and cpu time per phase of a run and writes a report that can be diffed between releases
+
+Phases are timed in the thread that runs them, so cpu time is the time of that thread and
+phases that run on several workers add up their wall times. A cProfile or sampling profile of
+the functions can be added to the report."""
+
+import cProfile
+import os
+import platform
+import pstats
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+### phases in report order, phases that did not run are reported with zero calls
+PhaseNames = ['startup', 'ingest', 'planning', 'discovery', 'reads', 'writes', 'reporting']
+
+### phases only times phases, cprofile also profiles every function and sample takes stack samples of every thread
+ProfilerModes = ['phases', 'cprofile', 'sample']
+
+def GetFunctionName(Filename, Name):
+    """Return file:function with the last two parts of the file path, so names do not change with the install path"""
+
+    return '/'.join(Filename.replace('\\', '/').split('/')[-2:]) + ':' + Name
+
+
+class PhaseTimer:
+    """Context manager that adds its wall and thread cpu time to a phase"""
+
+    __slots__ = ('Profiler', 'Name', 'Wall', 'Cpu')
+
+    def __init__(self, Profiler, Name):
+        """Constructor"""
+
+        self.Profiler = Profiler
+        self.Name = Name
+
+    def __enter__(self):
+        self.Wall = time.perf_counter()
+        self.Cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *Exc):
+        self.Profiler.Add(self.Name, time.perf_counter() - self.Wall, time.thread_time() - self.Cpu)
+        return False
+
+
+class PhaseProfiler:
+    """Collect calls, wall and cpu time per phase, disabled until Start() so timing costs nothing by default"""
+
+    def __init__(self):
+        """Constructor"""
+
+        self.Enabled = False
+        self.Lock = threading.Lock()
+        self.Phases = {}
+        self.Filename = None
+        self.Mode = 'phases'
+        self.SampleSeconds = 0.01
+        self.Started = None
+        self.Profiles = []
+        self.Times = None
+        self.Samples = {}
+        self.SampleCount = 0
+        self.Sampler = None
+        self.Stopped = threading.Event()
+
+    def Start(self, Filename, Mode='phases', Started=None, SampleSeconds=0.01):
+        """Start profiling and write the report to Filename at Stop()
+
+        Started is (perf_counter(), thread_time()) taken when the script started, the time since
+        then is the startup phase, i.e. imports and argument parsing."""
+
+        if Mode not in ProfilerModes:
+            raise Exception('Invalid profiler mode ' + str(Mode))
+
+        self.Filename = Filename
+        self.Mode = Mode
+        self.SampleSeconds = SampleSeconds
+        self.Started = Started if Started != None else (time.perf_counter(), time.thread_time())
+        self.Times = os.times()
+        self.Enabled = True
+        self.Add('startup', time.perf_counter() - self.Started[0], time.thread_time() - self.Started[1])
+
+        if self.Mode == 'cprofile':
+            self.Profiles.append(cProfile.Profile())
+            self.Profiles[0].enable()
+            threading.setprofile(self.ProfileThread)
+        elif self.Mode == 'sample':
+            self.Sampler = threading.Thread(target=self.Sample, daemon=True)
+            self.Sampler.start()
+
+    def Add(self, Name, Wall, Cpu):
+        """Add one call of a phase"""
+
+        with self.Lock:
+            Phase = self.Phases.setdefault(Name, [0, 0.0, 0.0])
+            Phase[0] += 1
+            Phase[1] += Wall
+            Phase[2] += Cpu
+
+    def Phase(self, Name):
+        """Return a context manager that times a phase, i.e. with Profiler.Phase('reads'): ..."""
+
+        if not self.Enabled:
+            return nullcontext()
+
+        return PhaseTimer(self, Name)
+
+    def Wrap(self, Name, Function):
+        """Return Function timed as a phase, Function itself when profiling is off"""
+
+        if not self.Enabled:
+            return Function
+
+        def Timed(*Args, **Kwargs):
+            with PhaseTimer(self, Name):
+                return Function(*Args, **Kwargs)
+
+        return Timed
+
+    def ProfileThread(self, Frame, Event, Arg):
+        """Start a cProfile profile in a new thread, set with threading.setprofile() since cProfile only sees its own thread"""
+
+        Profile = cProfile.Profile()
+        with self.Lock:
+            self.Profiles.append(Profile)
+        Profile.enable()
+
+    def Iterate(self, Name, Iterable):
+        """Yield the items of Iterable, timing each next() as a phase, Iterable itself when profiling is off"""
+
+        if not self.Enabled:
+            return Iterable
+
+        def Timed():
+            Iterator = iter(Iterable)
+            while True:
+                with PhaseTimer(self, Name):
+                    Item = next(Iterator, StopIteration)
+                if Item is StopIteration:
+                    return
+                yield Item
+
+        return Timed()
+
+    def Sample(self):
+        """Count the stack of every other thread every SampleSeconds as folded stacks, root first"""
+
+        Self = threading.get_ident()
+        while not self.Stopped.wait(self.SampleSeconds):
+            for Ident, Frame in sys._current_frames().items():
+                if Ident == Self:
+                    continue
+                Stack = []
+                while Frame != None:
+                    Stack.append(GetFunctionName(Frame.f_code.co_filename, Frame.f_code.co_name))
+                    Frame = Frame.f_back
+                Folded = ';'.join(reversed(Stack))
+                self.Samples[Folded] = self.Samples.get(Folded, 0) + 1
+            self.SampleCount += 1
+
+    def Stop(self):
+        """Stop profiling and write the report, Filename + '.pstats' with cprofile and Filename + '.folded' with sample"""
+
+        if not self.Enabled:
+            return
+
+        Wall = time.perf_counter() - self.Started[0]
+        Times = os.times()
+        self.Enabled = False
+        if self.Mode == 'cprofile':
+            threading.setprofile(None)
+            self.Profiles[0].disable()
+        elif self.Mode == 'sample':
+            self.Stopped.set()
+            self.Sampler.join()
+
+        Lines = ['# profile of ' + os.path.basename(sys.argv[0]) + ' mode=' + self.Mode + ' python=' + \
+                 platform.python_version(), '%-12s %8s %12s %12s %12s' % ('phase', 'calls', 'wall_s', 'cpu_s', 'wall_ms/call')]
+        with self.Lock:
+            Phases = dict(self.Phases)
+        for Name in PhaseNames + sorted(set(Phases) - set(PhaseNames)):
+            Calls, PhaseWall, Cpu = Phases.get(Name, [0, 0.0, 0.0])
+            Lines.append('%-12s %8d %12.3f %12.3f %12.3f' % (Name, Calls, PhaseWall, Cpu, \
+                                                             PhaseWall * 1000 / Calls if Calls > 0 else 0.0))
+
+        ### process cpu includes every thread, children are parser processes that have exited
+        Lines.append('%-12s %8d %12.3f %12.3f %12s' % ('total', 1, Wall, Phases['startup'][2] + \
+                                                       (Times.user - self.Times.user) + (Times.system - self.Times.system), ''))
+        Lines.append('%-12s %8d %12s %12.3f %12s' % ('children', 0, '', (Times.children_user - self.Times.children_user) + \
+                                                     (Times.children_system - self.Times.children_system), ''))
+
+        if self.Mode == 'cprofile':
+            Stats = pstats.Stats(*self.Profiles)
+            Stats.dump_stats(self.Filename + '.pstats')
+            Lines += self.GetFunctionLines([(GetFunctionName(File, Name), Calls, Own, Cumulative) for \
+                                            (File, Line, Name), (Primitive, Calls, Own, Cumulative, Callers) in \
+                                            Stats.stats.items()])
+        elif self.Mode == 'sample':
+            with open(self.Filename + '.folded', 'w', encoding='utf-8') as Stream:
+                for Folded, Count in sorted(self.Samples.items()):
+                    Stream.write(Folded + ' ' + str(Count) + '\n')
+            Own = {}
+            Cumulative = {}
+            for Folded, Count in self.Samples.items():
+                Stack = Folded.split(';')
+                Own[Stack[-1]] = Own.get(Stack[-1], 0) + Count
+                for Name in set(Stack):
+                    Cumulative[Name] = Cumulative.get(Name, 0) + Count
+            Lines += self.GetFunctionLines([(Name, Cumulative[Name], Own.get(Name, 0) * self.SampleSeconds, \
+                                             Cumulative[Name] * self.SampleSeconds) for Name in Cumulative])
+
+        with open(self.Filename, 'w', encoding='utf-8') as Stream:
+            Stream.write('\n'.join([Line.rstrip() for Line in Lines]) + '\n')
+
+    def GetFunctionLines(self, Functions, Count=40):
+        """Return report lines of the Count functions with the most own time, Functions is list of (Name, Calls, Own, Cumulative)
+
+        Functions of the same name in a file are added up. With sample Calls is the number of
+        samples the function was on the stack."""
+
+        Merged = {}
+        for Name, Calls, Own, Cumulative in Functions:
+            Function = Merged.setdefault(Name, [0, 0.0, 0.0])
+            Function[0] += Calls
+            Function[1] += Own
+            Function[2] += Cumulative
+
+        Lines = ['', '%-60s %10s %12s %12s' % ('function', 'calls', 'own_s', 'cumulative_s')]
+        for Name, (Calls, Own, Cumulative) in sorted(Merged.items(), key=lambda Item: (-Item[1][1], Item[0]))[:Count]:
+            Lines.append('%-60s %10d %12.3f %12.3f' % (Name, Calls, Own, Cumulative))
+
+        return Lines
+
+    def GetStats(self):
+        """Return {Phase: {'Calls': n, 'Wall': seconds, 'Cpu': seconds}}"""
+
+        with self.Lock:
+            return {Name: {'Calls': Calls, 'Wall': round(Wall, 6), 'Cpu': round(Cpu, 6)} for Name, (Calls, Wall, Cpu) \
+                    in self.Phases.items()}
+
+
+### process-wide profiler, disabled unless a script is run with --profile
+Profiler = PhaseProfiler()
+
+def StartProfiler(Filename, Mode='phases', Started=None):
+    """Start profiling, see PhaseProfiler.Start()"""
+
+    Profiler.Start(Filename, Mode, Started)
+
+
+def Phase(Name):
+    """Return a context manager that times a phase"""
+
+    return Profiler.Phase(Name)
+
+
+def WrapPhase(Name, Function):
+    """Return Function timed as a phase"""
+
+    return Profiler.Wrap(Name, Function)
+
+
+def IteratePhase(Name, Iterable):
+    """Return Iterable with each next() timed as a phase"""
+
+    return Profiler.Iterate(Name, Iterable)
+
+
+def StopProfiler():
+    """Stop profiling and write the report"""
+
+    Profiler.Stop()
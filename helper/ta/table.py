@@ -0,0 +1,87 @@
+"""This module loads csv rows into columns and plans the updates: one tag set per resource, ordered by account, region and service"""
+
+import itertools
+from aws.arn import Parse
+from ta.plan import IsUnknown
+
+def MergeTags(TagSets):
+    """Merge tag sets in csv order, a later value replaces an earlier one unless it is Unknown or None"""
+
+    Merged = {}
+    for Tags in TagSets:
+        for TagName, TagValue in Tags.items():
+            if TagName not in Merged or not IsUnknown(TagValue):
+                Merged[TagName] = TagValue
+
+    return Merged
+
+
+class RowTable:
+    """Csv rows held column by column, i.e. every resource id in one list, so the whole file is planned in passes
+
+    Items are (Rows, Row) where Rows is list of (Number, Start, End) and Row is the
+    ta.ingest.ParseRow() tuple (ResourceId, Service, Account, Tags, Error)."""
+
+    def __init__(self, Items=()):
+        """Constructor, Items are appended in csv order"""
+
+        self.Rows = []
+        self.ResourceIds = []
+        self.Services = []
+        self.Accounts = []
+        self.Tags = []
+        self.Errors = []
+        self.Stats = {'Rows': 0, 'Invalid': 0, 'Duplicates': 0, 'Merged': 0, 'Updates': 0}
+        for Rows, Row in Items:
+            self.Append(Rows, Row)
+
+    def Append(self, Rows, Row):
+        """Append a csv row"""
+
+        ResourceId, Service, Account, Tags, Error = Row
+        self.Rows.append(Rows)
+        self.ResourceIds.append(ResourceId)
+        self.Services.append(Service)
+        self.Accounts.append(Account)
+        self.Tags.append(Tags)
+        self.Errors.append(Error)
+
+    def __len__(self):
+        return len(self.Rows)
+
+    def Plan(self):
+        """Return list of (Rows, Row), one per resource, invalid rows first and then ordered by account, region and service
+
+        Rows of the same service, account, region and resource are merged into one tag set with
+        MergeTags(), and rows that repeat another row exactly add nothing but their csv location.
+        The account of a row is its account column, otherwise the account of its arn."""
+
+        Valid = [i for i, Error in enumerate(self.Errors) if Error == None]
+        Refs = list(map(Parse, map(self.ResourceIds.__getitem__, Valid)))
+        Accounts = [Account if Account != None else Ref.Account for Account, Ref in \
+                    zip(map(self.Accounts.__getitem__, Valid), Refs)]
+        Keys = [(Account or '', Ref.Region or '', Service or '', Ref.Type or '', Ref.Id) for Account, Ref, Service in \
+                zip(Accounts, Refs, map(self.Services.__getitem__, Valid))]
+        Signatures = set(zip(Keys, (frozenset(Tags.items()) for Tags in map(self.Tags.__getitem__, Valid))))
+
+        ### sorting is stable, so the rows of a resource keep their csv order for MergeTags()
+        Order = sorted(range(len(Valid)), key=Keys.__getitem__)
+
+        Plan = [(self.Rows[i], (self.ResourceIds[i], self.Services[i], self.Accounts[i], self.Tags[i], self.Errors[i])) \
+                for i, Error in enumerate(self.Errors) if Error != None]
+        for Key, Group in itertools.groupby(Order, key=Keys.__getitem__):
+            Group = [Valid[j] for j in Group]
+            First = Group[0]
+            Plan.append((list(itertools.chain.from_iterable(map(self.Rows.__getitem__, Group))), \
+                         (self.ResourceIds[First], self.Services[First], Key[0] or None, \
+                          MergeTags(map(self.Tags.__getitem__, Group)), None)))
+
+        self.Stats = {'Rows': len(self), 'Invalid': len(self) - len(Valid), 'Duplicates': len(Valid) - len(Signatures), \
+                      'Merged': len(Signatures) - (len(Plan) - len(self) + len(Valid)), 'Updates': len(Plan)}
+
+        return Plan
+
+    def GetStats(self):
+        """Return number of rows, invalid rows, exact duplicates, rows merged into another row and planned updates"""
+
+        return dict(self.Stats)
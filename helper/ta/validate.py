@@ -0,0 +1,116 @@
+"""This module checks csv rows against the tag rules of each service before any api call and writes rejected rows"""
+
+import csv
+import re
+from aws.registry import GetDescriptor
+from aws.tag import AwsTag, InvalidEc2TypeError
+from ta.plan import IsUnknown
+
+### prefix reserved for tags created by aws
+ReservedPrefix = 'aws:'
+
+class TagValidator:
+    """Check resource ids, services and tags of rows and return the reason a row cannot succeed
+
+    Results are memoized per service and text, so a file is checked once per distinct key and
+    value, not once per row."""
+
+    def __init__(self):
+        """Constructor"""
+
+        self.Patterns = {}
+        self.Checked = {}
+
+    def GetPattern(self, Service, Chars):
+        """Return compiled pattern of the allowed tag characters of a service"""
+
+        if Service not in self.Patterns:
+            self.Patterns[Service] = re.compile(Chars)
+        return self.Patterns[Service]
+
+    def CheckText(self, Service, Kind, Text):
+        """Return why a tag key or value, Kind is 'key' or 'value', is not accepted by a service, None if it is"""
+
+        Key = (Service, Kind, Text)
+        if Key in self.Checked:
+            return self.Checked[Key]
+
+        Descriptor = GetDescriptor(Service)
+        MaxLength = Descriptor.TagLimits[0 if Kind == 'key' else 1]
+        Reason = None
+        if Kind == 'key' and len(Text) == 0:
+            Reason = 'tag key is empty'
+        elif len(Text) > MaxLength:
+            Reason = 'tag ' + Kind + ' ' + Text[:32] + '... is longer than ' + str(MaxLength) + ' characters'
+        elif Kind == 'key' and Text.lower().startswith(ReservedPrefix):
+            Reason = 'tag key ' + Text + ' uses the reserved prefix ' + ReservedPrefix
+        elif Descriptor.TagChars != None and self.GetPattern(Service, Descriptor.TagChars).fullmatch(Text) == None:
+            Reason = 'tag ' + Kind + ' ' + Text + ' has characters ' + Service + ' does not allow'
+        self.Checked[Key] = Reason
+
+        return Reason
+
+    def CheckRow(self, ResourceId, CsvService, Service, Tags):
+        """Return why a row cannot be updated, None if it can
+
+        Service is the boto3 name of CsvService, None if it is not supported. Tag values that are
+        Unknown or None are never written and are not checked. An ec2 row is checked against the
+        rules of its ec2 type, i.e. elb for a classic load balancer arn."""
+
+        if ResourceId.strip() == '':
+            return 'resource_id is empty'
+        if Service == None or GetDescriptor(Service) == None:
+            return 'service ' + CsvService + ' is not supported'
+        if Service == 'ec2':
+            try:
+                Service = AwsTag(Service, ResourceId).GetServiceName()
+            except InvalidEc2TypeError as e:
+                return str(e)
+        for TagName, TagValue in Tags.items():
+            Reason = self.CheckText(Service, 'key', TagName)
+            if Reason == None and not IsUnknown(TagValue):
+                Reason = self.CheckText(Service, 'value', TagValue)
+            if Reason != None:
+                return Reason
+
+        return None
+
+
+class RejectWriter:
+    """Write rejected csv rows with their reason, the file is created with the first rejected row"""
+
+    Header = ['row', 'start', 'end', 'resource_id', 'service', 'reason']
+
+    def __init__(self, Filename, Append=False):
+        """Constructor, Append adds to an existing reject file, i.e. when a run resumes"""
+
+        self.Filename = Filename
+        self.Append = Append
+        self.Stream = None
+        self.Writer = None
+        self.Rejected = 0
+
+    def Write(self, Rows, ResourceId, Service, Reason):
+        """Write every csv row of a rejected update, Rows is list of (Number, Start, End)"""
+
+        if self.Stream == None:
+            self.Stream = open(self.Filename, 'a' if self.Append else 'w', newline='', encoding='utf-8')
+            self.Writer = csv.writer(self.Stream)
+            if self.Stream.tell() == 0:
+                self.Writer.writerow(RejectWriter.Header)
+        for Number, Start, End in Rows:
+            self.Writer.writerow([Number, Start, End, ResourceId if ResourceId != None else '', \
+                                  Service if Service != None else '', Reason])
+            self.Rejected += 1
+
+    def Close(self):
+        """Close the reject file"""
+
+        if self.Stream != None:
+            self.Stream.close()
+            self.Stream = None
+
+    def GetStats(self):
+        """Return number of rejected rows"""
+
+        return {'Rejected': self.Rejected}
@@ -0,0 +1,81 @@
+"""This module provides a thread pool that caps how many tasks run at once for each AWS service"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class WorkerPool:
+    """Run tasks on worker threads with a concurrency limit per service and account, and a limit on accounts"""
+
+    ### default number of concurrent tasks per service, based on how aggressively each api throttles tagging
+    __Limits = {
+                    's3': 4, 'ec2': 8, 'rds': 2, 'elasticache': 2, 'redshift': 2, 'route53': 1,
+                    'cloudfront': 1, 'directconnect': 2, 'workspaces': 2, 'ds': 2, 'datapipeline': 2
+                }
+
+    def __init__(self, Workers=1, Limits=None, MaxAccounts=None):
+        """Constructor, Limits overrides the default limit of a service, i.e. {'s3': 2}
+
+        MaxAccounts caps how many accounts have tasks running at once, None for no cap"""
+
+        self.Workers = Workers
+        self.Limits = dict(WorkerPool.__Limits)
+        if Limits != None:
+            self.Limits.update(Limits)
+        self.Lock = threading.Lock()
+        self.Semaphores = {}
+        self.MaxAccounts = MaxAccounts
+        self.AccountsChanged = threading.Condition()
+        self.ActiveAccounts = {}
+        self.Executor = ThreadPoolExecutor(max_workers=Workers)
+
+    def GetSemaphore(self, Service, Account=None):
+        """Return semaphore limiting concurrent tasks of a service, api limits apply to each account separately"""
+
+        with self.Lock:
+            Key = (Service, Account)
+            if Key not in self.Semaphores:
+                self.Semaphores[Key] = threading.BoundedSemaphore(min(self.Workers, self.Limits.get(Service, self.Workers)))
+            return self.Semaphores[Key]
+
+    def EnterAccount(self, Account):
+        """Wait until account is already running or fewer than MaxAccounts accounts are running"""
+
+        with self.AccountsChanged:
+            while self.MaxAccounts != None and Account not in self.ActiveAccounts and \
+                  len(self.ActiveAccounts) >= self.MaxAccounts:
+                self.AccountsChanged.wait()
+            self.ActiveAccounts[Account] = self.ActiveAccounts.get(Account, 0) + 1
+
+    def LeaveAccount(self, Account):
+        """Release a task of account and wake waiting tasks once the account has none running"""
+
+        with self.AccountsChanged:
+            self.ActiveAccounts[Account] -= 1
+            if self.ActiveAccounts[Account] == 0:
+                del self.ActiveAccounts[Account]
+                self.AccountsChanged.notify_all()
+
+    def Run(self, Service, Function, Args, Kwargs, Account=None):
+        """Run function while holding a slot of its account and service"""
+
+        self.EnterAccount(Account)
+        try:
+            with self.GetSemaphore(Service, Account):
+                return Function(*Args, **Kwargs)
+        finally:
+            self.LeaveAccount(Account)
+
+    def Submit(self, Service, Function, *Args, **Kwargs):
+        """Schedule function for service and return a Future"""
+
+        return self.Executor.submit(self.Run, Service, Function, Args, Kwargs)
+
+    def SubmitAccount(self, Account, Service, Function, *Args, **Kwargs):
+        """Schedule function for service in account and return a Future"""
+
+        return self.Executor.submit(self.Run, Service, Function, Args, Kwargs, Account)
+
+    def Shutdown(self):
+        """Wait for running tasks and release worker threads"""
+
+        self.Executor.shutdown(wait=True)
@@ -1,78 +1,257 @@
-import csv, sys, argparse
+import csv, sys, argparse, logging, queue, threading, time
+### taken before the helper modules are imported, so --profile reports the imports in the startup phase
+Started = (time.perf_counter(), time.thread_time())
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from sys import path
 path.append('helper')
 path.append('C:/Users/cdang/Python/python3.5/packages')
-from aws.tag import UpdateTag, IsTagExists, GetResources, GetTagValues
-from ta.log import Log
+from aws.tag import UpdateTag, IsTagExists, GetResources, IterResources, GetTagValues, GetAllTags
+from aws.client import GetClientStats
+from aws.cache import GetTagCacheStats
+from aws.throttle import GetThrottleStats
+from aws.metrics import GetCallMetrics, GetSlowestOperations, WriteCallMetrics
+from aws.inventory import IterResourceTags
+from aws.registry import IsGlobalService
+from aws.region import GetRegions, GetDefaultRegion, GetRegionStats
+from aws.account import ConfigureAccounts, GetAccountId, RunForAccounts, GetAccountStats
+from aws.store import OpenInventoryStore, GetInventoryStoreStats
+from ta.log import Log, Line
 from ta.services import GetB3ServiceName, GetServices
 from ta.tools import GetKeys
+from ta.profiler import StartProfiler, StopProfiler, Phase, IteratePhase
 import boto3
 
 
+### TEST - use variable to control services to test - remove in prod
+ServicesToTest = ['s3']
+
+### ec2 resource types to scan, i.e. ['volume', 'snapshot'], None scans every type
+Ec2TypesToScan = None
+
+TagName = 'Channel'
+
+### inventory store opened with --store, None discovers every resource from aws
+Store = None
+
+### csv rows and log lines of every region go to the writer through this queue, scans wait while it is full
+Output = queue.Queue(maxsize=10000)
+
+def ScanRegion(Region, Services, IncludeGlobal, Account=None, AccountId=''):
+    """Check every service in a region of an account and return ResourcesDiscovered
+
+    Csv rows of resources missing TagName are put on Output as ('row', Row) and messages to log as
+    ('line', (Level, Parts)) as they are found, per resource messages only when INFO is written. Global
+    services are only checked when IncludeGlobal is True so they are reported once per account.
+    Account is the account to assume a role in, None for the ambient credentials, and AccountId
+    is written to the account_id column."""
+
+    ResourcesDiscovered = {}
+    Verbose = L.IsEnabled(logging.INFO)
+    for CsvService, B3Service in Services.items():
+
+        ### TEST - REMOVE IN PROD
+        if B3Service not in ServicesToTest:
+            continue
+        if IsGlobalService(B3Service) and not IncludeGlobal:
+            continue
+
+        Prefix = (AccountId, ':', Region, ':', CsvService, ':', B3Service, ':::')
+        ResourceRegion = 'global' if IsGlobalService(B3Service) else Region
+        Output.put(('line', (logging.INFO, Prefix + ('Gathering resources',))))
+        ResourcesDiscovered[CsvService] = 0
+        try:
+            if Store != None:
+                ### rediscover the partition only when it is older than the service ttl, then answer from local data
+                with Phase('discovery'):
+                    Store.Refresh(B3Service, Region, Account, Ec2TypesToScan)
+                Resources = Store.IterResourceTags(B3Service, Region, Account, Ec2TypesToScan)
+            else:
+                ### check tags while discovery pages are still arriving; covered services read tags 100 resources at a time
+                Resources = IterResourceTags(B3Service, Ec2TypesToScan, Region=Region, Account=Account)
+            for ResourceId, ResourceTags, Error in IteratePhase('discovery', Resources):
+                ResourcesDiscovered[CsvService] += 1
+                if Verbose:
+                    Output.put(('line', (logging.INFO, Prefix + ('Check whether resource id', ResourceId, 'has tag', \
+                                                                 TagName))))
+                if Error != None:
+                    Output.put(('line', (logging.WARNING, Prefix + ('Skip ... unable to verify tag exists:', Error))))
+                    continue
+                if TagName not in ResourceTags:
+                    if Verbose:
+                        Output.put(('line', (logging.INFO, Prefix + ('Adding resource id', ResourceId, \
+                                                                     'to csv file since tag', TagName, 'missing'))))
+
+                    ### look up other tags
+                    Tags = {'Channel': '', 'BillingCostCenter': '', 'Name': '', 'Environment': ''}
+                    for T in Tags:
+                        Tags[T] = ResourceTags.get(T, '')
+
+                    if Verbose:
+                        Output.put(('line', (logging.INFO, Prefix + ('Other tags for resource id', ResourceId, 'includes', \
+                                                                     Tags))))
+                    Output.put(('row', [ResourceId] + [CsvService] + [AccountId] + [ResourceRegion] + [Tags['Channel']] + \
+                                       [Tags['BillingCostCenter']] + [Tags['Name']]  + [Tags['Environment']]))
+                elif Verbose:
+                    Output.put(('line', (logging.INFO, Prefix + ('Tag', TagName, 'exists for resource', ResourceId, \
+                                                                 'so will not add to csv file'))))
+        except Exception as e:
+            Output.put(('line', (logging.WARNING, Prefix + ('Skip ... unable to get resources:', e))))
+            continue
+        if ResourcesDiscovered[CsvService] == 0:
+            Output.put(('line', (logging.INFO, Prefix + ('There are no resources',))))
+        else:
+            Output.put(('line', (logging.INFO, Prefix + ('There are', ResourcesDiscovered[CsvService], 'resources'))))
+
+    return ResourcesDiscovered
+
+
+def ScanAccount(Account, RegionNames, Services):
+    """Scan the regions of an account concurrently and return list of ResourcesDiscovered of each region
+
+    RegionNames is list of region names or ['all'] for every region enabled for the account"""
+
+    ### the account_id column is only a label, so an unreadable caller identity does not stop the scan
+    try:
+        AccountId = GetAccountId(Account)
+    except Exception as e:
+        AccountId = ''
+    Regions = GetRegions(Account) if RegionNames == ['all'] else RegionNames
+
+    ### each region uses its own pooled clients and throttle, so an account takes about as long as its slowest region
+    Executor = ThreadPoolExecutor(max_workers=max(1, len(Regions)))
+    try:
+        Futures = [Executor.submit(ScanRegion, Region, Services, i == 0, Account, AccountId) \
+                   for i, Region in enumerate(Regions)]
+        return [Future.result() for Future in as_completed(Futures)]
+    finally:
+        Executor.shutdown(wait=True)
+
+
+### get accounts and regions to scan, ambient account and default region if not given
+parser = argparse.ArgumentParser()
+parser.add_argument('--regions', nargs='+', required=False, metavar='all|region', default=None, help='all to scan \
+                    every region enabled for the account, or one or more region names. Regions are scanned \
+                    concurrently and default to the default region')
+parser.add_argument('--accounts', nargs='+', required=False, metavar='AccountId', default=None, help='account ids \
+                    to scan by assuming --role in each, default is the account of the ambient credentials')
+parser.add_argument('--role', required=False, metavar='RoleName', default=None, help='role assumed in each account')
+parser.add_argument('--max-accounts', required=False, metavar='N', type=int, default=8, help='number of accounts \
+                    scanned at once')
+parser.add_argument('--store', required=False, metavar='filename', default=None, help='sqlite inventory database, \
+                    only partitions older than their service ttl are rediscovered and the rest is read locally')
+parser.add_argument('--log-level', required=False, metavar='LEVEL', choices=['DEBUG', 'INFO', 'WARNING'], \
+                    default='INFO', help='DEBUG, INFO or WARNING, default is INFO')
+parser.add_argument('--console', required=False, metavar='all|quiet|progress', choices=['all', 'quiet', 'progress'], \
+                    default='all', help='all prints every message, quiet prints warnings and the summary, progress \
+                    also prints a progress line')
+parser.add_argument('--log-json', required=False, metavar='filename', default=None, help='also write the log as json \
+                    lines to filename')
+parser.add_argument('--metrics-json', required=False, metavar='filename', default=None, help='write call counts, latency \
+                    histograms, payload sizes and error codes of every aws call per service, operation and region as json')
+parser.add_argument('--metrics-prom', required=False, metavar='filename', default=None, help='write the aws call metrics \
+                    as prometheus textfile, i.e. for the node exporter')
+parser.add_argument('--profile', required=False, metavar='filename', default=None, help='write wall and cpu time of \
+                    each phase (startup, discovery, reporting) to filename, in a format that can be diffed between releases')
+parser.add_argument('--profile-mode', required=False, metavar='phases|cprofile|sample', default='phases', \
+                    choices=['phases', 'cprofile', 'sample'], help='phases only times phases, cprofile also profiles \
+                    every function of every thread to filename.pstats, sample takes stack samples of every thread to \
+                    filename.folded, default is phases')
+parser.add_argument('--slowest', required=False, metavar='N', type=int, default=5, help='number of operations listed in \
+                    the summary by time spent, default is 5')
+Args = parser.parse_args()
+
+### initialize logging, records are written by a background thread
+L = Log(Filename='missing-tags.log', Level=Args.log_level, Console=Args.console, JsonFilename=Args.log_json)
+if Args.profile != None:
+    StartProfiler(Args.profile, Args.profile_mode, Started)
+if Args.store != None:
+    Store = OpenInventoryStore(Args.store)
+if Args.accounts != None and Args.role == None:
+    L.Warning('--accounts requires --role. See --help.')
+    sys.exit()
+if Args.role != None:
+    ConfigureAccounts(RoleName=Args.role)
+Accounts = Args.accounts if Args.accounts != None else [None]
+try:
+    RegionNames = Args.regions if Args.regions != None else [GetDefaultRegion()]
+except Exception as e:
+    L.Warning('Failed to get regions: %s', e)
+    sys.exit()
+
 ### open csv file
 try:
     WriteStream = open('missing-tags.csv', 'w', newline='')
     CsvWriter = csv.writer(WriteStream, delimiter=',')
 except Exception as e:
-    print("Failed to open file:", e)
+    L.Warning('Failed to open file: %s', e)
     sys.exit()
 
 ### write header to csv
-CsvWriter.writerow(['resource_id'] + ['service'] + ['tag_channel'] + ['tag_billing_cost_center'] + ['tag_name'] + \
-                   ['tag_environment'])
-
-
-### TEST - use variable to control services to test - remove in prod
-ServicesToTest = ['s3']
+CsvWriter.writerow(['resource_id'] + ['service'] + ['account_id'] + ['region'] + ['tag_channel'] + ['tag_billing_cost_center'] + \
+                   ['tag_name'] + ['tag_environment'])
 
 
 ### get services dictionary of CsvServiceName to B3ServiceName, i.e. AmazonApiGateway: apigateway
 Services = GetServices()
 ResourcesDiscovered = {}
-for CsvService, B3Service in Services.items():
+AccountsScanned = 0
+
+def ScanAccounts():
+    """Scan accounts concurrently, at most --max-accounts at once, each with its regions in parallel
 
-    ### TEST - REMOVE IN PROD
-    if B3Service not in ServicesToTest:
-        continue
+    Each finished account is put on Output as ('account', (Account, Results, Error)), and ('done', None) at the end"""
 
     try:
-        print(CsvService, ':', B3Service, '::: Gathering resources')
-        #Resources = GetResources(B3Service) if B3Service == 'lambda' else [] ###DEBUG - REMOVE WHEN DONE
-        Resources = GetResources(B3Service)
-        ResourcesDiscovered[CsvService] = len(Resources)
-    except Exception as e:
-        print(CsvService, ':', B3Service, '::: Skip ... unable to get resources:', e)
-        continue
-    if len(Resources) == 0:
-        print(CsvService, ':', B3Service, '::: There are no resources')
-    else:
-        TagName = 'Channel'
-        print(CsvService, ':', B3Service, '::: There are', len(Resources), 'resources')
-        for ResourceId in Resources: 
-            print(CsvService, ':', B3Service,'::: Check whether resource id', ResourceId, 'has tag', TagName)
-            try:
-                if not IsTagExists(B3Service, ResourceId, TagName):
-                    print(CsvService, ':', B3Service, '::: Adding resource id', ResourceId, 'to csv file since tag', TagName, 'missing')
+        for Item in RunForAccounts(Accounts, ScanAccount, RegionNames, Services, MaxAccounts=Args.max_accounts):
+            Output.put(('account', Item))
+    finally:
+        Output.put(('done', None))
 
-                    ### look up other tags
-                    Tags = {'Channel': '', 'BillingCostCenter': '', 'Name': '', 'Environment': ''}
-                    TempTags = GetTagValues(B3Service, ResourceId, list(Tags)) #[{TagName: TagValue}, {}, {}]
-                    for Tag in TempTags:
-                        for T,V in Tag.items():
-                            if T in Tags:
-                                Tags[T] = V
-
-                    print(CsvService, ':', B3Service, '::: Other tags for resource id', ResourceId, 'includes', Tags)
-                    # write to csv
-                    CsvWriter.writerow([ResourceId] + [CsvService] + [Tags['Channel']] + [Tags['BillingCostCenter']] + \
-		                       [Tags['Name']]  + [Tags['Environment']])
-                else:
-                    print(CsvService, ':', B3Service, '::: Tag', TagName, 'exists for resource', ResourceId, 'so will not add to csv file')
-            except Exception as e:
-                print(CsvService, ':', B3Service, '::: Skip ... unable to verify tag exists:', e)
+### write rows and messages while regions are scanned, so memory is bounded by the queue and not by an account
+Scanner = threading.Thread(target=ScanAccounts, daemon=True)
+Scanner.start()
+while True:
+    Kind, Item = Output.get()
+    if Kind == 'done':
+        break
+    with Phase('reporting'):
+        if Kind == 'row':
+            CsvWriter.writerow(Item)
+        elif Kind == 'line':
+            L.Write(Item[0], Line(*Item[1]))
+        else:
+            Account, Results, Error = Item
+            if Error != None:
+                L.Warning('%s ::: Skip ... unable to scan account: %s', Account, Error)
+                continue
+            for Discovered in Results:
+                for CsvService, Count in Discovered.items():
+                    ResourcesDiscovered[CsvService] = ResourcesDiscovered.get(CsvService, 0) + Count
+            AccountsScanned += 1
+            L.Progress('Accounts=%d/%d Resources=%d', AccountsScanned, len(Accounts), sum(ResourcesDiscovered.values()))
+Scanner.join()
 
 ### print summary
-print('Resources Discovered:', ResourcesDiscovered)
+with Phase('reporting'):
+    L.Summary('Accounts: %s', Accounts if Args.accounts != None else 'ambient credentials')
+    L.Summary('Regions: %s', RegionNames)
+    L.Summary('Resources Discovered: %s', ResourcesDiscovered)
+    L.Summary('Client pool: %s', GetClientStats())
+    L.Summary('Tag cache: %s', GetTagCacheStats())
+    L.Summary('Throttling: %s', GetThrottleStats())
+    L.Summary('Region map: %s', GetRegionStats())
+    L.Summary('Account sessions: %s', GetAccountStats())
+    L.Summary('Inventory store: %s', GetInventoryStoreStats())
+    Metrics = GetCallMetrics()
+    L.Summary('AWS calls: Calls=%d Errors=%d Seconds=%.3f', Metrics['Calls'], Metrics['Errors'], Metrics['Seconds'])
+    for Name, Stats in GetSlowestOperations(Args.slowest):
+        L.Summary('  %s calls=%d retries=%d errors=%s total=%.3fs mean=%.3fs p95<=%.3fs max=%.3fs', Name, Stats['Calls'], \
+                  Stats['Retries'], Stats['Errors'], Stats['Seconds'], Stats['MeanSeconds'], Stats['P95Seconds'], \
+                  Stats['MaxSeconds'])
+    WriteCallMetrics(Args.metrics_json, Args.metrics_prom)
+if Args.profile != None:
+    StopProfiler()
+    L.Summary('Profile: %s', Args.profile)
 
 ### close stream
 WriteStream.close()
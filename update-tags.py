@@ -1,10 +1,29 @@
-import csv, sys, argparse
+import csv, sys, argparse, logging, time
+### taken before the helper modules are imported, so --profile reports the imports in the startup phase
+Started = (time.perf_counter(), time.thread_time())
+from collections import deque
+from concurrent.futures import Future
 from sys import path
 path.append('helper')
 path.append('C:/Users/cdang/Python/python3.5/packages')
-from aws.tag import UpdateTag, IsTagExists, GetServiceName
+from aws.tag import UpdateTag, BulkUpdateTags, IsTagExists, GetAllTags, GetServiceName
+from aws.client import GetClientStats, ConfigureClientPool
+from aws.cache import GetTagCacheStats
+from aws.throttle import GetThrottleStats
+from aws.metrics import GetCallMetrics, GetSlowestOperations, WriteCallMetrics
+from aws.arn import Parse
+from aws.region import GetResourceRegion, GetRegionStats
+from aws.account import ConfigureAccounts, GetAccountStats
+from aws.store import OpenInventoryStore, GetInventoryStoreStats
+from aws.inventory import PrefetchTags
 from ta.log import Log
-from ta.services import GetB3ServiceName
+from ta.workers import WorkerPool
+from ta.journal import CsvOffsetReader, Journal
+from ta.ingest import CsvIngest
+from ta.table import RowTable
+from ta.validate import RejectWriter
+from ta.plan import DiffTags, GetWrites, IsUnknown, PlanWriter, PlanReader
+from ta.profiler import StartProfiler, StopProfiler, Phase, WrapPhase, IteratePhase
 
 #################################################
 #                                               #
@@ -13,7 +32,32 @@ from ta.services import GetB3ServiceName
 #################################################
 
 LogFileName = 'tagging.log'
+LogLevel = 'INFO'
+Verbose = True # False when INFO is not written, per row info messages are then not built
+Console = 'all' # all, quiet prints warnings and the summary, progress also prints a progress line
+LogJsonFileName = None # json lines log, None for no json log
+MetricsJsonFileName = None # aws call metrics written as json at the end of a run, None to not write them
+MetricsPromFileName = None # aws call metrics written as prometheus textfile at the end of a run
+SlowestOperations = 5 # operations listed in the summary by time spent
+ProfileFileName = None # wall and cpu time per phase written at the end of a run, None to not profile
+ProfileMode = 'phases' # phases, cprofile also profiles every function, sample takes stack samples
 Overwrite = False
+BatchRows = 1000 # rows buffered before pending tag updates are sent with BulkUpdateTags
+PrefetchRows = 100 # rows read together so their current tags can be read in bulk
+Workers = 1 # worker threads, 1 processes the csv serially
+Accounts = None # account ids to update, None updates every account in the csv
+RoleName = None # role assumed in each account, None uses the ambient credentials for every row
+MaxAccounts = None # accounts updated at once, None for no cap
+AccountResults = {} # Account: [Succeeded, Failed]
+Resume = False # True skips rows completed by a previous run of the same csv file
+JournalFileName = None # progress journal, defaults to the csv file name with .journal appended
+RejectFileName = None # rows that fail validation, defaults to the csv file name with .rejects appended
+Rejected = {} # Start: Reason of rows rejected by the parsers and not yet logged
+Mode = 'run' # run checks and writes, plan only writes the diff to PlanFileName, apply writes a plan
+PlanFileName = None
+Parsers = 0 # processes that parse csv chunks ahead of the tag updates, 0 parses in one background thread
+Ingest = None
+Coalesce = False # True loads the whole csv and merges the rows of each resource before any api call
 
 #################################################
 #                                               #
@@ -21,6 +65,165 @@ Overwrite = False
 #                                               #
 #################################################
 
+def GetRowAccount(Account, ResourceId):
+    """Return account id of a csv row from its account_id column or its arn, None if unknown"""
+
+    if Account != None:
+        return Account
+
+    return ResourceId.Account
+
+def GetRowServiceName(Service, ResourceId):
+    """Return service name of a row for its log header, Service when the resource id does not fit the service
+
+    A row that does not fit its service is rejected or fails on its own, its header must not stop the run."""
+
+    try:
+        return GetServiceName(Service, ResourceId)
+    except Exception:
+        return Service
+
+def CheckRow(Service, ResourceId, Tags, Account=None):
+    """Compare the tags of a row with the current tags of its resource and return (Diff, Region, Messages)
+
+    Diff is the ta.plan.DiffTags() result, None when the current tags cannot be read. Region is
+    the region of the resource, or None for the default region. Messages is list of (msg, level)
+    so a worker can return its log lines and the main thread can print them in row order."""
+
+    Messages = []
+
+    ### find the region here so s3 bucket lookups run on the workers, a row that fails either read is skipped on its own
+    with Phase('reads'):
+        try:
+            Region = GetResourceRegion(Service, ResourceId, Account)
+        except Exception as e:
+            Messages.append(('Skip update since we cannot find the region of ' + str(ResourceId) + ': ' + str(e), 1))
+            return None, None, Messages
+
+        ### read current tags, no read is needed when every value is Unknown or None
+        Known = [TagName for TagName, TagValue in Tags.items() if not IsUnknown(TagValue)]
+        try:
+            Current = GetAllTags(Service, ResourceId, Account) if len(Known) > 0 else {}
+        except Exception as e:
+            Messages.append(('Skip update since we cannot verify whether tags ' + str(Known) + ' exist: ' + str(e), 1))
+            return None, Region, Messages
+
+    with Phase('planning'):
+        Diff = DiffTags(Current, Tags, Overwrite)
+
+        ### skipped tags are only reported when INFO is written, so their messages are not built otherwise
+        for TagName, Tag in Diff.items() if Verbose else []:
+            if Tag['action'] == 'skip-unknown':
+                Messages.append(('Skip tag ' + TagName + ' since tag equals None or Unknown', 0))
+            elif Tag['action'] == 'skip-exists':
+                Messages.append(('Skip tag ' + TagName + ' for ' + str(ResourceId) + ' since tag exists and Overwrite is ' \
+                                 + str(Overwrite), 0))
+            elif Tag['action'] == 'unchanged':
+                Messages.append(('Skip tag ' + TagName + ' for ' + str(ResourceId) + ' since tag already has value ' + \
+                                 Tag['desired'], 0))
+
+    return Diff, Region, Messages
+
+def ReplanRow(Diff, Written):
+    """Return Diff compared again with Written, the {TagName: TagValue} earlier rows of the run queued for its resource
+
+    Rows are checked ahead of the writes, so the current tags of a row do not hold the writes of earlier
+    rows of the same resource that are still pending or were sent after the row was checked."""
+
+    Current = {TagName: Tag['current'] for TagName, Tag in Diff.items() if Tag['current'] != None}
+    Current.update({TagName: TagValue for TagName, TagValue in Written.items() if TagName in Diff})
+
+    return DiffTags(Current, {TagName: Tag['desired'] for TagName, Tag in Diff.items()}, Overwrite)
+
+def PrefetchBlock(Block, Pool):
+    """Read current tags of a block of rows in bulk, grouped by service and account, into the tag cache
+
+    Block is list of (Header, Rows, Service, Account, ResourceId, Tags, Ready), rows with a Ready
+    result need no check and are not read. Rows whose tags are not
+    prefetched are read one at a time by CheckRow()."""
+
+    Groups = {}
+    for Header, Rows, Service, Account, ResourceId, Tags, Ready in Block:
+        if Ready != None:
+            continue
+        Groups.setdefault((Service, Account), []).append(ResourceId)
+
+    Futures = [Pool.SubmitAccount(Account, Service, WrapPhase('reads', PrefetchTags), Service, ResourceIds, Account) \
+               for (Service, Account), ResourceIds in Groups.items()]
+    for Prefetch in Futures:
+        try:
+            Prefetch.result()
+        except Exception as e:
+            ### prefetch only saves calls, CheckRow reads these tags and reports errors
+            pass
+
+def FlushUpdates(Pending, L, Pool, J):
+    """Send pending updates grouped by service, region and account with BulkUpdateTags and return (Succeeded, Failed) counts
+
+    Pending is list of (Service, Region, Account, ResourceId, {TagName: TagValue}, [(Number, Start, End)]),
+    where the last item locates the csv rows of the update. The updates of each group are split into one chunk per
+    worker so batches run concurrently, accounts run in parallel up to MaxAccounts and every call goes
+    to a client in the region and account of its resources. Each row is recorded in journal J."""
+
+    Succeeded = 0
+    Failed = 0
+
+    Groups = {}
+    for Service, Region, Account, ResourceId, Tags, Rows in Pending:
+        Groups.setdefault((Service, Region, Account), []).append((ResourceId, Tags, Rows))
+
+    Futures = []
+    for (Service, Region, Account), Updates in Groups.items():
+        ChunkRows = -(-len(Updates) // Pool.Workers)
+        for i in range(0, len(Updates), ChunkRows):
+            Chunk = Updates[i:i + ChunkRows]
+            Requests = [(ResourceId, Tags) for ResourceId, Tags, Rows in Chunk]
+            Futures.append((Service, Account, [Rows for ResourceId, Tags, Rows in Chunk], \
+                            Pool.SubmitAccount(Account, Service, WrapPhase('writes', BulkUpdateTags), Service, Requests, \
+                                              Account)))
+
+    for Service, Account, Updates, Batch in Futures:
+        Counts = AccountResults.setdefault(str(Account), [0, 0])
+        for (ResourceId, Success, Error), Rows in zip(Batch.result(), Updates):
+            if Success:
+                L.Info('Successfully updated account=%s resourceid=%s', Account, ResourceId, \
+                       Fields={'event': 'updated', 'service': Service, 'account': Account, 'resource_id': ResourceId})
+                Succeeded += 1
+                Counts[0] += 1
+            elif getattr(Error, 'Code', None) == 'OperationAborted' and Service == 's3':
+                L.Info('Encountered a known exception while trying to update s3 bucket tag that can typically be ' \
+                       'ignored and assumed successful on account=%s resourceid=%s: %s', Account, ResourceId, Error, \
+                       Fields={'event': 'updated', 'service': Service, 'account': Account, 'resource_id': ResourceId})
+                Succeeded += 1
+                Counts[0] += 1
+            else:
+                L.Warning('Failed to update account=%s resourceid=%s: %s', Account, ResourceId, Error, \
+                          Fields={'event': 'failed', 'service': Service, 'account': Account, 'resource_id': ResourceId, \
+                                  'error': Error})
+                Failed += 1
+                Counts[1] += 1
+                J.RecordRows(Rows, 'failed', ResourceId)
+                continue
+            J.RecordRows(Rows, 'succeeded', ResourceId)
+
+    return Succeeded, Failed
+
+def ReadRows(Reader, Completed):
+    """Yield (Rows, Row) for each row of Reader not completed by a previous run, where Rows is [(Number, Start, End)]
+
+    Reader yields (Start, End, Row) and rows are numbered in file order from RowCounter."""
+
+    global RowCounter, ResumeSkipCounter
+
+    for Start, End, Row in Reader:
+        RowCounter += 1
+
+        ### skip rows a previous run completed, without checking them again
+        if Start in Completed:
+            ResumeSkipCounter += 1
+            continue
+        yield [(RowCounter, Start, End)], Row
+
 
 
 #################################################
@@ -45,117 +248,415 @@ if __name__ == '__main__':
     parser.add_argument('--overwrite', nargs=1, required=False, metavar='yes|no', choices=['yes', 'no'], \
                         default=argparse.SUPPRESS, help='yes to overwrite existing tag, and no will not \
                         overwrite')
-    parser.add_argument('--tag', nargs=1, required=True, metavar='AwsTag=CsvTag', help='tag \
-                        formatted as AwsTag=CsvTag, where AwsTag is the tag name in AWS, and CsvTag \
-                        is the tag name in the csv file')
-    parser.add_argument('--csvfile', nargs=1, metavar='filename', type=argparse.FileType('r', encoding='UTF-8'), \
-                        required=True, help='data file in csv format')
-    # arg = ('param', ['value']) -> ('tag', ['Channel=hello'])
-    for arg in vars(parser.parse_args()).items():
+    parser.add_argument('--tag', nargs='+', action='extend', required=False, default=argparse.SUPPRESS, metavar='AwsTag=CsvTag', help='one \
+                        or more tags formatted as AwsTag=CsvTag, where AwsTag is the tag name in AWS, and \
+                        CsvTag is the tag name in the csv file')
+    parser.add_argument('--csvfile', nargs=1, metavar='filename', required=False, default=argparse.SUPPRESS, help='data file in csv format, UTF-8 encoded, \
+                        required unless --apply is given')
+    parser.add_argument('--plan', nargs=1, required=False, metavar='filename', default=argparse.SUPPRESS, \
+                        help='read current tags and write the diff of every row as json lines to filename, \
+                        without writing any tag')
+    parser.add_argument('--apply', nargs=1, metavar='filename', required=False, \
+                        default=argparse.SUPPRESS, help='write only the add and change tags of a plan file')
+    parser.add_argument('--workers', nargs=1, required=False, metavar='N', type=int, default=argparse.SUPPRESS, \
+                        help='number of worker threads, concurrency per service is capped separately')
+    parser.add_argument('--accounts', nargs='+', required=False, metavar='AccountId', default=argparse.SUPPRESS, \
+                        help='only update rows of these accounts, requires --role')
+    parser.add_argument('--role', nargs=1, required=False, metavar='RoleName', default=argparse.SUPPRESS, \
+                        help='role assumed in the account of each row, found from the account_id column or \
+                        the arn. Rows of unknown account use the ambient credentials')
+    parser.add_argument('--store', nargs=1, required=False, metavar='filename', default=argparse.SUPPRESS, \
+                        help='sqlite inventory database written by missing-tags.py, existing tags are read from \
+                        it when fresh and successful updates are written back')
+    parser.add_argument('--resume', action='store_true', required=False, default=argparse.SUPPRESS, \
+                        help='skip rows completed by a previous run of the same csv file and options, found in the journal')
+    parser.add_argument('--journal', nargs=1, required=False, metavar='filename', default=argparse.SUPPRESS, \
+                        help='progress journal, default is the csv file name with .journal appended')
+    parser.add_argument('--rejects', nargs=1, required=False, metavar='filename', default=argparse.SUPPRESS, \
+                        help='csv file of rows rejected before any api call with the reason, default is the csv file \
+                        name with .rejects appended')
+    parser.add_argument('--parsers', nargs=1, required=False, metavar='N', type=int, default=argparse.SUPPRESS, \
+                        help='number of processes that parse and validate the csv file ahead of the updates')
+    parser.add_argument('--coalesce', action='store_true', required=False, default=argparse.SUPPRESS, \
+                        help='load the whole csv file first, drop duplicate rows, merge the rows of each resource \
+                        into one update and order updates by account, region and service')
+    parser.add_argument('--log-level', nargs=1, required=False, metavar='LEVEL', choices=['DEBUG', 'INFO', 'WARNING'], \
+                        default=argparse.SUPPRESS, help='DEBUG, INFO or WARNING, default is INFO')
+    parser.add_argument('--console', nargs=1, required=False, metavar='all|quiet|progress', \
+                        choices=['all', 'quiet', 'progress'], default=argparse.SUPPRESS, help='all prints every \
+                        message, quiet prints warnings and the summary, progress also prints a progress line')
+    parser.add_argument('--log-json', nargs=1, required=False, metavar='filename', default=argparse.SUPPRESS, \
+                        help='also write the log as json lines to filename')
+    parser.add_argument('--max-accounts', nargs=1, required=False, metavar='N', type=int, default=argparse.SUPPRESS, \
+                        help='number of accounts updated at once')
+    parser.add_argument('--metrics-json', nargs=1, required=False, metavar='filename', default=argparse.SUPPRESS, \
+                        help='write call counts, latency histograms, payload sizes and error codes of every aws call \
+                        per service, operation and region as json')
+    parser.add_argument('--metrics-prom', nargs=1, required=False, metavar='filename', default=argparse.SUPPRESS, \
+                        help='write the aws call metrics as prometheus textfile, i.e. for the node exporter')
+    parser.add_argument('--profile', nargs=1, required=False, metavar='filename', default=argparse.SUPPRESS, \
+                        help='write wall and cpu time of each phase (startup, ingest, planning, reads, writes, \
+                        reporting) to filename, in a format that can be diffed between releases')
+    parser.add_argument('--profile-mode', nargs=1, required=False, metavar='phases|cprofile|sample', \
+                        choices=['phases', 'cprofile', 'sample'], default=argparse.SUPPRESS, help='phases only times \
+                        phases, cprofile also profiles every function of every thread to filename.pstats, sample \
+                        takes stack samples of every thread to filename.folded, default is phases')
+    parser.add_argument('--slowest', nargs=1, required=False, metavar='N', type=int, default=argparse.SUPPRESS, \
+                        help='number of operations listed in the summary by time spent, default is 5')
+    # arg = ('param', ['value']) -> ('tag', ['Channel=hello', 'Name=tag_name'])
+    TagMap = {} # AwsTagName: CsvTagName
+    reader = None
+    Args = vars(parser.parse_args())
+
+    ### check options that exclude each other once, before any file is opened
+    if 'apply' in Args and ('tag' in Args or 'csvfile' in Args or 'plan' in Args):
+        print('--apply writes the tags of the plan and cannot be used with --tag, --csvfile or --plan. See --help.')
+        sys.exit()
+    if 'apply' not in Args and ('tag' not in Args or 'csvfile' not in Args):
+        print('--tag and --csvfile are required unless --apply is given. See --help.')
+        sys.exit()
+
+    for arg in Args.items():
         if arg[0] == 'overwrite':
             Overwrite = True if arg[1][0] == 'yes' else False
         elif arg[0] == 'tag':
-            if arg[1][0].find('=') != -1: #Channel=tag_channel
-                AwsTagName, CsvTagName = arg[1][0].split('=')
-            else:
-                print('--tag value is invalid. See --help.')
-                sys.exit()
+            for Mapping in arg[1]:
+                if Mapping.find('=') != -1: #Channel=tag_channel
+                    AwsTagName, CsvTagName = Mapping.split('=')
+                    TagMap[AwsTagName] = CsvTagName
+                else:
+                    print('--tag value ' + Mapping + ' is invalid. See --help.')
+                    sys.exit()
         elif arg[0] == 'csvfile':
-            reader = arg[1][0] #read file stream
+            reader = arg[1][0] #read file name
+        elif arg[0] == 'workers':
+            Workers = max(1, arg[1][0])
+        elif arg[0] == 'accounts':
+            Accounts = arg[1]
+        elif arg[0] == 'role':
+            RoleName = arg[1][0]
+        elif arg[0] == 'parsers':
+            Parsers = max(0, arg[1][0])
+        elif arg[0] == 'coalesce':
+            Coalesce = arg[1]
+        elif arg[0] == 'log_level':
+            LogLevel = arg[1][0]
+        elif arg[0] == 'console':
+            Console = arg[1][0]
+        elif arg[0] == 'log_json':
+            LogJsonFileName = arg[1][0]
+        elif arg[0] == 'max_accounts':
+            MaxAccounts = max(1, arg[1][0])
+        elif arg[0] == 'metrics_json':
+            MetricsJsonFileName = arg[1][0]
+        elif arg[0] == 'metrics_prom':
+            MetricsPromFileName = arg[1][0]
+        elif arg[0] == 'slowest':
+            SlowestOperations = max(0, arg[1][0])
+        elif arg[0] == 'profile':
+            ProfileFileName = arg[1][0]
+        elif arg[0] == 'profile_mode':
+            ProfileMode = arg[1][0]
+        elif arg[0] == 'store':
+            OpenInventoryStore(arg[1][0])
+        elif arg[0] == 'resume':
+            Resume = arg[1]
+        elif arg[0] == 'journal':
+            JournalFileName = arg[1][0]
+        elif arg[0] == 'rejects':
+            RejectFileName = arg[1][0]
+        elif arg[0] == 'plan':
+            Mode = 'plan'
+            PlanFileName = arg[1][0]
+        elif arg[0] == 'apply':
+            Mode = 'apply'
+            reader = arg[1][0] #read plan file name
+
+    if Accounts != None and RoleName == None:
+        print('--accounts requires --role. See --help.')
+        sys.exit()
+    if RoleName != None:
+        ConfigureAccounts(RoleName=RoleName)
 
     ### initialize local variable
-    TagPropIndex = {CsvTagName: None, 'resource_id': None, 'service': None}
+    TagPropIndex = {'resource_id': None, 'service': None}
+    for CsvTagName in TagMap.values():
+        TagPropIndex[CsvTagName] = None
 
-    ### initialize logging: Level can be INFO or DEBUG
-    L = Log(Filename='tagging.log', Level='INFO')
+    ### initialize logging: Level can be INFO or DEBUG, records are written by a background thread
+    L = Log(Filename=LogFileName, Level=LogLevel, Console=Console, JsonFilename=LogJsonFileName)
+    Verbose = L.IsEnabled(logging.INFO)
+    if ProfileFileName != None:
+        StartProfiler(ProfileFileName, ProfileMode, Started)
 
     ### print starting divider
-    L.TeeLog('----------------------------------------------------------')
+    L.Summary('----------------------------------------------------------')
 
-    ### open csv file
+    ### open csv or plan file, rows are read with their byte offsets so the journal can locate them
     try:
-        CsvReader = csv.reader(reader)
+        reader = open(reader, 'rb')
+        CsvReader = iter(CsvOffsetReader(reader)) if Mode != 'apply' else iter([])
     except Exception as e:
-        L.TeeLog("Failed to open file:", e)
+        L.Warning('Failed to open file: %s', e)
         sys.exit()
 
-    ### get tag properties index in first row
+    ### get tag properties index in first row, account_id is optional, a plan file has no header
+    AccountIdx = None
+    DataStart = 0
     try:
-        for row in CsvReader:
+        for Start, DataStart, row in CsvReader:
             for K in TagPropIndex.keys():
                 TagPropIndex[K] = row.index(K)
+            if 'account_id' in row:
+                AccountIdx = row.index('account_id')
             break
     except Exception as e:
-        L.TeeLog('Failed to get index:', e)
+        L.Warning('Failed to get index: %s', e)
         sys.exit()
 
     ### counters
     RowCounter = 0
+    ResumeSkipCounter = 0
+
+    ### on resume seek past the rows completed without a gap, rows completed out of order are skipped by offset
+    ### the options are part of the journal, so i.e. a plan run does not complete the rows of a later run
+    J = Journal(JournalFileName if JournalFileName != None else reader.name + '.journal', \
+                Options='mode=' + Mode if Mode == 'apply' else 'mode=' + Mode + ' tags=' + \
+                ','.join(sorted([AwsTagName + '=' + CsvTagName for AwsTagName, CsvTagName in TagMap.items()])) + \
+                ' overwrite=' + str(Overwrite))
+    Completed = {}
+    Offset = DataStart
+    try:
+        if Resume:
+            Completed = J.Load(reader.name)
+            Offset, RowCounter = J.GetResumePoint(Completed, DataStart)
+            ResumeSkipCounter = RowCounter
+            L.Summary('Resume at byte offset %d after row %d, %d rows completed by previous runs', Offset, RowCounter, \
+                      len(Completed))
+        J.Open(reader.name, Resume)
+        Rejects = RejectWriter(RejectFileName if RejectFileName != None else reader.name + '.rejects', Resume)
+        Plan = PlanWriter(PlanFileName, Resume) if Mode == 'plan' else None
+    except Exception as e:
+        L.Warning('Failed to open journal: %s', e)
+        sys.exit()
+
+    ### csv rows are parsed and validated in chunks ahead of the main loop, a plan is read line by line
+    TagIdx = {AwsTagName: TagPropIndex[CsvTagName] for AwsTagName, CsvTagName in TagMap.items()}
+    if Mode == 'apply':
+        CsvReader = IteratePhase('ingest', ReadRows(PlanReader(reader, Offset=Offset), Completed))
+    else:
+        Ingest = CsvIngest(reader.name, (TagPropIndex['resource_id'], TagPropIndex['service'], AccountIdx, TagIdx), \
+                           Offset, Parsers)
+        CsvReader = IteratePhase('ingest', ReadRows(Ingest, Completed))
+
+    ### --coalesce plans the whole file before the first api call
+    Table = None
+    if Coalesce and Mode != 'apply':
+        try:
+            Table = RowTable(CsvReader)
+            with Phase('planning'):
+                CsvReader = iter(Table.Plan())
+        except Exception as e:
+            L.Warning('Failed to plan csv file: %s', e)
+            Ingest.Close()
+            sys.exit()
+        L.Summary('Planned %d rows into %d updates: %s', len(Table), Table.GetStats()['Updates'], Table.GetStats())
     UpdateSucceedCounter = 0
     UpdateFailedCounter = 0
     UpdateSkipCounter = 0
+    UpdateRejectCounter = 0
+
+    ### updates waiting to be sent with BulkUpdateTags
+    Pending = []
+
+    ### (Service, Id, Account, Region): ({TagName: TagValue}, Expires) of tags queued by earlier rows, kept until
+    ### every row checked before their flush is consumed, Expires is None while not flushed
+    Queued = {}
+
+    ### rows being checked by workers, consumed in csv order so counters and logs match the serial run
+    Pool = WorkerPool(Workers, MaxAccounts=MaxAccounts)
+    ConfigureClientPool(MaxPoolConnections=max(50, Workers))
+    InFlight = deque()
+    Window = Workers * 4
 
     ### continue to process csv file
     try:
-        TagIdx = TagPropIndex[CsvTagName]
-        ResourceIdx = TagPropIndex['resource_id']
-        ServiceIdx = TagPropIndex['service']
-
-        ### each row in csv
-        for row in CsvReader:
-            TagName = AwsTagName
-            TagValue = row[TagIdx]
-            ResourceId = row[ResourceIdx]
-            Service = GetB3ServiceName(row[ServiceIdx])
-
-            RowCounter += 1
-
-            L.TeeLog('Tag #' + str(RowCounter) + ': ResourceId=' + str(ResourceId) + ' TagName='\
-	                + str(TagName) + ' TagValue=' + str(TagValue) + ' Service=' \
-			+ GetServiceName(Service, ResourceId))
-
-            ### skip if tag value is Unknown or None
-            if TagValue.lower() == 'unknown' or TagValue.lower() == 'none':
-                L.TeeLog('Skip update since tag equals None or Unknown')
-                UpdateSkipCounter += 1
+        EndOfFile = False
+        while True:
+            ### read a block of rows until the window is full, current tags of a block are read in bulk
+            while not EndOfFile and len(InFlight) < Window:
+                Block = []
+                while len(Block) < PrefetchRows:
+                    Item = next(CsvReader, None)
+                    if Item == None:
+                        EndOfFile = True
+                        break
+                    Rows, row = Item
+                    Merged = ' (%d rows)' % len(Rows) if len(Rows) > 1 else ''
+
+                    ### parse the resource id once, every later call reuses the ResourceRef
+                    if Mode == 'apply':
+                        ResourceId = Parse(row['resource_id'])
+                        Service, Account = row['service'], GetRowAccount(row['account'], ResourceId)
+                        Tags = {TagName: Tag['desired'] for TagName, Tag in row['tags'].items()}
+                    else:
+                        ResourceId, Service, Account, Tags, Error = row
+
+                        ### rows the parsers rejected are logged in csv order and never sent to aws
+                        if Error != None:
+                            Rejected[Rows[0][1]] = Error
+                            Invalid = Future()
+                            Invalid.set_result((None, None, [('Reject row at byte offset ' + str(Rows[0][1]) + ': ' + \
+                                                              Error, 1)]))
+                            Block.append((('Tag #%d%s: ResourceId=%s rejected', Rows[0][0], Merged, ResourceId), Rows, \
+                                          Service, Account, ResourceId, None, Invalid))
+                            continue
+
+                        ResourceId = Parse(ResourceId)
+                        Account = GetRowAccount(Account, ResourceId)
+
+                    ### the header is formatted by the log thread, its service name is only looked up if INFO is written
+                    Header = ('Tag #%d%s: ResourceId=%s Tags=%s Service=%s Account=%s', Rows[0][0], Merged, ResourceId, \
+                              Tags, GetRowServiceName(Service, ResourceId) if Verbose else None, Account)
+
+                    ### skip rows of other accounts, queued like checked rows so logs stay in csv order
+                    if Accounts != None and Account not in Accounts:
+                        Skipped = Future()
+                        Skipped.set_result(({}, None, [('Skip update for ' + str(ResourceId) + ' since account ' + \
+                                                        str(Account) + ' is not in --accounts', 0)] if Verbose else []))
+                        Block.append((Header, Rows, Service, Account, ResourceId, None, Skipped))
+                        continue
+
+                    ### without --role every row uses the ambient credentials
+                    if RoleName == None:
+                        Account = None
+
+                    ### a plan is applied as planned, a row planned with an error runs again once it is replanned
+                    if Mode == 'apply':
+                        Planned = Future()
+                        Messages = [('Skip update since the plan could not read current tags: ' + row['error'], 1)] \
+                                   if 'error' in row else []
+                        Planned.set_result((row['tags'] if 'error' not in row else None, row['region'], Messages))
+                        Block.append((Header, Rows, Service, Account, ResourceId, None, Planned))
+                        continue
+
+                    Block.append((Header, Rows, Service, Account, ResourceId, Tags, None))
+
+                PrefetchBlock(Block, Pool)
+                for Header, Rows, Service, Account, ResourceId, Tags, Ready in Block:
+                    InFlight.append((Header, Rows, Service, Account, ResourceId, Ready if Ready != None else \
+                                     Pool.SubmitAccount(Account, Service, CheckRow, Service, ResourceId, Tags, Account)))
+
+            if len(InFlight) == 0:
+                break
+
+            ### log the oldest row and queue its update
+            Header, Rows, Service, Account, ResourceId, Check = InFlight.popleft()
+            Diff, Region, Messages = Check.result()
+            L.Info(*Header)
+            for Message in Messages:
+                L.TeeLog(*Message)
+            L.Progress('Rows=%d Successful=%d Skip=%d Failed=%d Rejected=%d', Rows[-1][0], UpdateSucceedCounter, \
+                       UpdateSkipCounter, UpdateFailedCounter, UpdateRejectCounter)
+
+            ### rejected rows cannot succeed until the csv is fixed, so they are not run again on resume
+            if Rows[0][1] in Rejected:
+                Rejects.Write(Rows, ResourceId, Service, Rejected.pop(Rows[0][1]))
+                UpdateRejectCounter += 1
+                J.RecordRows(Rows, 'rejected', ResourceId)
+                continue
+
+            ### rows skipped on a warning, i.e. tags could not be read with an expired token, run again on resume
+            Warned = len([Message for Message in Messages if Message[1] != 0]) > 0
+
+            ### earlier rows of the resource may have queued writes its check did not see, a plan is applied as planned
+            Key = (Service, ResourceId.Id, Account, Region)
+            if Diff != None and Mode != 'apply' and Key in Queued:
+                Diff = ReplanRow(Diff, Queued[Key][0])
+                for TagName, Tag in Diff.items() if Verbose else []:
+                    if Tag['action'] in ['skip-exists', 'unchanged']:
+                        L.Info('Skip tag %s for %s since an earlier row sets it to %s', TagName, ResourceId, Tag['current'])
+
+            ### plan writes the diff of every row and never writes tags
+            if Mode == 'plan':
+                Plan.Write(Rows, Service, Account, Region, ResourceId, Diff, Messages[-1][0] if Diff == None else None)
+                J.RecordRows(Rows, 'failed' if Warned else 'planned', ResourceId)
+                if Diff != None and len(GetWrites(Diff)) > 0:
+                    Queued[Key] = ({**Queued.get(Key, ({}, None))[0], **GetWrites(Diff)}, None)
                 continue
 
-            ### skip if Overwrite is False and tag already exists
-            try:
-                if not Overwrite and IsTagExists(Service, ResourceId, TagName):
-                    L.TeeLog('Skip update for ' + ResourceId + ' since tag ' + TagName + ' exists and Overwrite is ' \
-                             + str(Overwrite))
-                    UpdateSkipCounter += 1
-                    continue
-            except Exception as e:
-                L.TeeLog('Skip update since we cannot verify whether tag name ' + TagName + ' exists: ' + str(e), 1)
+            Tags = GetWrites(Diff) if Diff != None else {}
+            if len(Tags) == 0:
+                if Diff != None and len(Diff) > 0:
+                    L.Info('Skip update for %s since there are no tags to update', ResourceId)
                 UpdateSkipCounter += 1
+                J.RecordRows(Rows, 'failed' if Warned else 'skipped', ResourceId)
                 continue
 
-            ### update tag
-            try:
-                if UpdateTag(Service, ResourceId, TagName, TagValue):
-                    L.TeeLog('Successfully updated resourceid=' + ResourceId)
-                    UpdateSucceedCounter += 1
-                else:
-                    L.TeeLog('Failed to update resourceid=' + ResourceId)
-                    UpdateFailedCounter += 1
-            except Exception as e:
-                if str(e).find('OperationAborted') != -1 and Service == 's3':
-                    L.TeeLog('Encountered a known exception while trying to update s3 bucket tag that can typically be ignored and assumed successful on resourceid=' + ResourceId + ': ' + str(e))
-                    UpdateSucceedCounter += 1
-                else:
-                    L.TeeLog('Failed to update resourceid=' + ResourceId + ': ' + str(e))
-                    UpdateFailedCounter += 1
+            ### queue tag update and send a batch once enough rows are pending
+            Pending.append((Service, Region, Account, ResourceId, Tags, Rows))
+            if Mode != 'apply':
+                Queued[Key] = ({**Queued.get(Key, ({}, None))[0], **Tags}, None)
+            if len(Pending) >= BatchRows:
+                Succeeded, Failed = FlushUpdates(Pending, L, Pool, J)
+                UpdateSucceedCounter += Succeeded
+                UpdateFailedCounter += Failed
+                Pending = []
+
+                ### flushed tags are in the tag cache for rows checked from now on, rows already in flight still need them
+                Submitted = InFlight[-1][1][-1][0] if len(InFlight) > 0 else Rows[-1][0]
+                Queued = {Key: (Written, Expires if Expires != None else Submitted) for Key, (Written, Expires) \
+                          in Queued.items() if Expires == None or Expires > Rows[-1][0]}
+
+        ### send remaining updates
+        if len(Pending) > 0:
+            Succeeded, Failed = FlushUpdates(Pending, L, Pool, J)
+            UpdateSucceedCounter += Succeeded
+            UpdateFailedCounter += Failed
+            Pending = []
     except Exception as e:
-        L.TeeLog('Error processing csv file:', e)
+        L.Warning('Error processing csv file: %s', e)
     finally:
+        Pool.Shutdown()
+        if Ingest != None:
+            Ingest.Close()
+        J.Close()
+        Rejects.Close()
+        if Plan != None:
+            Plan.Close()
         reader.close()
 
     ### print summary
-    L.TeeLog('Summary: Total=' + str(RowCounter) + ' Successful=' + str(UpdateSucceedCounter) + ' Skip=' + \
-            str(UpdateSkipCounter) + ' Failed=' + str(UpdateFailedCounter) + ' Overwrite=' + str(Overwrite))
+    with Phase('reporting'):
+        L.Summary('Summary: Total=' + str(RowCounter) + ' Successful=' + str(UpdateSucceedCounter) + ' Skip=' + \
+                  str(UpdateSkipCounter) + ' Failed=' + str(UpdateFailedCounter) + ' Rejected=' + str(UpdateRejectCounter) + \
+                  ' Overwrite=' + str(Overwrite) + ' Resumed=' + str(ResumeSkipCounter))
+        L.Summary('Journal: ' + str(J.GetStats()))
+        if UpdateRejectCounter > 0:
+            L.Summary('Rejects: ' + Rejects.Filename + ' ' + str(Rejects.GetStats()))
+        if Ingest != None:
+            L.Summary('Ingest: ' + str(Ingest.GetStats()))
+        if Plan != None:
+            L.Summary('Plan: ' + PlanFileName + ' ' + str(Plan.GetStats()))
+        L.Summary('Client pool: ' + str(GetClientStats()))
+        L.Summary('Tag cache: ' + str(GetTagCacheStats()))
+        L.Summary('Throttling: ' + str(GetThrottleStats()))
+        L.Summary('Regions: ' + str(GetRegionStats()))
+        L.Summary('Inventory store: ' + str(GetInventoryStoreStats()))
+        L.Summary('Accounts: ' + str(GetAccountStats()) + ' Results=' + str(AccountResults))
+        Metrics = GetCallMetrics()
+        L.Summary('AWS calls: Calls=%d Errors=%d Seconds=%.3f', Metrics['Calls'], Metrics['Errors'], Metrics['Seconds'])
+        for Name, Stats in GetSlowestOperations(SlowestOperations):
+            L.Summary('  %s calls=%d retries=%d errors=%s total=%.3fs mean=%.3fs p95<=%.3fs max=%.3fs', Name, Stats['Calls'], \
+                      Stats['Retries'], Stats['Errors'], Stats['Seconds'], Stats['MeanSeconds'], Stats['P95Seconds'], \
+                      Stats['MaxSeconds'])
+        WriteCallMetrics(MetricsJsonFileName, MetricsPromFileName)
+    if ProfileFileName != None:
+        StopProfiler()
+        L.Summary('Profile: ' + ProfileFileName)
+    L.Close()
 
-else:
-    L.TeeLog('I\'m not a module.')
+elif __name__ != '__mp_main__':
+    ### csv parser processes started with spawn import this script as __mp_main__
+    print('I\'m not a module.')
     sys.exit()